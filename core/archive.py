@@ -0,0 +1,437 @@
+"""
+Append-only archive of cold blocks.
+
+Old blocks never change, but as rows they keep growing the database and the
+indexes every hot query goes through. The archiver packs the blocks of a chain
+below a height into an append-only segment file and then prunes their rows;
+Blockchain.archived_height records how far the archive reaches. Archived
+blocks always form the prefix 0..archived_height of the chain and the chain
+tip is never archived.
+
+Each chain has two files in LEDGER_ARCHIVE_DIR:
+
+- chain-<id>.dat, the segment: per block a BLOCK_RECORD followed by one
+  TRANSACTION_RECORD per transaction, each followed by the UTF-8 sender and
+  receiver addresses.
+- chain-<id>.idx, the index: one fixed-width INDEX_RECORD (offset, blockid,
+  length) per block, so the record of height h is at h * INDEX_RECORD.size.
+
+Readers map both files read-only and decode records straight out of the
+mapping through memoryview slices. Records past archived_height are left over
+from an archive run that failed before pruning and are truncated by the next
+run. Chain readers in core.utils serve archived heights as unsaved Block and
+Transaction instances, and find_archived_block looks a pruned block up by
+blockid for the block API; address history and inclusion proofs only cover
+blocks that are still in the database.
+"""
+
+import mmap
+import os
+import struct
+import threading
+from bisect import bisect_left
+from datetime import datetime, timedelta, timezone as dt_timezone
+
+from django.conf import settings
+from django.db import transaction as db_transaction
+from django.db.models import Prefetch
+from home.models import Block, Blockchain, Transaction
+
+# blockid, height, previous blockid (-1 for none), timestamp in microseconds
+# since the epoch, transaction_count, merkle_root, header_hash, stored transactions
+BLOCK_RECORD = struct.Struct('<QQqqI64s64sI')
+# txid, amount, timestamp in microseconds since the epoch, sender and receiver lengths
+TRANSACTION_RECORD = struct.Struct('<QqqHH')
+# offset of the block record in the segment, blockid, record length
+INDEX_RECORD = struct.Struct('<QQI')
+
+ARCHIVE_BATCH_SIZE = 500
+
+_EPOCH = datetime(1970, 1, 1, tzinfo=dt_timezone.utc)
+
+
+class ArchiveError(Exception):
+    """Raised when an archive does not match the chain it belongs to."""
+
+
+def _to_micros(value):
+    return (value - _EPOCH) // timedelta(microseconds=1)
+
+
+def _from_micros(value):
+    return _EPOCH + timedelta(microseconds=value)
+
+
+def encode_block(block, transactions):
+    """
+    Encodes a block and its transactions as one segment record.
+
+    Args:
+        block: Block instance
+        transactions: The block's transactions ordered by txid
+
+    Returns:
+        bytes: The record
+    """
+    parts = [BLOCK_RECORD.pack(
+        block.blockid,
+        block.height,
+        block.previous_id if block.previous_id is not None else -1,
+        _to_micros(block.transaction_timestamp),
+        block.transaction_count,
+        block.merkle_root.encode('ascii'),
+        block.header_hash.encode('ascii'),
+        len(transactions)
+    )]
+    for transaction in transactions:
+        sender = str(transaction.sendAddr).encode('utf-8')
+        receiver = str(transaction.receiveAddr).encode('utf-8')
+        parts.append(TRANSACTION_RECORD.pack(
+            transaction.txid,
+            transaction.amount,
+            _to_micros(transaction.transaction_timestamp),
+            len(sender),
+            len(receiver)
+        ))
+        parts.append(sender)
+        parts.append(receiver)
+    return b''.join(parts)
+
+
+def decode_block(record, chain_id=None):
+    """
+    Decodes a segment record into unsaved model instances.
+
+    Args:
+        record: Buffer holding exactly one block record (a memoryview slice
+            of the mapped segment is decoded without copying it)
+        chain_id: Id of the blockchain the block belongs to
+
+    Returns:
+        Block: The block, with its transactions in a transaction_list attribute
+    """
+    (blockid, height, previous, timestamp, transaction_count,
+     root, header_hash, stored) = BLOCK_RECORD.unpack_from(record)
+    block = Block(
+        blockid=blockid,
+        height=height,
+        previous_id=previous if previous >= 0 else None,
+        chain_id=chain_id,
+        transaction_timestamp=_from_micros(timestamp),
+        transaction_count=transaction_count,
+        merkle_root=root.decode('ascii'),
+        header_hash=header_hash.decode('ascii')
+    )
+    transactions = []
+    position = BLOCK_RECORD.size
+    for _ in range(stored):
+        txid, amount, timestamp, sender_length, receiver_length = (
+            TRANSACTION_RECORD.unpack_from(record, position))
+        position += TRANSACTION_RECORD.size
+        sender = str(record[position:position + sender_length], 'utf-8')
+        position += sender_length
+        receiver = str(record[position:position + receiver_length], 'utf-8')
+        position += receiver_length
+        transactions.append(Transaction(
+            txid=txid,
+            sendAddr=sender,
+            receiveAddr=receiver,
+            amount=amount,
+            transaction_timestamp=_from_micros(timestamp),
+            block_id=blockid
+        ))
+    block.transaction_list = transactions
+    return block
+
+
+class ChainArchive:
+    """Segment and index files of one chain."""
+
+    def __init__(self, chain_id, directory=None):
+        directory = str(directory or settings.LEDGER_ARCHIVE_DIR)
+        self.chain_id = chain_id
+        self.data_path = os.path.join(directory, 'chain-%d.dat' % chain_id)
+        self.index_path = os.path.join(directory, 'chain-%d.idx' % chain_id)
+        self._maps = []
+        self._data = None
+        self._index = None
+
+    def __len__(self):
+        """Number of blocks in the index, including any not yet committed."""
+        if self._index is not None:
+            return len(self._index) // INDEX_RECORD.size
+        try:
+            return os.path.getsize(self.index_path) // INDEX_RECORD.size
+        except FileNotFoundError:
+            return 0
+
+    def open(self):
+        """Maps the segment and index files read-only."""
+        self.close()
+        for path in (self.data_path, self.index_path):
+            with open(path, 'rb') as archive_file:
+                if os.fstat(archive_file.fileno()).st_size == 0:
+                    self._maps.append(None)
+                    continue
+                self._maps.append(mmap.mmap(archive_file.fileno(), 0, access=mmap.ACCESS_READ))
+        self._data, self._index = (
+            memoryview(mapped) if mapped is not None else memoryview(b'') for mapped in self._maps)
+        return self
+
+    def close(self):
+        """Releases the mappings."""
+        for view in (self._data, self._index):
+            if view is not None:
+                view.release()
+        for mapped in self._maps:
+            if mapped is not None:
+                mapped.close()
+        self._maps = []
+        self._data = None
+        self._index = None
+
+    def read_block(self, height):
+        """
+        Reads one archived block.
+
+        Args:
+            height: Height of the block
+
+        Returns:
+            Block: The block with its transaction_list
+        """
+        offset, _, length = INDEX_RECORD.unpack_from(self._index, height * INDEX_RECORD.size)
+        return decode_block(self._data[offset:offset + length], self.chain_id)
+
+    def blockid_at(self, height):
+        """Blockid of an archived height, read from the index alone."""
+        return INDEX_RECORD.unpack_from(self._index, height * INDEX_RECORD.size)[1]
+
+    def iter_blocks(self, start_height, end_height):
+        """
+        Iterates over archived blocks by height.
+
+        Args:
+            start_height: First height to read
+            end_height: Last height to read
+
+        Yields:
+            Block: Each block with its transaction_list, in height order
+        """
+        for height in range(start_height, end_height + 1):
+            yield self.read_block(height)
+
+    def truncate(self, count):
+        """
+        Drops index and segment records past the first count blocks.
+
+        Args:
+            count: Number of blocks to keep
+        """
+        self.close()
+        stored = len(self)
+        if stored < count:
+            raise ArchiveError('Archive of chain %d holds %d of %d archived blocks.' % (
+                self.chain_id, stored, count))
+        if stored == count:
+            return
+        with open(self.index_path, 'r+b') as index:
+            if count:
+                index.seek((count - 1) * INDEX_RECORD.size)
+                offset, _, length = INDEX_RECORD.unpack(index.read(INDEX_RECORD.size))
+                end = offset + length
+            else:
+                end = 0
+            index.truncate(count * INDEX_RECORD.size)
+        with open(self.data_path, 'r+b') as data:
+            data.truncate(end)
+
+    def append(self, blocks):
+        """
+        Appends blocks to the segment and index and flushes them to disk.
+
+        Args:
+            blocks: Blocks in height order, each with a transaction_list attribute
+        """
+        self.close()
+        os.makedirs(os.path.dirname(self.data_path), exist_ok=True)
+        with open(self.data_path, 'ab') as data, open(self.index_path, 'ab') as index:
+            offset = data.seek(0, os.SEEK_END)
+            if index.seek(0, os.SEEK_END) // INDEX_RECORD.size != blocks[0].height:
+                raise ArchiveError('Block %d does not follow the archive of chain %d.' % (
+                    blocks[0].height, self.chain_id))
+            for block in blocks:
+                record = encode_block(block, block.transaction_list)
+                data.write(record)
+                index.write(INDEX_RECORD.pack(offset, block.blockid, len(record)))
+                offset += len(record)
+            data.flush()
+            index.flush()
+            os.fsync(data.fileno())
+            os.fsync(index.fileno())
+
+
+_readers = {}
+_readers_lock = threading.Lock()
+
+
+def _reader(blockchain):
+    # Archives only grow, so a cached mapping is reused until it is too short.
+    needed = blockchain.archived_height + 1
+    key = (str(settings.LEDGER_ARCHIVE_DIR), blockchain.pk)
+    with _readers_lock:
+        archive = _readers.get(key)
+        if archive is None or len(archive) < needed:
+            # An outgrown mapping may still be read by another thread; it is
+            # unmapped once the last reference to it goes away.
+            archive = _readers[key] = ChainArchive(blockchain.pk).open()
+    if len(archive) < needed:
+        raise ArchiveError('Archive of chain %d is missing blocks.' % blockchain.pk)
+    return archive
+
+
+def read_archived_blocks(blockchain, start_height=None, end_height=None):
+    """
+    Reads the archived blocks of a chain that fall inside a height range.
+
+    Args:
+        blockchain: Blockchain instance
+        start_height: First height to include, None for the genesis block
+        end_height: Last height to include, None for the last archived block
+
+    Returns:
+        list: Blocks ordered by height, each with a transaction_list attribute;
+        empty when no archived block is in range
+    """
+    if blockchain.archived_height is None:
+        return []
+    start_height = max(start_height or 0, 0)
+    end_height = blockchain.archived_height if end_height is None else min(
+        end_height, blockchain.archived_height)
+    if end_height < start_height:
+        return []
+    return list(_reader(blockchain).iter_blocks(start_height, end_height))
+
+
+def iter_archived_blocks(blockchain, start_height=0):
+    """
+    Streams the archived blocks of a chain from a height on, one at a time.
+    """
+    if blockchain.archived_height is None or start_height > blockchain.archived_height:
+        return iter(())
+    return _reader(blockchain).iter_blocks(start_height, blockchain.archived_height)
+
+
+class _ArchiveBlockids:
+    """Sequence view of the archived blockids of a chain, for bisect."""
+
+    def __init__(self, archive, count):
+        self.archive = archive
+        self.count = count
+
+    def __len__(self):
+        return self.count
+
+    def __getitem__(self, height):
+        return self.archive.blockid_at(height)
+
+
+def find_archived_block(blockid):
+    """
+    Finds a block that was pruned from the database by its blockid.
+
+    Blockids grow with height along a chain, so each archived chain is
+    searched by bisecting its index.
+
+    Args:
+        blockid: Id of the block
+
+    Returns:
+        Block: The block with its transaction_list, or None if no archive holds it
+    """
+    blockchains = Blockchain.objects.filter(archived_height__isnull=False).order_by('pk')
+    for blockchain in blockchains:
+        archive = _reader(blockchain)
+        blockids = _ArchiveBlockids(archive, blockchain.archived_height + 1)
+        height = bisect_left(blockids, blockid)
+        if height < len(blockids) and blockids[height] == blockid:
+            return archive.read_block(height)
+    return None
+
+
+def archived_balance_deltas(blockchains=None, start_height=0, end_height=None):
+    """
+    Aggregates credits and debits per address over archived transactions.
+
+    Args:
+        blockchains: Blockchains to include, None for every chain
+        start_height: First height to include
+        end_height: Last height to include, None for the last archived block
+
+    Returns:
+        dict: Mapping address -> [credits, debits, None], like
+        core.balances.aggregate_balance_deltas
+    """
+    if blockchains is None:
+        blockchains = Blockchain.objects.filter(archived_height__isnull=False)
+    deltas = {}
+    for blockchain in blockchains:
+        if blockchain.archived_height is None:
+            continue
+        last = blockchain.archived_height if end_height is None else min(
+            end_height, blockchain.archived_height)
+        if last < start_height:
+            continue
+        for block in _reader(blockchain).iter_blocks(start_height, last):
+            for transaction in block.transaction_list:
+                deltas.setdefault(transaction.receiveAddr, [0, 0, None])[0] += transaction.amount
+                deltas.setdefault(transaction.sendAddr, [0, 0, None])[1] += transaction.amount
+    return deltas
+
+
+def archive_blocks(blockchain, below_height, batch_size=ARCHIVE_BATCH_SIZE):
+    """
+    Archives the blocks of a chain below a height and prunes their rows.
+
+    Args:
+        blockchain: Blockchain instance
+        below_height: Archive every block under this height; the chain tip is
+            always kept
+        batch_size: Blocks read from the database per query
+
+    Returns:
+        int: Number of newly archived blocks
+    """
+    blockchain = Blockchain.objects.select_related('latest').get(pk=blockchain.pk)
+    first = 0 if blockchain.archived_height is None else blockchain.archived_height + 1
+    last = min(below_height, blockchain.latest.height) - 1
+    if last < first:
+        return 0
+
+    archive = ChainArchive(blockchain.pk)
+    archive.truncate(first)
+    for start in range(first, last + 1, batch_size):
+        blocks = list(
+            Block.objects.filter(
+                chain=blockchain, height__gte=start, height__lte=min(start + batch_size - 1, last))
+            .prefetch_related(Prefetch(
+                'transaction_set',
+                queryset=Transaction.objects.order_by('txid'),
+                to_attr='transaction_list'
+            ))
+            .order_by('height')
+        )
+        if not blocks or [block.height for block in blocks] != list(range(start, start + len(blocks))):
+            raise ArchiveError('Chain %d has gaps below height %d.' % (blockchain.pk, last + 1))
+        archive.append(blocks)
+
+    with db_transaction.atomic():
+        # The segment is on disk; only now move the boundary and prune.
+        updated = Blockchain.objects.filter(
+            pk=blockchain.pk, archived_height=blockchain.archived_height
+        ).update(archived_height=last, genesis=None)
+        if updated != 1:
+            raise ArchiveError('Chain %d was archived concurrently.' % blockchain.pk)
+        Transaction.objects.filter(block__chain=blockchain, block__height__lte=last).delete()
+        Block.objects.filter(chain=blockchain, height__lte=last).delete()
+    return last - first + 1
@@ -0,0 +1,160 @@
+"""
+Background block assembly.
+
+Mining a large block inside a web request ties up a worker, and pending
+transactions otherwise wait until somebody clicks. With LEDGER_BACKGROUND_MINING
+enabled, web requests only enqueue a MiningJob and the run_block_assembler
+command mines. Each round it picks the mempools that are due: those with queued
+jobs, those holding at least LEDGER_ASSEMBLY_THRESHOLD pending transactions, and
+any non-empty mempool not assembled for LEDGER_ASSEMBLY_INTERVAL seconds.
+Different mempools are assembled in parallel on a thread pool; mining is safe
+to run concurrently, so several assembler processes may share a database.
+Jobs left running for LEDGER_ASSEMBLY_JOB_TIMEOUT seconds, for example by an
+assembler that was killed, are queued again.
+"""
+
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.db.models import Exists, OuterRef, Q
+from django.utils import timezone
+from home.models import Mempool, MiningJob
+from core.snapshots import extend_chain_snapshot
+from core.utils import bulk_mine_transactions, create_or_get_blockchain, mine_next_block
+
+
+def enqueue_mining(mempool, transaction_ids=None, max_size=None, priority=None):
+    """
+    Queues a mining request for the background assembler.
+
+    Args:
+        mempool: Mempool instance to mine from
+        transaction_ids: Explicit selection to mine, None for the next full block
+        max_size: Maximum block size for a full block, None for the default
+        priority: Mempool priority for a full block, None for the default
+
+    Returns:
+        MiningJob: The queued job
+    """
+    return MiningJob.objects.create(
+        mempool=mempool,
+        transaction_ids=transaction_ids,
+        max_size=max_size,
+        priority=priority or ''
+    )
+
+
+def due_mempools(last_assembled, threshold=None, interval=None, now=None):
+    """
+    Returns the ids of the mempools the assembler should mine this round.
+
+    Args:
+        last_assembled: Dict of mempool id to the monotonic time it was last assembled
+        threshold: Pending transactions that trigger a block, None for the setting
+        interval: Seconds after which any non-empty mempool is assembled, None for the setting
+        now: Current monotonic time, None for time.monotonic()
+
+    Returns:
+        list: Mempool ids, ordered by id
+    """
+    threshold = settings.LEDGER_ASSEMBLY_THRESHOLD if threshold is None else threshold
+    interval = settings.LEDGER_ASSEMBLY_INTERVAL if interval is None else interval
+    now = time.monotonic() if now is None else now
+
+    # The maintained pending count and an indexed probe for queued jobs keep
+    # this from joining every mempool to its transactions.
+    queued = MiningJob.objects.filter(mempool=OuterRef('pk'), status=MiningJob.PENDING)
+    mempools = Mempool.objects.annotate(jobs=Exists(queued)).filter(
+        Q(transaction_count__gt=0) | Q(jobs=True)
+    ).order_by('pk').values_list('pk', 'transaction_count', 'jobs')
+
+    due = []
+    for mempool_id, pending, jobs in mempools:
+        elapsed = now - last_assembled.get(mempool_id, float('-inf'))
+        if jobs or pending >= threshold or elapsed >= interval:
+            due.append(mempool_id)
+    return due
+
+
+def reclaim_stale_jobs(timeout=None, now=None):
+    """
+    Queues running jobs again whose assembler has not finished them in time.
+
+    Args:
+        timeout: Seconds a job may run, None for LEDGER_ASSEMBLY_JOB_TIMEOUT
+        now: Current time, None for timezone.now()
+
+    Returns:
+        int: Number of jobs queued again
+    """
+    timeout = settings.LEDGER_ASSEMBLY_JOB_TIMEOUT if timeout is None else timeout
+    now = timezone.now() if now is None else now
+    return MiningJob.objects.filter(
+        Q(started__lt=now - timedelta(seconds=timeout)) | Q(started__isnull=True),
+        status=MiningJob.RUNNING
+    ).update(status=MiningJob.PENDING, started=None)
+
+
+def _claim_jobs(mempool_id):
+    jobs = list(MiningJob.objects.filter(
+        mempool_id=mempool_id, status=MiningJob.PENDING).order_by('pk'))
+    claimed = []
+    for job in jobs:
+        # Another assembler process may be draining the same queue.
+        if MiningJob.objects.filter(pk=job.pk, status=MiningJob.PENDING).update(
+                status=MiningJob.RUNNING, started=timezone.now()):
+            claimed.append(job)
+    return claimed
+
+
+def _mine(blockchain, mempool, transaction_ids=None, max_size=None, priority=None):
+    if transaction_ids is not None:
+        result = bulk_mine_transactions(blockchain, transaction_ids)
+    else:
+        result = mine_next_block(blockchain, mempool, max_size=max_size, priority=priority)
+    if result is not None:
+        extend_chain_snapshot(blockchain, result.block)
+    return result
+
+
+def assemble_mempool(mempool_id):
+    """
+    Mines the queued jobs of one mempool, or its next full block if none are queued.
+
+    Args:
+        mempool_id: Id of the mempool to assemble
+
+    Returns:
+        list: Blocks mined in this call
+    """
+    mempool = Mempool.objects.filter(pk=mempool_id).first()
+    if mempool is None:
+        return []
+    blockchain, is_new = create_or_get_blockchain(mempool.user_name)
+
+    jobs = _claim_jobs(mempool_id)
+    if not jobs:
+        result = _mine(blockchain, mempool)
+        return [result.block] if result is not None else []
+
+    blocks = []
+    for job in jobs:
+        try:
+            result = _mine(
+                blockchain, mempool,
+                transaction_ids=job.transaction_ids,
+                max_size=job.max_size,
+                priority=job.priority or None
+            )
+        except Exception as error:
+            job.status = MiningJob.FAILED
+            job.error = str(error)
+        else:
+            job.status = MiningJob.DONE
+            if result is not None:
+                job.block = result.block
+                blocks.append(result.block)
+        job.finished = timezone.now()
+        job.save(update_fields=['status', 'error', 'block', 'finished'])
+    return blocks
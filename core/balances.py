@@ -0,0 +1,153 @@
+"""
+Materialized account balance index.
+
+Balances are derived from confirmed transactions only. The index is updated
+incrementally when a block is mined, with one aggregated delta per address,
+so reading a balance is a single primary-key lookup instead of a scan over
+every transaction of an address.
+"""
+
+from django.db import transaction as db_transaction
+from django.db.models import Max, Sum
+from home.models import AccountBalance, Transaction
+from core.archive import archived_balance_deltas
+
+
+def aggregate_balance_deltas(transactions):
+    """
+    Aggregates credits and debits per address over a set of transactions.
+
+    Args:
+        transactions: QuerySet of transactions to aggregate
+
+    Returns:
+        dict: Mapping address -> [credits, debits, last_block_id]
+    """
+    deltas = {}
+    for field, index in (('receiveAddr', 0), ('sendAddr', 1)):
+        rows = transactions.order_by().values(field).annotate(
+            total=Sum('amount'), last_block=Max('block'))
+        for row in rows:
+            delta = deltas.setdefault(row[field], [0, 0, None])
+            delta[index] += row['total'] or 0
+            if delta[2] is None or (row['last_block'] or 0) > delta[2]:
+                delta[2] = row['last_block']
+    return deltas
+
+
+def apply_block_to_balances(block):
+    """
+    Applies the transactions of a freshly mined block to the balance index.
+
+    Must run inside the atomic unit that mined the block. Issues a constant
+    number of statements no matter how many transactions or addresses the
+    block touches.
+
+    Args:
+        block: Block whose transactions were just confirmed
+
+    Returns:
+        int: Number of addresses whose balance changed
+    """
+    deltas = aggregate_balance_deltas(Transaction.objects.filter(block=block))
+    if not deltas:
+        return 0
+
+    # Row locks serialize miners of different chains touching the same
+    # addresses; backends without them (SQLite) serialize writers anyway.
+    existing = AccountBalance.objects.select_for_update().in_bulk(list(deltas))
+    created = []
+    for address, (credits, debits, _) in deltas.items():
+        balance = existing.get(address)
+        if balance is None:
+            balance = AccountBalance(address=address)
+            created.append(balance)
+        balance.credits += credits
+        balance.debits += debits
+        balance.net = balance.credits - balance.debits
+        balance.last_block = block
+
+    if existing:
+        AccountBalance.objects.bulk_update(
+            existing.values(), ['credits', 'debits', 'net', 'last_block'], batch_size=500)
+    if created:
+        AccountBalance.objects.bulk_create(created, batch_size=500)
+    return len(deltas)
+
+
+def get_balance(address):
+    """
+    Returns the indexed balance of an address.
+
+    Args:
+        address: Address (username) to look up
+
+    Returns:
+        AccountBalance: Indexed balance, or an unsaved zero balance for unknown addresses
+    """
+    balance = AccountBalance.objects.filter(pk=address).first()
+    return balance if balance is not None else AccountBalance(address=address)
+
+
+def recompute_balances():
+    """
+    Recomputes every balance from the confirmed transactions, archived ones included.
+
+    Returns:
+        dict: Mapping address -> [credits, debits, last_block_id]
+    """
+    deltas = aggregate_balance_deltas(Transaction.objects.filter(block__isnull=False))
+    for address, (credits, debits, _) in archived_balance_deltas().items():
+        delta = deltas.setdefault(address, [0, 0, None])
+        delta[0] += credits
+        delta[1] += debits
+    return deltas
+
+
+def verify_balance_index():
+    """
+    Compares the balance index against a full recomputation.
+
+    Returns:
+        list: One dict per mismatching address with the expected and indexed
+        (credits, debits, net) triples; empty when the index is consistent
+    """
+    expected = {
+        address: (credits, debits, credits - debits)
+        for address, (credits, debits, _) in recompute_balances().items()
+    }
+    indexed = {
+        row[0]: tuple(row[1:])
+        for row in AccountBalance.objects.values_list('address', 'credits', 'debits', 'net')
+    }
+
+    mismatches = []
+    for address in sorted(set(expected) | set(indexed)):
+        want = expected.get(address, (0, 0, 0))
+        have = indexed.get(address, (0, 0, 0))
+        if want != have:
+            mismatches.append({'address': address, 'expected': want, 'indexed': have})
+    return mismatches
+
+
+def rebuild_balance_index():
+    """
+    Replaces the balance index with a full recomputation.
+
+    Returns:
+        int: Number of indexed addresses
+    """
+    balances = [
+        AccountBalance(
+            address=address,
+            credits=credits,
+            debits=debits,
+            net=credits - debits,
+            last_block_id=last_block
+        )
+        for address, (credits, debits, last_block) in recompute_balances().items()
+    ]
+    with db_transaction.atomic():
+        AccountBalance.objects.all().delete()
+        AccountBalance.objects.bulk_create(balances, batch_size=500)
+    return len(balances)
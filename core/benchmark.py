@@ -0,0 +1,143 @@
+"""
+Micro-benchmarks for the core.utils hot paths.
+
+Synthetic users, mempools and chains are generated at a configurable scale
+and every operation is measured for wall time, number of SQL queries and peak
+Python memory. Results are plain dictionaries so they can be dumped as JSON
+and diffed between versions. The benchmarks write to whatever database is
+active; the benchmark_ledger command runs them on a throwaway SQLite database.
+"""
+
+import platform
+import sqlite3
+import time
+import tracemalloc
+from contextlib import contextmanager
+
+import django
+from django.db import connection
+from django.test import override_settings
+from home.models import AccountBalance, Mempool
+from core.utils import (
+    build_blockchain_list,
+    bulk_mine_transactions,
+    create_or_get_blockchain,
+    create_pending_transaction,
+    create_pending_transactions,
+    get_mempool_transactions
+)
+
+
+class _QueryCounter:
+    """Database execute wrapper that counts queries without recording them."""
+
+    def __init__(self):
+        self.count = 0
+
+    def __call__(self, execute, sql, params, many, context):
+        self.count += 1
+        return execute(sql, params, many, context)
+
+
+@contextmanager
+def measure(operation, results, **scale):
+    """
+    Measures wall time, SQL queries and peak memory of the enclosed block.
+
+    Args:
+        operation: Name of the measured operation
+        results: List the measurement dictionary is appended to
+        **scale: Scale parameters recorded with the measurement
+    """
+    counter = _QueryCounter()
+    tracemalloc.start()
+    started = time.perf_counter()
+    try:
+        with connection.execute_wrapper(counter):
+            yield
+    finally:
+        wall_time = time.perf_counter() - started
+        _, peak_memory = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+    results.append({
+        'operation': operation,
+        'scale': scale,
+        'wall_time': wall_time,
+        'queries': counter.count,
+        'peak_memory': peak_memory,
+    })
+
+
+def environment():
+    """
+    Describes the environment the benchmarks ran in.
+
+    Returns:
+        dict: Python, Django and SQLite versions
+    """
+    return {
+        'python': platform.python_version(),
+        'django': django.get_version(),
+        'sqlite': sqlite3.sqlite_version,
+    }
+
+
+@override_settings(LEDGER_MEMPOOL_CAPACITY=None)
+def run_benchmarks(users=10, mempool_size=1000, chain_length=100, transactions_per_block=50):
+    """
+    Generates synthetic data and measures the core.utils hot paths.
+
+    Mempools are unbounded while benchmarking, so every mempool holds the
+    requested number of transactions whatever LEDGER_MEMPOOL_CAPACITY is.
+
+    Args:
+        users: Number of synthetic users (and miners)
+        mempool_size: Pending transactions per measured mempool
+        chain_length: Blocks in the measured chain, excluding the genesis block
+        transactions_per_block: Transactions in each mined block
+
+    Returns:
+        list: One measurement dictionary per operation
+    """
+    results = []
+    names = ['bench-user-%d' % index for index in range(users)]
+    mempools = [Mempool.objects.create(user_name=name) for name in names]
+    # Fund the synthetic senders so that block validation accepts everything.
+    AccountBalance.objects.bulk_create([
+        AccountBalance(address=name, credits=10 ** 15, net=10 ** 15) for name in names
+    ])
+    miner = mempools[0]
+
+    def entries(count):
+        return [
+            (names[index % users], index % 100 + 1, miner)
+            for index in range(count)
+        ]
+
+    with measure('create_pending_transaction', results, transactions=mempool_size):
+        for index in range(mempool_size):
+            create_pending_transaction(
+                names[index % users], names[(index + 1) % users], index % 100 + 1, miner)
+
+    with measure('create_pending_transactions', results, transactions=mempool_size):
+        create_pending_transactions(names[1 % users], entries(mempool_size))
+
+    with measure('get_mempool_transactions', results, transactions=2 * mempool_size):
+        list(get_mempool_transactions(miner.user_name))
+
+    blockchain, _ = create_or_get_blockchain(miner.user_name)
+    tx_ids = list(get_mempool_transactions(miner.user_name, priority='age')
+                  .values_list('txid', flat=True)[:transactions_per_block])
+    with measure('mine_transactions_to_block', results, transactions=transactions_per_block):
+        bulk_mine_transactions(blockchain, tx_ids)
+
+    for _ in range(chain_length - 1):
+        bulk_mine_transactions(
+            blockchain,
+            create_pending_transactions(names[0], entries(transactions_per_block)).txids
+        )
+    with measure('build_blockchain_list', results, blocks=chain_length + 1,
+                 transactions_per_block=transactions_per_block):
+        build_blockchain_list(blockchain)
+
+    return results
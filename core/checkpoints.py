@@ -0,0 +1,143 @@
+"""
+Periodic state checkpoints of a chain.
+
+The state of a chain at height h is the credits and debits of every address
+over the transactions confirmed in blocks 1..h of that chain. Every
+LEDGER_CHECKPOINT_INTERVAL blocks the state is stored as a zlib-compressed
+JSON checkpoint, so reconstructing any height loads the nearest checkpoint at
+or below it and aggregates only the blocks after it, instead of replaying the
+chain from its genesis block. New checkpoints are built the same way, from
+the previous checkpoint plus one interval of blocks.
+"""
+
+import json
+import zlib
+
+from django.conf import settings
+from home.models import Block, LedgerCheckpoint, Transaction
+from core.archive import archived_balance_deltas
+from core.balances import aggregate_balance_deltas
+
+
+def encode_state(state):
+    """
+    Compresses an address state mapping for storage.
+
+    Args:
+        state: Mapping address -> [credits, debits]
+
+    Returns:
+        bytes: The compressed state
+    """
+    return zlib.compress(json.dumps(state, sort_keys=True, separators=(',', ':')).encode())
+
+
+def decode_state(data):
+    """
+    Decompresses a stored address state mapping.
+    """
+    return json.loads(zlib.decompress(bytes(data)).decode())
+
+
+def get_checkpoint(blockchain, height=None):
+    """
+    Returns the nearest checkpoint of a chain at or below a height.
+
+    Args:
+        blockchain: Blockchain instance
+        height: Height to look up, None for the newest checkpoint
+
+    Returns:
+        LedgerCheckpoint: The checkpoint, or None if there is none
+    """
+    checkpoints = LedgerCheckpoint.objects.filter(chain=blockchain)
+    if height is not None:
+        checkpoints = checkpoints.filter(height__lte=height)
+    return checkpoints.order_by('-height').first()
+
+
+def _state_at(blockchain, height, checkpoint):
+    if checkpoint is None:
+        start_height, state = 0, {}
+    else:
+        start_height, state = checkpoint.height, decode_state(checkpoint.state)
+    # Blocks below the archive boundary are replayed from the archive
+    archived = archived_balance_deltas([blockchain], start_height + 1, height)
+    deltas = aggregate_balance_deltas(Transaction.objects.filter(
+        block__chain=blockchain,
+        block__height__gt=start_height,
+        block__height__lte=height
+    ))
+    for part in (archived, deltas):
+        for address, (credits, debits, _) in part.items():
+            current = state.setdefault(address, [0, 0])
+            current[0] += credits
+            current[1] += debits
+    return start_height, state
+
+
+def reconstruct_state(blockchain, height):
+    """
+    Reconstructs the per-address state of a chain at a height.
+
+    Args:
+        blockchain: Blockchain instance
+        height: Height to reconstruct, at most the chain's latest height
+
+    Returns:
+        dict: The height, the checkpoint height replay started from, the number
+        of replayed blocks and the balances as address -> {credits, debits, net}
+    """
+    start_height, state = _state_at(blockchain, height, get_checkpoint(blockchain, height))
+    return {
+        'height': height,
+        'checkpoint_height': start_height,
+        'replayed_blocks': height - start_height,
+        'balances': {
+            address: {'credits': credits, 'debits': debits, 'net': credits - debits}
+            for address, (credits, debits) in sorted(state.items())
+        },
+    }
+
+
+def create_checkpoint(blockchain, height):
+    """
+    Stores a checkpoint of a chain at a height, replacing an existing one.
+
+    Args:
+        blockchain: Blockchain instance
+        height: Height to checkpoint
+
+    Returns:
+        LedgerCheckpoint: The stored checkpoint
+    """
+    # Build from the previous checkpoint, so an existing one is recomputed.
+    previous = get_checkpoint(blockchain, height - 1) if height else None
+    start_height, state = _state_at(blockchain, height, previous)
+    checkpoint, _ = LedgerCheckpoint.objects.update_or_create(
+        chain=blockchain,
+        height=height,
+        defaults={
+            'block': Block.objects.filter(chain=blockchain, height=height).first(),
+            'state': encode_state(state),
+            'address_count': len(state),
+        }
+    )
+    return checkpoint
+
+
+def checkpoint_if_due(blockchain, block):
+    """
+    Stores a checkpoint when a freshly mined block lands on the interval.
+
+    Args:
+        blockchain: Blockchain the block was mined on
+        block: The new block
+
+    Returns:
+        LedgerCheckpoint: The new checkpoint, or None if none was due
+    """
+    interval = settings.LEDGER_CHECKPOINT_INTERVAL
+    if not interval or block.height % interval:
+        return None
+    return create_checkpoint(blockchain, block.height)
@@ -0,0 +1,49 @@
+"""
+Database connection tuning and SQLite replica refresh.
+"""
+
+import sqlite3
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, connections
+
+
+def configure_sqlite(sender, connection, **kwargs):
+    """
+    Configures new SQLite connections for concurrent workers.
+
+    Enables write-ahead logging so readers do not block the writer, and a busy
+    timeout so concurrent writers wait for the write lock instead of failing
+    with "database is locked". Connected to the connection_created signal.
+    """
+    if connection.vendor != 'sqlite':
+        return
+    with connection.cursor() as cursor:
+        if settings.LEDGER_SQLITE_WAL:
+            cursor.execute('PRAGMA journal_mode=WAL')
+            cursor.execute('PRAGMA synchronous=NORMAL')
+        cursor.execute('PRAGMA busy_timeout=%d' % settings.LEDGER_SQLITE_BUSY_TIMEOUT_MS)
+
+
+def sync_sqlite_replica(alias):
+    """
+    Refreshes a SQLite read replica with a consistent copy of the primary.
+
+    Uses SQLite's online backup API, so the primary keeps serving reads and
+    writes while it is copied.
+
+    Args:
+        alias: Database alias of the replica
+    """
+    source = connections[DEFAULT_DB_ALIAS]
+    replica = connections[alias]
+    if source.vendor != 'sqlite' or replica.vendor != 'sqlite':
+        raise ValueError('Only SQLite replicas can be synced from a SQLite primary.')
+    source.ensure_connection()
+    # Open replica connections of this process would keep reading old pages.
+    replica.close()
+    target = sqlite3.connect(str(replica.settings_dict['NAME']))
+    try:
+        source.connection.backup(target)
+    finally:
+        target.close()
@@ -0,0 +1,73 @@
+"""
+Load-aware miner directory.
+
+The directory lists every miner's mempool with its number of pending
+transactions (Mempool.transaction_count, kept up to date as transactions are
+added, deleted and mined), least loaded first. It is read with one indexed
+query and cached for LEDGER_DIRECTORY_TIMEOUT seconds in Django's cache
+framework, so the wallet page and the transaction APIs do not scan the miner
+tables on every request.
+
+"Pick for me" routing samples two miners from the directory and sends the
+transaction to the less loaded one. Because the cached counts lag behind,
+always taking the single least loaded miner would send every sender to the
+same mempool until the cache expires; two random choices spread the load
+while still favoring idle miners.
+"""
+
+import random
+
+from django.conf import settings
+from django.core.cache import caches
+from home.models import Mempool
+
+DIRECTORY_KEY = 'ledger:miner-directory'
+AUTO_MINER = 'auto'
+
+
+def _cache():
+    return caches[settings.LEDGER_CHAIN_CACHE_ALIAS]
+
+
+def get_miner_directory():
+    """
+    Returns the miner directory, least loaded first.
+
+    Returns:
+        list: (user_name, mempool_id, transaction_count) tuples, one per miner
+    """
+    directory = _cache().get(DIRECTORY_KEY)
+    if directory is None:
+        directory = []
+        seen = set()
+        rows = Mempool.objects.order_by('transaction_count', 'pk').values_list(
+            'user_name', 'pk', 'transaction_count')
+        for user_name, mempool_id, transaction_count in rows:
+            # Transactions for a miner go to its oldest mempool.
+            if user_name not in seen:
+                seen.add(user_name)
+                directory.append((user_name, mempool_id, transaction_count))
+        _cache().set(DIRECTORY_KEY, directory, settings.LEDGER_DIRECTORY_TIMEOUT)
+    return directory
+
+
+def invalidate_miner_directory():
+    """
+    Drops the cached directory, for example after a miner signs up.
+    """
+    _cache().delete(DIRECTORY_KEY)
+
+
+def pick_miner():
+    """
+    Picks the miner for a new transaction by the power of two choices.
+
+    Returns:
+        str: User name of the less loaded of two randomly sampled miners, None
+        when there are no miners
+    """
+    directory = get_miner_directory()
+    if not directory:
+        return None
+    candidates = random.sample(directory, min(2, len(directory)))
+    return min(candidates, key=lambda entry: entry[2])[0]
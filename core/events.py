@@ -0,0 +1,214 @@
+"""
+Ledger event feed for server-sent events.
+
+Writers append mempool and block events to the LedgerEvent table inside the
+same atomic unit as the change they describe, so an event exists exactly
+when its change was committed, and every worker process sees it. Readers
+subscribe to an in-process EventHub: one poller task per event loop reads new
+events from the table and fans them out to every subscriber, so N open
+streams cost one database poller instead of N. Event ids are the table's
+primary keys, which lets a client resume from its Last-Event-ID. The table
+keeps the last LEDGER_EVENT_RETENTION events; run_block_assembler prunes the
+rest every round.
+
+The stream is served by an async view and needs the ASGI application in
+first_project/asgi.py.
+"""
+
+import asyncio
+import json
+import weakref
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from home.models import LedgerEvent
+
+EVENT_MEMPOOL_ADD = 'mempool_add'
+EVENT_MEMPOOL_REMOVE = 'mempool_remove'
+EVENT_BLOCK = 'block'
+
+EVENT_BATCH_SIZE = 500
+
+
+def publish_event(kind, payload):
+    """
+    Appends an event to the ledger feed.
+
+    Args:
+        kind: Event kind, one of the EVENT_* constants
+        payload: JSON-compatible event data
+
+    Returns:
+        LedgerEvent: The stored event
+    """
+    return LedgerEvent.objects.create(kind=kind, payload=payload)
+
+
+def publish_events(events):
+    """
+    Appends several events to the ledger feed with one bulk insert.
+
+    Args:
+        events: Iterable of (kind, payload) tuples
+    """
+    LedgerEvent.objects.bulk_create(
+        [LedgerEvent(kind=kind, payload=payload) for kind, payload in events],
+        batch_size=EVENT_BATCH_SIZE
+    )
+
+
+def events_since(last_id, limit=EVENT_BATCH_SIZE):
+    """
+    Reads the events that follow a given event id.
+
+    Args:
+        last_id: Id of the last event already seen
+        limit: Maximum number of events to return
+
+    Returns:
+        list: Events ordered by id
+    """
+    return list(LedgerEvent.objects.filter(id__gt=last_id).order_by('id')[:limit])
+
+
+def latest_event_id():
+    """
+    Returns the id of the newest event, 0 when the feed is empty.
+    """
+    return LedgerEvent.objects.order_by('-id').values_list('id', flat=True).first() or 0
+
+
+def prune_events(keep_last):
+    """
+    Deletes all but the newest events of the feed.
+
+    Args:
+        keep_last: Number of most recent events to keep
+
+    Returns:
+        int: Number of deleted events
+    """
+    cutoff = latest_event_id() - keep_last
+    if cutoff <= 0:
+        return 0
+    deleted, _ = LedgerEvent.objects.filter(id__lte=cutoff).delete()
+    return deleted
+
+
+def format_sse(event):
+    """
+    Formats an event as a server-sent event message.
+
+    Args:
+        event: LedgerEvent instance, or None for a keepalive comment
+
+    Returns:
+        str: The encoded message
+    """
+    if event is None:
+        return ': keepalive\n\n'
+    return 'id: %d\nevent: %s\ndata: %s\n\n' % (event.id, event.kind, json.dumps(event.payload))
+
+
+class EventHub:
+    """Fans events out from a single database poller to many subscribers."""
+
+    def __init__(self):
+        self._subscribers = set()
+        self._poller = None
+        self._last_id = None
+
+    async def subscribe(self, last_event_id=None):
+        """
+        Streams events to one subscriber.
+
+        Args:
+            last_event_id: Resume after this event id, None for live events only
+
+        Yields:
+            LedgerEvent: The next event, or None as a keepalive when idle
+        """
+        queue = asyncio.Queue(maxsize=settings.LEDGER_EVENT_QUEUE_SIZE)
+        self._subscribers.add(queue)
+        if self._poller is None:
+            # A new poller starts where a resuming subscriber left off, so
+            # events committed while its backlog is read are not skipped.
+            self._last_id = last_event_id
+            self._poller = asyncio.ensure_future(self._poll())
+        try:
+            sent_id = -1
+            if last_event_id is not None:
+                sent_id = last_event_id
+                while True:
+                    backlog = await sync_to_async(events_since)(sent_id)
+                    for event in backlog:
+                        sent_id = event.id
+                        yield event
+                    if len(backlog) < EVENT_BATCH_SIZE:
+                        break
+
+            while True:
+                try:
+                    event = await asyncio.wait_for(queue.get(), settings.LEDGER_EVENT_KEEPALIVE)
+                except asyncio.TimeoutError:
+                    yield None
+                    continue
+                if event is None:
+                    # The subscriber fell behind and was dropped; the client
+                    # reconnects and resumes from its last event id.
+                    return
+                if event.id > sent_id:
+                    sent_id = event.id
+                    yield event
+        finally:
+            self._subscribers.discard(queue)
+            if not self._subscribers and self._poller is not None:
+                # Forget the poller right away so that a subscriber arriving
+                # before the cancelled task has finished starts a new one.
+                self._poller.cancel()
+                self._poller = None
+                self._last_id = None
+
+    async def _poll(self):
+        try:
+            if self._last_id is None:
+                self._last_id = await sync_to_async(latest_event_id)()
+            while self._subscribers:
+                events = await sync_to_async(events_since)(self._last_id)
+                for event in events:
+                    self._fan_out(event)
+                if events:
+                    self._last_id = events[-1].id
+                if len(events) < EVENT_BATCH_SIZE:
+                    await asyncio.sleep(settings.LEDGER_EVENT_POLL_INTERVAL)
+        finally:
+            if self._poller is asyncio.current_task():
+                self._poller = None
+                self._last_id = None
+
+    def _fan_out(self, event):
+        for queue in list(self._subscribers):
+            try:
+                queue.put_nowait(event)
+            except asyncio.QueueFull:
+                self._subscribers.discard(queue)
+                while not queue.empty():
+                    queue.get_nowait()
+                queue.put_nowait(None)
+
+
+_hubs = weakref.WeakKeyDictionary()
+
+
+def get_event_hub():
+    """
+    Returns the event hub of the running event loop.
+
+    Under ASGI all requests share one loop and therefore one hub and one
+    poller per process.
+    """
+    loop = asyncio.get_running_loop()
+    hub = _hubs.get(loop)
+    if hub is None:
+        hub = _hubs[loop] = EventHub()
+    return hub
@@ -0,0 +1,131 @@
+"""
+Streaming ledger export.
+
+Blocks are read in chain order from their stored payloads, a bounded number
+of blocks per query, so memory use does not depend on the size of the ledger
+and no transaction rows are loaded or re-serialized. Archived blocks are
+streamed from the chain's archive first. Every exporter is a generator of
+text chunks suitable for StreamingHttpResponse or for writing to a file.
+"""
+
+import csv
+import json
+
+from core.utils import iter_serialized_blocks
+
+EXPORT_FORMATS = ('jsonl', 'csv')
+EXPORT_CONTENT_TYPES = {
+    'jsonl': 'application/x-ndjson',
+    'csv': 'text/csv',
+}
+EXPORT_CHUNK_SIZE = 500
+
+CSV_COLUMNS = [
+    'chain', 'height', 'blockid', 'block_timestamp',
+    'txid', 'sendAddr', 'receiveAddr', 'amount', 'transaction_timestamp',
+]
+
+
+def iter_chain_records(blockchain, start_height=0, chunk_size=EXPORT_CHUNK_SIZE):
+    """
+    Iterates over the blocks of a blockchain and their transactions in chain order.
+
+    Args:
+        blockchain: Blockchain instance to export
+        start_height: First block height to include, for resuming an export
+        chunk_size: Number of blocks fetched per round trip
+
+    Yields:
+        tuple: (block, None) for each block, followed by (block, transaction)
+        for each of its transactions ordered by txid, as serialized
+        dictionaries; block dictionaries have no transactions key
+    """
+    for serialized in iter_serialized_blocks(blockchain, start_height, chunk_size):
+        transactions = serialized.pop('transactions')
+        yield serialized, None
+        for transaction in transactions:
+            yield serialized, transaction
+
+
+def iter_jsonl(blockchains, start_height=0):
+    """
+    Exports blockchains as JSON lines, one block or transaction record per line.
+
+    Args:
+        blockchains: Iterable of Blockchain instances
+        start_height: First block height to include in each chain
+
+    Yields:
+        str: One JSON document per line
+    """
+    for blockchain in blockchains:
+        for block, transaction in iter_chain_records(blockchain, start_height):
+            if transaction is None:
+                record = {'type': 'block', 'chain': str(blockchain.user)}
+                record.update(block)
+            else:
+                record = {'type': 'transaction', 'blockid': block['blockid']}
+                record.update(transaction)
+            yield json.dumps(record) + '\n'
+
+
+class _Echo:
+    """File-like object whose write returns the value instead of buffering it."""
+
+    def write(self, value):
+        return value
+
+
+def iter_csv(blockchains, start_height=0):
+    """
+    Exports blockchains as CSV with one row per transaction.
+
+    Blocks without transactions are exported as a single row with empty
+    transaction columns so every height appears in the export.
+
+    Args:
+        blockchains: Iterable of Blockchain instances
+        start_height: First block height to include in each chain
+
+    Yields:
+        str: CSV formatted rows, starting with the header row
+    """
+    writer = csv.writer(_Echo())
+    yield writer.writerow(CSV_COLUMNS)
+    for blockchain in blockchains:
+        empty_block = None
+        for block, transaction in iter_chain_records(blockchain, start_height):
+            block_columns = [
+                str(blockchain.user), block['height'], block['blockid'],
+                block['transaction_timestamp'],
+            ]
+            if transaction is None:
+                if empty_block is not None:
+                    yield writer.writerow(empty_block + [''] * 5)
+                empty_block = block_columns
+                continue
+            empty_block = None
+            yield writer.writerow(block_columns + [
+                transaction['txid'], transaction['sendAddr'], transaction['receiveAddr'],
+                transaction['amount'], transaction['transaction_timestamp'],
+            ])
+        if empty_block is not None:
+            yield writer.writerow(empty_block + [''] * 5)
+
+
+def export_ledger(blockchains, export_format='jsonl', start_height=0):
+    """
+    Streams an export of the given blockchains in the requested format.
+
+    Args:
+        blockchains: Iterable of Blockchain instances
+        export_format: One of EXPORT_FORMATS
+        start_height: First block height to include in each chain
+
+    Returns:
+        generator: Text chunks of the export
+    """
+    if export_format not in EXPORT_FORMATS:
+        raise ValueError('Unsupported export format: %s' % export_format)
+    exporter = iter_jsonl if export_format == 'jsonl' else iter_csv
+    return exporter(blockchains, start_height)
@@ -0,0 +1,49 @@
+"""
+Cached block card fragments for the mined chain page.
+
+Cards are keyed by block id and LEDGER_BLOCK_FRAGMENT_VERSION; a page view
+fetches them with one get_many and renders only the misses.
+"""
+
+from django.conf import settings
+from django.core.cache import caches
+from django.template.loader import render_to_string
+from django.utils.safestring import mark_safe
+
+FRAGMENT_KEY_PREFIX = 'ledger:block-card'
+
+
+def _cache():
+    return caches[settings.LEDGER_FRAGMENT_CACHE_ALIAS]
+
+
+def fragment_key(blockid):
+    """
+    Builds the cache key of a block card.
+    """
+    return '%s:%s' % (FRAGMENT_KEY_PREFIX, blockid)
+
+
+def render_block_cards(blocks):
+    """
+    Returns the HTML cards of blocks, rendering only those not cached yet.
+
+    Args:
+        blocks: Serialized blocks, as returned by core.utils.serialize_block
+
+    Returns:
+        list: Safe HTML strings, in the order of blocks
+    """
+    cache = _cache()
+    version = settings.LEDGER_BLOCK_FRAGMENT_VERSION
+    keys = [fragment_key(block['blockid']) for block in blocks]
+    cards = cache.get_many(keys, version=version)
+
+    rendered = {}
+    for key, block in zip(keys, blocks):
+        if key not in cards:
+            rendered[key] = render_to_string('block_card.html', {'block': block})
+    if rendered:
+        cache.set_many(rendered, settings.LEDGER_BLOCK_FRAGMENT_TIMEOUT, version=version)
+        cards.update(rendered)
+    return [mark_safe(cards[key]) for key in keys]
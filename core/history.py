@@ -0,0 +1,68 @@
+"""
+Address transaction history with keyset pagination.
+
+An address's history is the union of the transactions it sent and received,
+newest first. Each side is read through its own (address, -txid) index with a
+"txid < cursor" bound and LIMIT, and the two short lists are merged in
+Python, so fetching a page costs the same on page 1 and on page 10,000.
+"""
+
+import heapq
+
+from home.models import Transaction
+from core.utils import serialize_transaction
+
+HISTORY_PAGE_SIZE = 50
+HISTORY_MAX_PAGE_SIZE = 200
+
+
+def _side(address_field, address, cursor, limit):
+    transactions = Transaction.objects.filter(**{address_field: address})
+    if cursor is not None:
+        transactions = transactions.filter(txid__lt=cursor)
+    return list(transactions.order_by('-txid')[:limit])
+
+
+def get_address_history(address, cursor=None, limit=HISTORY_PAGE_SIZE):
+    """
+    Returns one page of an address's sent and received transactions.
+
+    Args:
+        address: Address (username) whose history to read
+        cursor: Opaque cursor from the previous page, None for the first page
+        limit: Maximum number of transactions on the page
+
+    Returns:
+        dict: The page's transactions, newest first, and the next_cursor to
+        pass for the following page (None on the last page)
+    """
+    limit = max(1, min(limit, HISTORY_MAX_PAGE_SIZE))
+    sent = _side('sendAddr', address, cursor, limit + 1)
+    received = _side('receiveAddr', address, cursor, limit + 1)
+
+    page = []
+    has_more = False
+    last_txid = None
+    for transaction in heapq.merge(sent, received, key=lambda tx: -tx.txid):
+        if transaction.txid == last_txid:
+            # Transfers to oneself appear on both sides.
+            continue
+        if len(page) == limit:
+            has_more = True
+            break
+        last_txid = transaction.txid
+        page.append(transaction)
+
+    transactions = []
+    for transaction in page:
+        serialized = serialize_transaction(transaction)
+        serialized['direction'] = 'sent' if transaction.sendAddr == address else 'received'
+        serialized['status'] = 'confirmed' if transaction.block_id else 'pending'
+        serialized['blockid'] = transaction.block_id
+        transactions.append(serialized)
+
+    return {
+        'address': address,
+        'transactions': transactions,
+        'next_cursor': str(page[-1].txid) if has_more else None,
+    }
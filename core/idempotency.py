@@ -0,0 +1,238 @@
+"""
+Idempotency keys for transaction submission.
+
+A client that retries a submission sends the same idempotency key again and
+gets the transaction created by the first attempt instead of a duplicate.
+Keys are stored on the transaction and are unique per sender, so the
+database rejects a duplicate insert whatever happens in front of it.
+
+Looking every key up before inserting would add a query to each submission,
+while almost all keys are fresh. Each process therefore remembers the keys it
+has seen in a rotating Bloom filter: a key the filter has never seen is
+inserted straight away, and only a possible hit is confirmed against the
+database. The filter has two generations of LEDGER_IDEMPOTENCY_FILTER_CAPACITY
+keys each; when the current one is full the older one is dropped, which keeps
+memory and the false positive rate fixed. Keys that fell out of the filter,
+or were submitted to another process, are still caught by the unique
+constraint.
+"""
+
+import hashlib
+import math
+import threading
+
+from django.conf import settings
+from home.models import Transaction
+from core.metrics import registry
+
+IDEMPOTENCY_KEY_MAX_LENGTH = 64
+
+
+class BloomFilter:
+    """Fixed-size Bloom filter over strings, using double hashing."""
+
+    def __init__(self, capacity, error_rate):
+        self.capacity = capacity
+        self.bit_count = max(8, int(math.ceil(-capacity * math.log(error_rate) / math.log(2) ** 2)))
+        self.hash_count = max(1, int(round(self.bit_count / capacity * math.log(2))))
+        self.bits = bytearray((self.bit_count + 7) // 8)
+        self.count = 0
+
+    def _positions(self, value):
+        digest = hashlib.blake2b(value.encode(), digest_size=16).digest()
+        first = int.from_bytes(digest[:8], 'little')
+        second = int.from_bytes(digest[8:], 'little') | 1
+        return [(first + index * second) % self.bit_count for index in range(self.hash_count)]
+
+    def add(self, value):
+        """Adds a value to the filter."""
+        for position in self._positions(value):
+            self.bits[position >> 3] |= 1 << (position & 7)
+        self.count += 1
+
+    def __contains__(self, value):
+        return all(self.bits[position >> 3] & (1 << (position & 7))
+                   for position in self._positions(value))
+
+    def false_positive_rate(self):
+        """Expected false positive rate at the current number of values."""
+        return (1 - math.exp(-self.hash_count * self.count / self.bit_count)) ** self.hash_count
+
+
+class RotatingBloomFilter:
+    """Two-generation Bloom filter that forgets the oldest keys when full."""
+
+    def __init__(self, capacity, error_rate):
+        self.capacity = capacity
+        self.error_rate = error_rate
+        self.current = BloomFilter(capacity, error_rate)
+        self.previous = None
+        self.rotations = 0
+        self._lock = threading.Lock()
+
+    def add(self, value):
+        """Adds a value, rotating the generations when the current one is full."""
+        with self._lock:
+            if self.current.count >= self.capacity:
+                self.previous = self.current
+                self.current = BloomFilter(self.capacity, self.error_rate)
+                self.rotations += 1
+            self.current.add(value)
+
+    def __contains__(self, value):
+        with self._lock:
+            generations = [self.current, self.previous]
+        return any(generation is not None and value in generation for generation in generations)
+
+    def false_positive_rate(self):
+        """Expected false positive rate of a lookup across both generations."""
+        with self._lock:
+            generations = [self.current, self.previous]
+        miss = 1.0
+        for generation in generations:
+            if generation is not None:
+                miss *= 1 - generation.false_positive_rate()
+        return 1 - miss
+
+
+_filter = None
+_filter_lock = threading.Lock()
+_lookups = {'filter_miss': 0, 'duplicate': 0, 'false_positive': 0}
+_lookups_lock = threading.Lock()
+
+
+def get_key_filter():
+    """
+    Returns the process-wide idempotency key filter, created on first use.
+    """
+    global _filter
+    with _filter_lock:
+        if _filter is None:
+            _filter = RotatingBloomFilter(
+                settings.LEDGER_IDEMPOTENCY_FILTER_CAPACITY,
+                settings.LEDGER_IDEMPOTENCY_FILTER_ERROR_RATE
+            )
+        return _filter
+
+
+def reset_key_filter():
+    """
+    Drops the process-wide filter and lookup counters, for example in tests.
+    """
+    global _filter
+    with _filter_lock:
+        _filter = None
+    with _lookups_lock:
+        for result in _lookups:
+            _lookups[result] = 0
+
+
+def _member(sender, key):
+    return '%s\x00%s' % (sender, key)
+
+
+def _count(result, amount=1):
+    if amount:
+        with _lookups_lock:
+            _lookups[result] += amount
+
+
+def is_valid_idempotency_key(key):
+    """
+    Checks that a submitted idempotency key is a non-empty string of at most
+    IDEMPOTENCY_KEY_MAX_LENGTH characters.
+    """
+    return isinstance(key, str) and 0 < len(key) <= IDEMPOTENCY_KEY_MAX_LENGTH
+
+
+def remember_idempotency_keys(sender, keys):
+    """
+    Records used keys of a sender in the filter.
+
+    Args:
+        sender: Address that submitted the transactions
+        keys: Iterable of idempotency keys; None entries are ignored
+    """
+    key_filter = get_key_filter()
+    for key in keys:
+        if key is not None:
+            key_filter.add(_member(sender, key))
+
+
+def find_used_idempotency_keys(sender, keys, check_database=False):
+    """
+    Looks up which idempotency keys a sender has already used.
+
+    Only keys the filter reports as possibly seen are looked up in the
+    database, with a single query.
+
+    Args:
+        sender: Address that submitted the transactions
+        keys: Iterable of idempotency keys; None entries are ignored
+        check_database: Look every key up, for example after a concurrent
+            insert of the same key failed on the unique constraint
+
+    Returns:
+        dict: Used key -> txid of the transaction created with it
+    """
+    sender = str(sender)
+    keys = {key for key in keys if key is not None}
+    if check_database:
+        candidates = keys
+    else:
+        key_filter = get_key_filter()
+        candidates = {key for key in keys if _member(sender, key) in key_filter}
+        _count('filter_miss', len(keys) - len(candidates))
+    if not candidates:
+        return {}
+    used = dict(Transaction.objects.filter(
+        sendAddr=sender, idempotency_key__in=candidates
+    ).values_list('idempotency_key', 'txid'))
+    _count('duplicate', len(used))
+    if not check_database:
+        _count('false_positive', len(candidates) - len(used))
+    return used
+
+
+def idempotency_metrics():
+    """
+    Collects the filter size and false positive rate and the lookup counters.
+
+    Returns:
+        list: Metric tuples in the registry's collector format
+    """
+    key_filter = get_key_filter()
+    with key_filter._lock:
+        generations = [
+            (name, generation) for name, generation in
+            (('current', key_filter.current), ('previous', key_filter.previous))
+            if generation is not None
+        ]
+        keys = [({'generation': name}, generation.count) for name, generation in generations]
+        size = [({'generation': name}, len(generation.bits)) for name, generation in generations]
+        rotations = key_filter.rotations
+    with _lookups_lock:
+        lookups = [({'result': result}, count) for result, count in _lookups.items()]
+    return [
+        ('ledger_idempotency_filter_keys', 'gauge',
+         'Idempotency keys held per filter generation.', keys),
+        ('ledger_idempotency_filter_bytes', 'gauge',
+         'Bit array size per filter generation in bytes.', size),
+        ('ledger_idempotency_filter_capacity', 'gauge',
+         'Keys per filter generation before it rotates.', [({}, key_filter.capacity)]),
+        ('ledger_idempotency_filter_hashes', 'gauge',
+         'Hash functions per filter lookup.', [({}, key_filter.current.hash_count)]),
+        ('ledger_idempotency_filter_target_false_positive_rate', 'gauge',
+         'Configured false positive rate of a full generation.', [({}, key_filter.error_rate)]),
+        ('ledger_idempotency_filter_false_positive_rate', 'gauge',
+         'Expected false positive rate of a lookup at the current fill.',
+         [({}, key_filter.false_positive_rate())]),
+        ('ledger_idempotency_filter_rotations_total', 'counter',
+         'Filter generation rotations.', [({}, rotations)]),
+        ('ledger_idempotency_lookups_total', 'counter',
+         'Idempotency key lookups by outcome: filter_miss (no query), duplicate '
+         'or false_positive (confirmed against the database).', lookups),
+    ]
+
+
+registry.register_collector(idempotency_metrics)
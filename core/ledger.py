@@ -0,0 +1,122 @@
+"""
+Global ledger across every chain.
+
+Each user's chain is ordered on its own: blocks are mined one at a time under
+the chain tip lock, so block timestamps increase with height. The global
+ledger interleaves all chains by confirmation time (the block's
+transaction_timestamp) with a lazy heap-based k-way merge over one cursor per
+chain. A cursor first streams the chain's archived blocks one at a time and
+then keyset-pages its confirmed transactions by (height, txid), holding at
+most one page. Pages shrink as the number of chains grows, down to a single
+row, so all cursors together buffer at most LEDGER_STREAM_BUFFER transactions
+or one per chain when there are more chains than that, plus one archived block
+per archived chain, whatever the size of the ledger. The merge primes every
+cursor up front, which costs one query per chain.
+"""
+
+import heapq
+from bisect import bisect_left
+from operator import itemgetter
+
+from django.conf import settings
+from django.db.models import Q
+from home.models import Blockchain, Transaction
+from core.archive import iter_archived_blocks, read_archived_blocks
+
+
+def _record(user, height, blockid, confirmed, txid, sender, receiver, amount, timestamp):
+    key = (confirmed, height, txid)
+    return key, {
+        'chain': user,
+        'height': height,
+        'blockid': blockid,
+        'confirmed': confirmed.isoformat(),
+        'txid': txid,
+        'sendAddr': sender,
+        'receiveAddr': receiver,
+        'amount': amount,
+        'transaction_timestamp': timestamp.isoformat(),
+    }
+
+
+class _ArchiveTimestamps:
+    """Sequence view of the archived block timestamps of a chain, for bisect."""
+
+    def __init__(self, blockchain):
+        self.blockchain = blockchain
+
+    def __len__(self):
+        return self.blockchain.archived_height + 1
+
+    def __getitem__(self, height):
+        return read_archived_blocks(self.blockchain, height, height)[0].transaction_timestamp
+
+
+def _archived_records(blockchain, user, since, until):
+    if blockchain.archived_height is None:
+        return
+    start_height = 0
+    if since is not None:
+        start_height = bisect_left(_ArchiveTimestamps(blockchain), since)
+    for block in iter_archived_blocks(blockchain, start_height):
+        if until is not None and block.transaction_timestamp >= until:
+            return
+        for transaction in block.transaction_list:
+            yield _record(
+                user, block.height, block.blockid, block.transaction_timestamp,
+                transaction.txid, transaction.sendAddr, transaction.receiveAddr,
+                transaction.amount, transaction.transaction_timestamp)
+
+
+def _chain_records(blockchain, since, until, page_size):
+    user = str(blockchain.user)
+    yield from _archived_records(blockchain, user, since, until)
+
+    transactions = Transaction.objects.filter(block__chain=blockchain)
+    if since is not None:
+        transactions = transactions.filter(block__transaction_timestamp__gte=since)
+    if until is not None:
+        transactions = transactions.filter(block__transaction_timestamp__lt=until)
+    if blockchain.archived_height is not None:
+        transactions = transactions.filter(block__height__gt=blockchain.archived_height)
+    transactions = transactions.order_by('block__height', 'txid').values_list(
+        'block__height', 'block_id', 'block__transaction_timestamp', 'txid',
+        'sendAddr', 'receiveAddr', 'amount', 'transaction_timestamp')
+
+    cursor = None
+    while True:
+        page = transactions
+        if cursor is not None:
+            height, txid = cursor
+            page = page.filter(Q(block__height__gt=height) | Q(block__height=height, txid__gt=txid))
+        rows = list(page[:page_size])
+        for row in rows:
+            yield _record(user, *row)
+        if len(rows) < page_size:
+            return
+        cursor = (rows[-1][0], rows[-1][3])
+
+
+def iter_global_ledger(since=None, until=None, blockchains=None):
+    """
+    Streams the confirmed transactions of every chain in confirmation order.
+
+    Args:
+        since: Aware datetime; only blocks confirmed at or after it are included
+        until: Aware datetime; only blocks confirmed before it are included
+        blockchains: Chains to merge, every chain by default
+
+    Yields:
+        dict: One record per transaction with its chain (user), block height,
+        blockid and confirmation time, ordered by confirmation time, then
+        height and txid
+    """
+    if blockchains is None:
+        blockchains = Blockchain.objects.order_by('pk')
+    blockchains = list(blockchains)
+    if not blockchains:
+        return
+    page_size = max(1, settings.LEDGER_STREAM_BUFFER // len(blockchains))
+    cursors = [_chain_records(blockchain, since, until, page_size) for blockchain in blockchains]
+    for _, record in heapq.merge(*cursors, key=itemgetter(0)):
+        yield record
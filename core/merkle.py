@@ -0,0 +1,197 @@
+"""
+Block header hashing and Merkle inclusion proofs.
+
+Every block stores a SHA-256 Merkle root over its transactions (ordered by
+txid) and a header hash that commits to the previous block's header hash,
+forming a hash chain. Leaves and interior nodes are hashed with distinct
+prefixes, and an unpaired node is promoted to the next level unchanged, so a
+proof for a block of n transactions holds at most ceil(log2(n)) hashes.
+
+Mining stores every level of a block's tree as packed 32-byte hashes (see
+encode_merkle_tree), so a proof reads ceil(log2(n)) slices of the stored tree
+instead of re-hashing the block.
+
+The functions here only depend on the standard library so that migrations
+can use them as well.
+"""
+
+import hashlib
+import json
+
+LEAF_PREFIX = b'\x00'
+NODE_PREFIX = b'\x01'
+HASH_SIZE = 32
+
+
+def _sha256(data):
+    return hashlib.sha256(data).hexdigest()
+
+
+def transaction_leaf(txid, send_addr, receive_addr, amount, timestamp):
+    """
+    Hashes the canonical encoding of a transaction into a Merkle leaf.
+
+    Args:
+        txid: Transaction id
+        send_addr: Sender address
+        receive_addr: Receiver address
+        amount: Transaction amount
+        timestamp: Transaction timestamp (datetime)
+
+    Returns:
+        str: Hex encoded leaf hash
+    """
+    encoded = json.dumps(
+        [txid, str(send_addr), str(receive_addr), amount, timestamp.isoformat()],
+        separators=(',', ':')
+    )
+    return _sha256(LEAF_PREFIX + encoded.encode())
+
+
+def _parent(left, right):
+    return _sha256(NODE_PREFIX + bytes.fromhex(left) + bytes.fromhex(right))
+
+
+def merkle_levels(leaves):
+    """
+    Builds every level of a Merkle tree.
+
+    Args:
+        leaves: Hex encoded leaf hashes in block order
+
+    Returns:
+        list: Levels from the leaves up to the root, each a list of hex hashes;
+        empty for no leaves
+    """
+    levels = [list(leaves)] if leaves else []
+    while levels and len(levels[-1]) > 1:
+        level = levels[-1]
+        levels.append([
+            _parent(level[i], level[i + 1]) if i + 1 < len(level) else level[i]
+            for i in range(0, len(level), 2)
+        ])
+    return levels
+
+
+def merkle_root(leaves):
+    """
+    Computes the Merkle root of a list of leaf hashes.
+
+    Args:
+        leaves: Hex encoded leaf hashes in block order
+
+    Returns:
+        str: Hex encoded root; the hash of the empty string for no leaves
+    """
+    if not leaves:
+        return _sha256(b'')
+    return merkle_levels(leaves)[-1][0]
+
+
+def merkle_proof(leaves, index):
+    """
+    Builds the inclusion proof of one leaf.
+
+    Args:
+        leaves: Hex encoded leaf hashes in block order
+        index: Position of the leaf to prove
+
+    Returns:
+        list: Steps from the leaf up to the root, as dicts with the sibling
+        hash and its position ('left' or 'right')
+    """
+    proof = []
+    for level in merkle_levels(leaves)[:-1]:
+        sibling = index ^ 1
+        if sibling < len(level):
+            proof.append({
+                'hash': level[sibling],
+                'position': 'left' if sibling < index else 'right',
+            })
+        index //= 2
+    return proof
+
+
+def encode_merkle_tree(levels):
+    """
+    Packs the levels of a Merkle tree into bytes, leaves first.
+
+    Args:
+        levels: Levels as returned by merkle_levels
+
+    Returns:
+        bytes: HASH_SIZE bytes per node
+    """
+    return b''.join(bytes.fromhex(node) for level in levels for node in level)
+
+
+def _level_sizes(count):
+    sizes = [count] if count else []
+    while sizes and sizes[-1] > 1:
+        sizes.append((sizes[-1] + 1) // 2)
+    return sizes
+
+
+def merkle_proof_offsets(count, index):
+    """
+    Locates the hashes of an inclusion proof inside an encoded tree.
+
+    Args:
+        count: Number of leaves of the tree
+        index: Position of the leaf to prove
+
+    Returns:
+        tuple: Byte offset of the leaf, and the proof steps from the leaf up
+        as (byte offset, position) tuples; every hash is HASH_SIZE bytes
+    """
+    leaf_offset = index * HASH_SIZE
+    steps = []
+    start = 0
+    for size in _level_sizes(count)[:-1]:
+        sibling = index ^ 1
+        if sibling < size:
+            steps.append(((start + sibling) * HASH_SIZE, 'left' if sibling < index else 'right'))
+        start += size
+        index //= 2
+    return leaf_offset, steps
+
+
+def verify_merkle_proof(leaf, proof, root):
+    """
+    Verifies an inclusion proof against a Merkle root.
+
+    Args:
+        leaf: Hex encoded leaf hash
+        proof: Steps as returned by merkle_proof
+        root: Hex encoded Merkle root of the block
+
+    Returns:
+        bool: True if the proof links the leaf to the root
+    """
+    current = leaf
+    for step in proof:
+        if step['position'] == 'left':
+            current = _parent(step['hash'], current)
+        else:
+            current = _parent(current, step['hash'])
+    return current == root
+
+
+def block_header_hash(previous_hash, root, height, timestamp):
+    """
+    Hashes a block header, linking it to the previous block's header hash.
+
+    Args:
+        previous_hash: Header hash of the previous block, '' for a genesis block
+        root: Merkle root of the block's transactions
+        height: Height of the block in its chain
+        timestamp: Block timestamp (datetime)
+
+    Returns:
+        str: Hex encoded header hash
+    """
+    encoded = json.dumps(
+        [previous_hash, root, height, timestamp.isoformat()],
+        separators=(',', ':')
+    )
+    return _sha256(encoded.encode())
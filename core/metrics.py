@@ -0,0 +1,162 @@
+"""
+In-process request and ledger metrics in the Prometheus text format.
+
+MetricsMiddleware records, per URL name, a request latency histogram, the
+number of requests by status class, and the number and total time of SQL
+queries. Ledger gauges (mempool depth per miner, chain height per chain) and
+any other registered collectors are evaluated when /metrics is scraped, so
+requests only pay for a few counter updates under a lock.
+
+Metrics are kept per process; scrape every worker or aggregate upstream.
+"""
+
+import threading
+
+from django.db.models import Sum
+from home.models import Blockchain, Mempool
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+class _ViewStats:
+    """Accumulated request statistics of one URL name."""
+
+    def __init__(self):
+        self.bucket_counts = [0] * len(LATENCY_BUCKETS)
+        self.latency_sum = 0.0
+        self.requests = 0
+        self.status_classes = {}
+        self.queries = 0
+        self.sql_time = 0.0
+
+
+class MetricsRegistry:
+    """Thread-safe store of request metrics and scrape-time collectors."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._views = {}
+        self._collectors = []
+
+    def observe_request(self, view, status_code, duration, queries, sql_time):
+        """
+        Records one finished request.
+
+        Args:
+            view: URL name of the view that handled the request
+            status_code: HTTP status code of the response
+            duration: Request latency in seconds
+            queries: Number of SQL queries executed
+            sql_time: Total SQL time in seconds
+        """
+        status_class = '%dxx' % (status_code // 100)
+        with self._lock:
+            stats = self._views.get(view)
+            if stats is None:
+                stats = self._views[view] = _ViewStats()
+            for index, bound in enumerate(LATENCY_BUCKETS):
+                if duration <= bound:
+                    stats.bucket_counts[index] += 1
+                    break
+            stats.latency_sum += duration
+            stats.requests += 1
+            stats.status_classes[status_class] = stats.status_classes.get(status_class, 0) + 1
+            stats.queries += queries
+            stats.sql_time += sql_time
+
+    def register_collector(self, collector):
+        """
+        Registers a callable evaluated on every scrape.
+
+        Args:
+            collector: Callable returning a list of (name, type, help, samples)
+                tuples where samples is a list of (labels dict, value) pairs
+        """
+        with self._lock:
+            if collector not in self._collectors:
+                self._collectors.append(collector)
+
+    def render(self):
+        """
+        Renders every metric in the Prometheus text exposition format.
+
+        Returns:
+            str: The exposition text
+        """
+        with self._lock:
+            views = {
+                view: (list(stats.bucket_counts), stats.latency_sum, stats.requests,
+                       dict(stats.status_classes), stats.queries, stats.sql_time)
+                for view, stats in self._views.items()
+            }
+            collectors = list(self._collectors)
+
+        lines = [
+            '# HELP ledger_request_duration_seconds Request latency by URL name.',
+            '# TYPE ledger_request_duration_seconds histogram',
+        ]
+        for view, (buckets, latency_sum, requests, _, _, _) in sorted(views.items()):
+            cumulative = 0
+            for bound, count in zip(LATENCY_BUCKETS, buckets):
+                cumulative += count
+                lines.append('ledger_request_duration_seconds_bucket{view="%s",le="%s"} %d' % (
+                    _escape(view), bound, cumulative))
+            lines.append('ledger_request_duration_seconds_bucket{view="%s",le="+Inf"} %d' % (
+                _escape(view), requests))
+            lines.append('ledger_request_duration_seconds_sum{view="%s"} %r' % (
+                _escape(view), latency_sum))
+            lines.append('ledger_request_duration_seconds_count{view="%s"} %d' % (
+                _escape(view), requests))
+
+        request_metrics = [
+            ('ledger_requests_total', 'counter', 'Requests by URL name and status class.',
+             [({'view': view, 'status': status}, count)
+              for view, stats in views.items() for status, count in stats[3].items()]),
+            ('ledger_request_sql_queries_total', 'counter', 'SQL queries executed by URL name.',
+             [({'view': view}, stats[4]) for view, stats in views.items()]),
+            ('ledger_request_sql_seconds_total', 'counter', 'Time spent in SQL by URL name.',
+             [({'view': view}, stats[5]) for view, stats in views.items()]),
+        ]
+        for collector in collectors:
+            request_metrics.extend(collector())
+
+        for name, metric_type, help_text, samples in request_metrics:
+            lines.append('# HELP %s %s' % (name, help_text))
+            lines.append('# TYPE %s %s' % (name, metric_type))
+            for labels, value in sorted(samples, key=lambda sample: sorted(sample[0].items())):
+                lines.append('%s%s %r' % (name, _labels(labels), value))
+        return '\n'.join(lines) + '\n'
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _labels(labels):
+    if not labels:
+        return ''
+    return '{%s}' % ','.join(
+        '%s="%s"' % (key, _escape(value)) for key, value in sorted(labels.items()))
+
+
+def ledger_gauges():
+    """
+    Collects ledger gauges from the database at scrape time.
+
+    Returns:
+        list: Mempool depth per miner and chain height per blockchain
+    """
+    depths = Mempool.objects.values('user_name').annotate(
+        depth=Sum('transaction_count')
+    ).values_list('user_name', 'depth')
+    heights = Blockchain.objects.values_list('user', 'latest__height')
+    return [
+        ('ledger_mempool_depth', 'gauge', 'Pending transactions per miner mempool.',
+         [({'miner': miner}, depth) for miner, depth in depths]),
+        ('ledger_chain_height', 'gauge', 'Height of the latest block per blockchain.',
+         [({'chain': user}, height or 0) for user, height in heights]),
+    ]
+
+
+registry = MetricsRegistry()
+registry.register_collector(ledger_gauges)
@@ -0,0 +1,85 @@
+"""
+Request instrumentation and database routing middleware.
+"""
+
+import time
+from contextlib import ExitStack
+
+from django.conf import settings
+from django.db import connections
+from core.metrics import registry
+from core.routers import iter_routed, start_routing, stop_routing
+
+PRIMARY_PIN_COOKIE = 'ledger_primary'
+SAFE_METHODS = ('GET', 'HEAD', 'OPTIONS')
+
+
+class _SqlTracker:
+    """Database execute wrapper that counts queries and their total time."""
+
+    def __init__(self):
+        self.queries = 0
+        self.time = 0.0
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.queries += 1
+            self.time += time.perf_counter() - started
+
+
+class MetricsMiddleware:
+    """Records latency and SQL usage of every request per URL name."""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        tracker = _SqlTracker()
+        started = time.perf_counter()
+        with ExitStack() as stack:
+            for connection in connections.all():
+                stack.enter_context(connection.execute_wrapper(tracker))
+            response = self.get_response(request)
+        duration = time.perf_counter() - started
+
+        match = request.resolver_match
+        view = match.url_name if match is not None and match.url_name else 'unresolved'
+        registry.observe_request(view, response.status_code, duration, tracker.queries, tracker.time)
+        return response
+
+
+class ReplicaRoutingMiddleware:
+    """
+    Lets core.routers send the ledger reads of safe requests to read replicas.
+
+    Unsafe requests read from the primary throughout. A request that writes
+    sets a short-lived cookie pinning the client to the primary, so the page
+    it redirects to, and the client's next polls, see the write even before
+    the replicas catch up.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        if not settings.LEDGER_READ_REPLICAS:
+            return self.get_response(request)
+        primary = request.method not in SAFE_METHODS or PRIMARY_PIN_COOKIE in request.COOKIES
+        state, token = start_routing(primary)
+        try:
+            response = self.get_response(request)
+        finally:
+            stop_routing(token)
+        if response.streaming and not response.is_async:
+            response.streaming_content = iter_routed(state, response.streaming_content)
+        if state.wrote:
+            response.set_cookie(
+                PRIMARY_PIN_COOKIE, '1',
+                max_age=settings.LEDGER_REPLICA_PIN_SECONDS,
+                httponly=True,
+                samesite='Lax'
+            )
+        return response
@@ -0,0 +1,48 @@
+"""
+Materialized block payloads.
+
+Mined blocks never change, so each block's serialize_block output is stored at
+mining time as zlib-compressed JSON, which is also a valid HTTP "deflate" body.
+"""
+
+import json
+import zlib
+
+from home.models import Block
+
+
+def encode_block_payload(serialized):
+    """
+    Compresses a serialized block for storage.
+
+    Args:
+        serialized: Block dictionary from serialize_block
+
+    Returns:
+        bytes: The payload
+    """
+    return zlib.compress(json.dumps(serialized, separators=(',', ':')).encode())
+
+
+def decode_block_payload(payload):
+    """
+    Decompresses a stored payload into the serialized block dictionary.
+    """
+    return json.loads(zlib.decompress(bytes(payload)))
+
+
+def load_block_payload(blockid):
+    """
+    Reads the stored payload of a block with one primary key lookup.
+
+    Args:
+        blockid: Id of the block
+
+    Returns:
+        bytes: The compressed payload, or None if it was never materialized
+
+    Raises:
+        Block.DoesNotExist: If there is no such block in the database
+    """
+    payload = Block.objects.values_list('payload', flat=True).get(pk=blockid)
+    return bytes(payload) if payload is not None else None
@@ -0,0 +1,158 @@
+"""
+Read-replica routing.
+
+Reads of ledger models made while serving a safe (GET, HEAD) request go to
+one of the LEDGER_READ_REPLICAS; everything else uses the primary (the
+default database): writes, every read of a request that writes or has
+written, reads inside a transaction, requests of clients pinned to the
+primary after a recent write, and code running outside a request, such as
+management commands and the block assembler.
+
+Each request sticks to the replica it first read from. A replica whose newest
+block is more than LEDGER_REPLICA_MAX_LAG blocks behind the primary's chain
+tip is skipped; tips are compared at most every LEDGER_REPLICA_CHECK_INTERVAL
+seconds per process. Replicas only lag in what they replicate, so pending
+transactions may appear on a replica shortly after blocks do.
+"""
+
+import contextvars
+import random
+import threading
+import time
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, DatabaseError, connections
+
+ROUTED_APPS = {'home'}
+
+_routing = contextvars.ContextVar('ledger_db_routing', default=None)
+_freshness = {}
+_freshness_lock = threading.Lock()
+
+
+class RoutingState:
+    """Database routing decisions of one request."""
+
+    def __init__(self, primary=False):
+        self.primary = primary
+        self.wrote = False
+        self.replica = None
+
+
+def start_routing(primary=False):
+    """
+    Starts routing the reads of the current request.
+
+    Args:
+        primary: Send every read of the request to the primary
+
+    Returns:
+        tuple: The RoutingState and a token for stop_routing
+    """
+    state = RoutingState(primary)
+    return state, _routing.set(state)
+
+
+def stop_routing(token):
+    """
+    Stops routing started by start_routing.
+    """
+    _routing.reset(token)
+
+
+def iter_routed(state, content):
+    """
+    Iterates over streamed response content under a request's routing state,
+    which is otherwise gone by the time the content is consumed.
+    """
+    iterator = iter(content)
+    while True:
+        token = _routing.set(state)
+        try:
+            chunk = next(iterator)
+        except StopIteration:
+            return
+        finally:
+            _routing.reset(token)
+        yield chunk
+
+
+def _chain_tip(alias):
+    from home.models import Block
+    return Block.objects.using(alias).order_by('-pk').values_list('pk', flat=True).first() or 0
+
+
+def replica_is_fresh(alias):
+    """
+    Checks whether a replica is within LEDGER_REPLICA_MAX_LAG blocks of the
+    primary's chain tip, reusing a recent answer.
+
+    Args:
+        alias: Database alias of the replica
+
+    Returns:
+        bool: True if the replica can serve reads
+    """
+    now = time.monotonic()
+    with _freshness_lock:
+        checked = _freshness.get(alias)
+    if checked is not None and now - checked[0] < settings.LEDGER_REPLICA_CHECK_INTERVAL:
+        return checked[1]
+    try:
+        fresh = _chain_tip(DEFAULT_DB_ALIAS) - _chain_tip(alias) <= settings.LEDGER_REPLICA_MAX_LAG
+    except DatabaseError:
+        fresh = False
+    with _freshness_lock:
+        _freshness[alias] = (now, fresh)
+    return fresh
+
+
+def reset_replica_freshness():
+    """
+    Forgets the cached replica freshness checks, for example after a sync.
+    """
+    with _freshness_lock:
+        _freshness.clear()
+
+
+def choose_replica():
+    """
+    Picks a random fresh replica.
+
+    Returns:
+        str: Its database alias, or None if no replica is fresh
+    """
+    replicas = list(settings.LEDGER_READ_REPLICAS)
+    random.shuffle(replicas)
+    for alias in replicas:
+        if replica_is_fresh(alias):
+            return alias
+    return None
+
+
+class ReplicaRouter:
+    """Routes ledger reads of safe requests to fresh read replicas."""
+
+    def db_for_read(self, model, **hints):
+        state = _routing.get()
+        if state is None or state.primary or model._meta.app_label not in ROUTED_APPS:
+            return DEFAULT_DB_ALIAS
+        if connections[DEFAULT_DB_ALIAS].in_atomic_block:
+            return DEFAULT_DB_ALIAS
+        if state.replica is None:
+            state.replica = choose_replica() or DEFAULT_DB_ALIAS
+        return state.replica
+
+    def db_for_write(self, model, **hints):
+        state = _routing.get()
+        if state is not None:
+            # Later reads of the request must see the write.
+            state.primary = True
+            state.wrote = True
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        databases = {DEFAULT_DB_ALIAS, *settings.LEDGER_READ_REPLICAS}
+        if obj1._state.db in databases and obj2._state.db in databases:
+            return True
+        return None
@@ -0,0 +1,122 @@
+"""
+Tip-versioned chain snapshot cache.
+
+Snapshots are keyed by blockchain id and tip block id, extended by one block
+when a block is mined and bounded by an LRU index.
+"""
+
+from django.conf import settings
+from django.core.cache import caches
+from core.utils import get_latest_serialized_blocks, serialize_mined_block
+
+SNAPSHOT_KEY_PREFIX = 'ledger:chain-snapshot'
+SNAPSHOT_INDEX_KEY = SNAPSHOT_KEY_PREFIX + ':lru'
+
+
+def _cache():
+    return caches[settings.LEDGER_CHAIN_CACHE_ALIAS]
+
+
+def _window_size():
+    return settings.LEDGER_MINED_PAGE_SIZE
+
+
+def snapshot_key(blockchain_id, tip_id):
+    """
+    Builds the cache key of a chain snapshot.
+
+    Args:
+        blockchain_id: Primary key of the blockchain
+        tip_id: Primary key of the blockchain's latest block
+
+    Returns:
+        str: Cache key for the snapshot
+    """
+    return '%s:%s:%s' % (SNAPSHOT_KEY_PREFIX, blockchain_id, tip_id)
+
+
+def build_chain_snapshot(blockchain):
+    """
+    Reads the latest window of blocks of a blockchain from their stored payloads.
+
+    Args:
+        blockchain: Blockchain instance to snapshot
+
+    Returns:
+        list: Serialized blocks ordered by height
+    """
+    return get_latest_serialized_blocks(blockchain, _window_size())
+
+
+def get_chain_snapshot(blockchain):
+    """
+    Returns the snapshot for the blockchain's current tip, building it on a miss.
+
+    Args:
+        blockchain: Blockchain instance to read
+
+    Returns:
+        list: Serialized blocks ordered by height
+    """
+    key = snapshot_key(blockchain.pk, blockchain.latest_id)
+    snapshot = _cache().get(key)
+    if snapshot is None:
+        snapshot = build_chain_snapshot(blockchain)
+        _store(key, snapshot)
+    else:
+        _touch(key)
+    return snapshot
+
+
+def extend_chain_snapshot(blockchain, new_block):
+    """
+    Appends a newly mined block to the snapshot of its predecessor.
+
+    The predecessor is the block new_block was actually mined on, which may
+    be newer than the tip the caller saw if another miner got there first.
+    When no snapshot of it is cached nothing is built here; the next read
+    builds the snapshot for the new tip on demand.
+
+    Args:
+        blockchain: Blockchain instance whose tip is now new_block
+        new_block: Newly mined block
+
+    Returns:
+        list: The extended snapshot, or None if there was nothing to extend
+    """
+    cache = _cache()
+    previous_key = snapshot_key(blockchain.pk, new_block.previous_id)
+    snapshot = cache.get(previous_key)
+    if snapshot is None:
+        return None
+
+    snapshot = snapshot[-(_window_size() - 1):] if _window_size() > 1 else []
+    snapshot.append(serialize_mined_block(new_block))
+    _store(snapshot_key(blockchain.pk, new_block.pk), snapshot, replaces=previous_key)
+    return snapshot
+
+
+def _store(key, snapshot, replaces=None):
+    cache = _cache()
+    cache.set(key, snapshot, settings.LEDGER_CHAIN_CACHE_TIMEOUT)
+
+    index = [entry for entry in cache.get(SNAPSHOT_INDEX_KEY, []) if entry not in (key, replaces)]
+    index.append(key)
+    evicted = index[:-settings.LEDGER_CHAIN_CACHE_MAX_ENTRIES]
+    index = index[-settings.LEDGER_CHAIN_CACHE_MAX_ENTRIES:]
+    if replaces is not None:
+        evicted.append(replaces)
+    if evicted:
+        cache.delete_many(evicted)
+    cache.set(SNAPSHOT_INDEX_KEY, index, None)
+
+
+def _touch(key):
+    cache = _cache()
+    index = cache.get(SNAPSHOT_INDEX_KEY, [])
+    if index and index[-1] == key:
+        return
+    if key in index:
+        index.remove(key)
+    index.append(key)
+    cache.set(SNAPSHOT_INDEX_KEY, index[-settings.LEDGER_CHAIN_CACHE_MAX_ENTRIES:], None)
@@ -8,11 +8,62 @@ This module contains consolidated helper functions for:
 - Balance calculations and blockchain traversal
 """
 
+from collections import deque, namedtuple
+from datetime import timedelta
+
+from django.db import IntegrityError, OperationalError, connection, transaction as db_transaction
+from django.conf import settings
+from django.db.models import BinaryField, Exists, F, OuterRef, Prefetch, Subquery
+from django.db.models.functions import Substr
 from django.utils import timezone
-from home.models import Block, Transaction, Mempool, Blockchain
+from home.models import Block, BlockMerkleTree, Transaction, Mempool, Blockchain
+from core.archive import find_archived_block, iter_archived_blocks, read_archived_blocks
+from core.balances import apply_block_to_balances
+from core.checkpoints import checkpoint_if_due
+from core.directory import AUTO_MINER, pick_miner
+from core.idempotency import (
+    find_used_idempotency_keys,
+    is_valid_idempotency_key,
+    remember_idempotency_keys
+)
+from core.validation import validate_block_candidate
+from core.merkle import (
+    HASH_SIZE,
+    block_header_hash,
+    encode_merkle_tree,
+    merkle_levels,
+    merkle_proof,
+    merkle_proof_offsets,
+    merkle_root,
+    transaction_leaf
+)
+from core.payloads import decode_block_payload, encode_block_payload
+from core.events import (
+    EVENT_BLOCK,
+    EVENT_MEMPOOL_ADD,
+    EVENT_MEMPOOL_REMOVE,
+    publish_event,
+    publish_events
+)
+
+
+MiningResult = namedtuple('MiningResult', ['block', 'mined_ids', 'skipped_ids', 'rejected'])
+
+SubmissionResult = namedtuple('SubmissionResult', ['txids', 'evicted'])
+
+MEMPOOL_PRIORITIES = ('amount', 'age', 'fairness')
 
+MEMPOOL_EVICTION_POLICIES = ('lowest_priority', 'oldest')
 
-def create_pending_transaction(sender, receiver, amount, mempool):
+LEAF_FIELDS = ('txid', 'sendAddr', 'receiveAddr', 'amount', 'transaction_timestamp')
+
+# Transaction.amount is an IntegerField
+MAX_TRANSACTION_AMOUNT = 2 ** 31 - 1
+
+FAIRNESS_MAX_DEPTH = 64
+
+
+def create_pending_transaction(sender, receiver, amount, mempool, idempotency_key=None):
     """
     Creates a pending transaction in the mempool/pending queue.
     
@@ -21,20 +72,366 @@ def create_pending_transaction(sender, receiver, amount, mempool):
         receiver: User receiving the transaction  
         amount: Transaction amount
         mempool: Mempool instance to add pending transaction to
+        idempotency_key: Optional client key; resubmitting a key the sender
+            already used returns the earlier transaction instead
         
     Returns:
-        Transaction: Created transaction instance with transaction_timestamp
+        Transaction: Created transaction instance with transaction_timestamp;
+        its evicted attribute lists the ids of transactions evicted from the
+        full mempool to make room, possibly including its own
     """
+    if idempotency_key is not None:
+        used = find_used_idempotency_keys(sender, [idempotency_key])
+        if used:
+            transaction = Transaction.objects.get(pk=used[idempotency_key])
+            transaction.evicted = []
+            return transaction
     transaction = Transaction(
         sendAddr=sender,
         receiveAddr=receiver,
         amount=amount,
-        mempool=mempool
+        mempool=mempool,
+        idempotency_key=idempotency_key
     )
-    transaction.save()
+    try:
+        with db_transaction.atomic():
+            transaction.save()
+            _adjust_mempool_counts({mempool.pk: 1})
+            publish_event(EVENT_MEMPOOL_ADD, {
+                'mempool': mempool.user_name,
+                'transactions': [serialize_transaction(transaction)],
+            })
+            transaction.evicted = []
+            capacity = settings.LEDGER_MEMPOOL_CAPACITY
+            if capacity:
+                # One read of the incremented count; eviction only runs when full
+                transaction_count = Mempool.objects.values_list(
+                    'transaction_count', flat=True).get(pk=mempool.pk)
+                if transaction_count > capacity:
+                    transaction.evicted = _evict_over_capacity(
+                        mempool.pk, mempool.user_name, transaction_count, capacity)
+    except IntegrityError:
+        if idempotency_key is None:
+            raise
+        # Another request inserted the same key first.
+        transaction = Transaction.objects.get(sendAddr=str(sender), idempotency_key=idempotency_key)
+        transaction.evicted = []
+    if idempotency_key is not None:
+        remember_idempotency_keys(sender, [idempotency_key])
     return transaction
 
 
+def delete_pending_transaction(txid):
+    """
+    Removes a pending transaction from its mempool.
+    
+    Args:
+        txid: Id of the transaction to remove
+        
+    Returns:
+        bool: True if a pending transaction was removed
+    """
+    with db_transaction.atomic():
+        transaction = Transaction.objects.filter(
+            pk=txid, mempool__isnull=False).select_related('mempool').first()
+        if transaction is None:
+            return False
+        transaction.delete()
+        _adjust_mempool_counts({transaction.mempool_id: -1})
+        publish_event(EVENT_MEMPOOL_REMOVE, {
+            'mempool': transaction.mempool.user_name,
+            'txids': [int(txid)],
+            'reason': 'deleted',
+        })
+    return True
+
+
+def _adjust_mempool_counts(changes):
+    """
+    Applies pending transaction count changes to mempools and bumps their versions.
+    
+    Args:
+        changes: Mapping mempool id -> number of transactions added (negative
+            for removed ones)
+    """
+    now = timezone.now()
+    for mempool_id, change in changes.items():
+        if mempool_id is not None and change:
+            Mempool.objects.filter(pk=mempool_id).update(
+                transaction_count=F('transaction_count') + change,
+                version=F('version') + 1,
+                modified=now
+            )
+
+
+def parse_transaction_amount(value):
+    """
+    Parses a submitted transaction amount.
+    
+    Args:
+        value: Raw amount as submitted (string or number)
+        
+    Returns:
+        int: The amount, or None if it is not a positive integer of at most
+        MAX_TRANSACTION_AMOUNT
+    """
+    if isinstance(value, bool):
+        return None
+    if isinstance(value, str):
+        value = value.strip()
+        if not value.isdecimal():
+            return None
+    elif not isinstance(value, int):
+        return None
+    amount = int(value)
+    return amount if 0 < amount <= MAX_TRANSACTION_AMOUNT else None
+
+
+def validate_transaction_batch(entries):
+    """
+    Validates a batch of submitted transactions in one pass.
+    
+    All target mempools are resolved with a single query.
+    
+    Args:
+        entries: List of dicts with receiver, amount and miner keys and an
+            optional idempotency_key; a miner of "auto" routes the entry to a
+            lightly loaded miner
+        
+    Returns:
+        tuple: (list of (receiver, amount, mempool) tuples, list of errors as
+        dicts with the entry index and a message); the first list is only
+        meaningful when there are no errors
+    """
+    # Route "pick for me" entries through the miner directory
+    chosen = {}
+    for index, entry in enumerate(entries):
+        if isinstance(entry, dict) and entry.get('miner') == AUTO_MINER:
+            chosen[index] = pick_miner()
+    miner_names = {
+        entry.get('miner') for entry in entries
+        if isinstance(entry, dict) and isinstance(entry.get('miner'), str)
+    } | set(chosen.values())
+    mempools = {}
+    for mempool in Mempool.objects.filter(user_name__in=miner_names).order_by('pk'):
+        mempools.setdefault(mempool.user_name, mempool)
+    
+    valid = []
+    errors = []
+    for index, entry in enumerate(entries):
+        if not isinstance(entry, dict):
+            errors.append({'index': index, 'error': 'Expected an object.'})
+            continue
+        receiver = entry.get('receiver')
+        amount = parse_transaction_amount(entry.get('amount'))
+        mempool = mempools.get(chosen.get(index, entry.get('miner')))
+        if not isinstance(receiver, str) or not receiver.strip() or len(receiver) > 200:
+            errors.append({'index': index, 'error': 'Invalid receiver.'})
+        elif amount is None:
+            errors.append({'index': index, 'error': 'Amount must be a positive integer.'})
+        elif mempool is None:
+            errors.append({'index': index, 'error': 'Unknown miner.'})
+        elif 'idempotency_key' in entry and not is_valid_idempotency_key(entry['idempotency_key']):
+            errors.append({'index': index, 'error': 'Invalid idempotency key.'})
+        else:
+            valid.append((receiver.strip(), amount, mempool))
+    return valid, errors
+
+
+def create_pending_transactions(sender, entries, idempotency_keys=None):
+    """
+    Bulk inserts pending transactions, one bulk insert per target mempool.
+    
+    Args:
+        sender: User sending the transactions
+        entries: List of (receiver, amount, mempool) tuples
+        idempotency_keys: Optional list of client keys (or None) in the order
+            of entries; entries whose key the sender already used, earlier or
+            in the same batch, are not inserted again
+        
+    Returns:
+        SubmissionResult: The assigned transaction ids, in the order of
+        entries (a reused key returns the id of the transaction first created
+        with it), and the ids of transactions evicted from full mempools to
+        make room, possibly including some of the new ones
+    """
+    keys = idempotency_keys or [None] * len(entries)
+    try:
+        return _insert_pending_transactions(sender, entries, keys, check_database=False)
+    except IntegrityError:
+        if not any(keys):
+            raise
+        # A concurrent submission used one of the keys first.
+        return _insert_pending_transactions(sender, entries, keys, check_database=True)
+
+
+def _insert_pending_transactions(sender, entries, keys, check_database):
+    used = find_used_idempotency_keys(sender, keys, check_database) if any(keys) else {}
+    timestamp = calculate_transaction_timestamp()
+    by_mempool = {}
+    first_use = {}
+    replayed = []
+    for position, ((receiver, amount, mempool), key) in enumerate(zip(entries, keys)):
+        if key is not None and (key in used or key in first_use):
+            replayed.append((position, key))
+            continue
+        if key is not None:
+            first_use[key] = position
+        by_mempool.setdefault(mempool.pk, []).append((position, Transaction(
+            sendAddr=str(sender),
+            receiveAddr=receiver,
+            amount=amount,
+            mempool=mempool,
+            transaction_timestamp=timestamp,
+            idempotency_key=key
+        )))
+    
+    txids = [None] * len(entries)
+    with db_transaction.atomic():
+        for mempool_id, batch in by_mempool.items():
+            transactions = [transaction for _, transaction in batch]
+            Transaction.objects.bulk_create(transactions, batch_size=500)
+            if not connection.features.can_return_rows_from_bulk_insert:
+                # Backends that cannot return primary keys from a bulk insert
+                # assign them in insertion order, so read them back in order.
+                assigned = Transaction.objects.filter(
+                    mempool_id=mempool_id,
+                    sendAddr=str(sender),
+                    transaction_timestamp=timestamp
+                ).order_by('-txid').values_list('txid', flat=True)[:len(transactions)]
+                for transaction, txid in zip(transactions, reversed(list(assigned))):
+                    transaction.txid = txid
+            for position, transaction in batch:
+                txids[position] = transaction.txid
+        _adjust_mempool_counts({mempool_id: len(batch) for mempool_id, batch in by_mempool.items()})
+        publish_events(
+            (EVENT_MEMPOOL_ADD, {
+                'mempool': batch[0][1].mempool.user_name,
+                'transactions': [serialize_transaction(transaction) for _, transaction in batch],
+            })
+            for batch in by_mempool.values()
+        )
+        evicted = enforce_mempool_capacity(list(by_mempool))
+    for position, key in replayed:
+        txids[position] = used[key] if key in used else txids[first_use[key]]
+    remember_idempotency_keys(sender, first_use)
+    return SubmissionResult(txids, evicted)
+
+
+def eviction_order(transactions, policy=None):
+    """
+    Orders pending transactions by which to evict first from a full mempool.
+    
+    - lowest_priority: smallest amounts first, the newest of equal amounts
+      first (the reverse of the amount priority)
+    - oldest: oldest transactions first
+    
+    Both orderings are served by the same (mempool, ...) indexes as
+    order_by_priority.
+    
+    Args:
+        transactions: QuerySet of pending transactions of one mempool
+        policy: One of MEMPOOL_EVICTION_POLICIES, None for LEDGER_MEMPOOL_EVICTION
+        
+    Returns:
+        QuerySet: Ordered transactions
+    """
+    policy = policy or settings.LEDGER_MEMPOOL_EVICTION
+    if policy == 'lowest_priority':
+        return transactions.order_by('amount', '-txid')
+    if policy == 'oldest':
+        return transactions.order_by('transaction_timestamp', 'txid')
+    raise ValueError('Unknown mempool eviction policy: %s' % policy)
+
+
+def enforce_mempool_capacity(mempool_ids):
+    """
+    Evicts pending transactions from mempools holding more than LEDGER_MEMPOOL_CAPACITY.
+    
+    Called inside the transaction that inserted into the mempools; the count
+    update of the insert holds the mempool rows, so concurrent inserts into
+    the same mempool evict one after the other.
+    
+    Args:
+        mempool_ids: Ids of the mempools that were just added to
+        
+    Returns:
+        list: Ids of the evicted transactions
+    """
+    capacity = settings.LEDGER_MEMPOOL_CAPACITY
+    if not capacity:
+        return []
+    evicted = []
+    full = Mempool.objects.filter(
+        pk__in=mempool_ids, transaction_count__gt=capacity
+    ).values_list('pk', 'user_name', 'transaction_count')
+    for mempool_id, user_name, transaction_count in full:
+        evicted.extend(_evict_over_capacity(mempool_id, user_name, transaction_count, capacity))
+    return evicted
+
+
+def _evict_over_capacity(mempool_id, user_name, transaction_count, capacity):
+    rows = list(
+        eviction_order(Transaction.objects.filter(mempool_id=mempool_id))
+        .values_list('txid', 'sendAddr')[:transaction_count - capacity]
+    )
+    txids = [txid for txid, _ in rows]
+    deleted, _ = Transaction.objects.filter(txid__in=txids, mempool_id=mempool_id).delete()
+    _adjust_mempool_counts({mempool_id: -deleted})
+    publish_event(EVENT_MEMPOOL_REMOVE, {
+        'mempool': user_name,
+        'txids': txids,
+        'reason': 'evicted',
+        'senders': {str(txid): sender for txid, sender in rows},
+    })
+    return txids
+
+
+def expire_pending_transactions(ttl=None, batch_size=None, now=None):
+    """
+    Deletes pending transactions that waited longer than the TTL, in batches.
+    
+    Each mempool is swept through its (mempool, transaction_timestamp) index,
+    batch_size transactions per delete statement and transaction.
+    
+    Args:
+        ttl: Maximum age in seconds, None for LEDGER_MEMPOOL_TTL
+        batch_size: Transactions deleted per batch, None for LEDGER_MEMPOOL_SWEEP_BATCH
+        now: Reference time, None for the current time
+        
+    Returns:
+        int: Number of expired transactions
+    """
+    ttl = settings.LEDGER_MEMPOOL_TTL if ttl is None else ttl
+    if not ttl:
+        return 0
+    batch_size = batch_size or settings.LEDGER_MEMPOOL_SWEEP_BATCH
+    cutoff = (now or timezone.now()) - timedelta(seconds=ttl)
+    expired = 0
+    mempools = Mempool.objects.filter(transaction_count__gt=0).values_list('pk', 'user_name')
+    for mempool_id, user_name in mempools:
+        while True:
+            with db_transaction.atomic():
+                txids = list(
+                    Transaction.objects.filter(
+                        mempool_id=mempool_id, transaction_timestamp__lt=cutoff
+                    ).order_by('transaction_timestamp', 'txid').values_list('txid', flat=True)[:batch_size]
+                )
+                if not txids:
+                    break
+                deleted, _ = Transaction.objects.filter(txid__in=txids, mempool_id=mempool_id).delete()
+                _adjust_mempool_counts({mempool_id: -deleted})
+                publish_event(EVENT_MEMPOOL_REMOVE, {
+                    'mempool': user_name,
+                    'txids': txids,
+                    'reason': 'expired',
+                })
+            expired += deleted
+            if len(txids) < batch_size:
+                break
+    return expired
+
+
 def validate_mining_request(post_data):
     """
     Validates if mining request contains valid transaction selections for mempool processing.
@@ -81,11 +478,282 @@ def create_or_get_blockchain(user):
             latest=genesis_block
         )
         blockchain.save()
+        
+        genesis_block.chain = blockchain
+        genesis_block.merkle_root = merkle_root([])
+        genesis_block.header_hash = block_header_hash(
+            '', genesis_block.merkle_root, 0, genesis_block.transaction_timestamp)
+        genesis_block.payload = encode_block_payload(serialize_block(genesis_block, []))
+        Block.objects.filter(pk=genesis_block.pk).update(
+            chain=blockchain,
+            merkle_root=genesis_block.merkle_root,
+            header_hash=genesis_block.header_hash,
+            payload=genesis_block.payload
+        )
         return blockchain, True
     else:
         return existing_chain[0], False
 
 
+def normalize_transaction_ids(transaction_ids):
+    """
+    Converts raw transaction ids (e.g. parsed from POST keys) to integers.
+    
+    Args:
+        transaction_ids: Iterable of transaction ids as ints or strings
+        
+    Returns:
+        tuple: (list of unique integer ids in input order, list of unparseable ids)
+    """
+    valid_ids = []
+    invalid_ids = []
+    seen = set()
+    for tx_id in transaction_ids:
+        try:
+            tx_id = int(tx_id)
+        except (TypeError, ValueError):
+            invalid_ids.append(tx_id)
+            continue
+        if tx_id not in seen:
+            seen.add(tx_id)
+            valid_ids.append(tx_id)
+    return valid_ids, invalid_ids
+
+
+class ChainTipMoved(Exception):
+    """Raised when another miner advanced the chain tip while a block was being mined."""
+
+
+def bulk_mine_transactions(blockchain, selected_transaction_ids):
+    """
+    Mines selected pending transactions into a new block using set-based statements.
+    
+    The whole selection is claimed from the mempool with a single conditional
+    UPDATE inside one atomic unit, so the number of queries does not depend on
+    the block size and a failure leaves no half-mined block behind.
+    
+    Safe to run from parallel workers: transactions are claimed only while
+    still unmined, so concurrent miners take disjoint sets, and the chain tip
+    is locked before it is read and advanced with a compare-and-swap. A miner
+    that loses a race on the tip retries against the new tip.
+    
+    Args:
+        blockchain: Blockchain instance to add block to
+        selected_transaction_ids: List of transaction IDs to mine from mempool
+        
+    Returns:
+        MiningResult: (block, mined_ids, skipped_ids, rejected) where skipped_ids
+        holds the ids that were missing, malformed or already mined, and
+        rejected maps the ids that failed validation to the reason; rejected
+        transactions are dropped from the mempool
+    """
+    tx_ids, skipped_ids = normalize_transaction_ids(selected_transaction_ids)
+    
+    for attempt in range(settings.LEDGER_MINING_RETRIES):
+        try:
+            new_block, mined_ids, rejected = _mine_block(blockchain, tx_ids)
+            break
+        except (ChainTipMoved, IntegrityError, OperationalError) as error:
+            if isinstance(error, OperationalError) and 'locked' not in str(error):
+                raise
+            if attempt == settings.LEDGER_MINING_RETRIES - 1:
+                raise
+    
+    blockchain.latest = new_block
+    mined = set(mined_ids)
+    skipped_ids.extend(tx_id for tx_id in tx_ids if tx_id not in mined and tx_id not in rejected)
+    return MiningResult(new_block, mined_ids, skipped_ids, rejected)
+
+
+def _lock_chain_tip(blockchain):
+    """
+    Locks a blockchain row for the rest of the transaction and returns its tip.
+    """
+    if connection.features.has_select_for_update:
+        locked = Blockchain.objects.select_for_update().get(pk=blockchain.pk)
+    else:
+        # SQLite has no row locks. A write as the first statement takes the
+        # database write lock up front (waiting for the busy timeout), so the
+        # tip read below cannot be overtaken by another miner.
+        Blockchain.objects.filter(pk=blockchain.pk).update(latest=F('latest'))
+        locked = Blockchain.objects.get(pk=blockchain.pk)
+    return Block.objects.get(pk=locked.latest_id)
+
+
+def _mine_block(blockchain, tx_ids):
+    with db_transaction.atomic():
+        # Create new block on top of the current tip
+        latest_block = _lock_chain_tip(blockchain)
+        new_block = Block(
+            previous=latest_block,
+            chain=blockchain,
+            height=latest_block.height + 1
+        )
+        new_block.save()
+        
+        # Validate the candidate as a whole and drop what cannot be mined
+        candidates = list(
+            Transaction.objects.filter(txid__in=tx_ids, block__isnull=True)
+            .values_list('txid', 'sendAddr', 'amount', 'mempool')
+        )
+        accepted, rejected = validate_block_candidate(
+            [(txid, sender, amount) for txid, sender, amount, _ in candidates],
+            lock=True
+        )
+        dropped = []
+        if rejected:
+            dropped = list(
+                Transaction.objects.select_for_update()
+                .filter(txid__in=list(rejected), block__isnull=True)
+                .values_list('txid', flat=True)
+            )
+            Transaction.objects.filter(txid__in=dropped).delete()
+        
+        # Claim every accepted transaction of the selection in one statement
+        Transaction.objects.filter(
+            txid__in=accepted, block__isnull=True
+        ).update(mempool=None, block=new_block)
+        rows = list(
+            Transaction.objects.filter(block=new_block).order_by('txid')
+            .values_list(*LEAF_FIELDS, named=True)
+        )
+        mined_ids = [row.txid for row in rows]
+        
+        # Only the rows this block claimed or dropped left their mempool here;
+        # candidates a concurrent miner took first are counted by that miner
+        mempool_of = {txid: mempool_id for txid, _, _, mempool_id in candidates}
+        removed = {}
+        for txid in mined_ids + dropped:
+            mempool_id = mempool_of[txid]
+            removed[mempool_id] = removed.get(mempool_id, 0) - 1
+        _adjust_mempool_counts(removed)
+        
+        # Seal the block header and materialize its payload once, at mining time
+        new_block.transaction_count = len(mined_ids)
+        levels = merkle_levels([transaction_leaf(*row) for row in rows])
+        new_block.merkle_root = levels[-1][0] if levels else merkle_root([])
+        if levels:
+            BlockMerkleTree.objects.create(block=new_block, levels=encode_merkle_tree(levels))
+        new_block.header_hash = block_header_hash(
+            latest_block.header_hash,
+            new_block.merkle_root,
+            new_block.height,
+            new_block.transaction_timestamp
+        )
+        new_block.payload = encode_block_payload(serialize_block(new_block, rows))
+        Block.objects.filter(pk=new_block.pk).update(
+            transaction_count=new_block.transaction_count,
+            merkle_root=new_block.merkle_root,
+            header_hash=new_block.header_hash,
+            payload=new_block.payload
+        )
+        
+        # Fold the confirmed transactions into the balance index
+        if mined_ids:
+            apply_block_to_balances(new_block)
+        checkpoint_if_due(blockchain, new_block)
+        
+        # Advance the blockchain latest pointer only if nobody else did
+        advanced = Blockchain.objects.filter(
+            pk=blockchain.pk, latest=latest_block
+        ).update(latest=new_block)
+        if advanced != 1:
+            raise ChainTipMoved()
+        
+        events = [
+            (EVENT_MEMPOOL_REMOVE, {'mempool': None, 'txids': mined_ids, 'reason': 'mined'}),
+            (EVENT_BLOCK, serialize_block_header(new_block)),
+        ]
+        if rejected:
+            events.insert(0, (EVENT_MEMPOOL_REMOVE, {
+                'mempool': None,
+                'txids': sorted(rejected),
+                'reason': 'rejected',
+                'rejections': {str(txid): reason for txid, reason in rejected.items()},
+            }))
+        publish_events(events)
+    return new_block, mined_ids, rejected
+
+
+def get_block_leaves(block):
+    """
+    Computes the Merkle leaves of a block's transactions.
+    
+    Args:
+        block: Block whose transactions to hash
+        
+    Returns:
+        list: (txid, leaf hash) tuples ordered by txid
+    """
+    rows = Transaction.objects.filter(block=block).order_by('txid').values_list(*LEAF_FIELDS)
+    return [(row[0], transaction_leaf(*row)) for row in rows]
+
+
+def _previous_header_hash(block):
+    if block.previous_id is None:
+        return ''
+    previous = Block.objects.filter(pk=block.previous_id).values_list('header_hash', flat=True).first()
+    if previous is None:
+        # The predecessor of the oldest block in the database may be archived
+        archived = find_archived_block(block.previous_id)
+        previous = archived.header_hash if archived is not None else ''
+    return previous
+
+
+def get_inclusion_proof(txid):
+    """
+    Builds a Merkle inclusion proof for a confirmed transaction.
+    
+    The proof hashes are sliced out of the Merkle tree stored at mining time;
+    only blocks mined before trees were stored are re-hashed.
+    
+    Args:
+        txid: Id of the transaction to prove
+        
+    Returns:
+        dict: Leaf hash, proof steps and the block header fields needed to
+        verify them and recompute the header hash, or None if the
+        transaction is not in a block
+    """
+    transaction = Transaction.objects.filter(pk=txid, block__isnull=False).select_related(
+        'block').defer('block__payload').first()
+    if transaction is None:
+        return None
+    block = transaction.block
+    index = Transaction.objects.filter(block=block, txid__lt=transaction.txid).count()
+    stored = None
+    # Blocks with a stored tree were mined with an accurate transaction_count
+    if index < block.transaction_count:
+        leaf_offset, steps = merkle_proof_offsets(block.transaction_count, index)
+        # Substr positions are 1-based
+        slices = {'leaf': Substr('levels', leaf_offset + 1, HASH_SIZE, output_field=BinaryField())}
+        for number, (offset, _) in enumerate(steps):
+            slices['step_%d' % number] = Substr('levels', offset + 1, HASH_SIZE, output_field=BinaryField())
+        stored = BlockMerkleTree.objects.filter(block=block).annotate(**slices).values(*slices).first()
+    if stored is not None:
+        leaf = bytes(stored['leaf']).hex()
+        proof = [
+            {'hash': bytes(stored['step_%d' % number]).hex(), 'position': position}
+            for number, (_, position) in enumerate(steps)
+        ]
+    else:
+        leaves = [leaf for _, leaf in get_block_leaves(block)]
+        leaf = leaves[index]
+        proof = merkle_proof(leaves, index)
+    return {
+        'txid': transaction.txid,
+        'blockid': block.blockid,
+        'height': block.height,
+        'previous_header_hash': _previous_header_hash(block),
+        'transaction_timestamp': block.transaction_timestamp.isoformat(),
+        'header_hash': block.header_hash,
+        'merkle_root': block.merkle_root,
+        'leaf': leaf,
+        'index': index,
+        'proof': proof,
+    }
+
+
 def mine_transactions_to_block(blockchain, selected_transaction_ids):
     """
     Mines selected pending transactions from mempool into a new block.
@@ -97,73 +765,476 @@ def mine_transactions_to_block(blockchain, selected_transaction_ids):
     Returns:
         Block: Newly created block containing transactions with transaction_timestamp
     """
-    # Create new block with transaction_timestamp
-    latest_block = blockchain.latest
-    new_block = Block(previous=latest_block)
-    new_block.save()
+    return bulk_mine_transactions(blockchain, selected_transaction_ids).block
+
+
+def get_chain_blocks(blockchain, start_height=None, end_height=None):
+    """
+    Loads blocks of a blockchain by height range with their transactions prefetched.
     
-    # Update blockchain latest pointer
-    blockchain.latest = new_block
-    blockchain.save()
+    Runs two queries regardless of how many blocks fall inside the range.
+    Archived heights are read from the chain's archive.
     
-    # Move pending transactions from mempool to block
-    for tx_id in selected_transaction_ids:
-        try:
-            transaction = Transaction.objects.filter(txid=tx_id)[0]
-            transaction.mempool = None
-            transaction.block = new_block
-            transaction.save()
-        except (IndexError, Transaction.DoesNotExist):
-            continue
-            
-    return new_block
+    Args:
+        blockchain: Blockchain instance to read
+        start_height: First height to include, None for the genesis block
+        end_height: Last height to include, None for the chain tip
+        
+    Returns:
+        list: Blocks ordered by height, each with a transaction_list attribute
+    """
+    archived = read_archived_blocks(blockchain, start_height, end_height)
+    blocks = Block.objects.filter(chain=blockchain)
+    if start_height is not None:
+        blocks = blocks.filter(height__gte=start_height)
+    if end_height is not None:
+        blocks = blocks.filter(height__lte=end_height)
+    return archived + list(_with_transactions(blocks).order_by('height'))
 
 
-def build_blockchain_list(blockchain):
+def get_latest_blocks(blockchain, count, before_height=None):
+    """
+    Loads the latest blocks of a blockchain for paging from the tip backwards.
+    
+    Args:
+        blockchain: Blockchain instance to read
+        count: Maximum number of blocks to return
+        before_height: Only return blocks below this height, None to start at the tip
+        
+    Returns:
+        list: Up to count blocks ordered by height, each with a transaction_list attribute
+    """
+    blocks = Block.objects.filter(chain=blockchain)
+    if before_height is not None:
+        blocks = blocks.filter(height__lt=before_height)
+    blocks = list(_with_transactions(blocks).order_by('-height')[:count])
+    blocks.reverse()
+    
+    # Continue into the archive when the database runs out of blocks
+    if len(blocks) < count and blockchain.archived_height is not None:
+        end_height = blockchain.archived_height
+        if before_height is not None:
+            end_height = min(end_height, before_height - 1)
+        start_height = end_height - (count - len(blocks)) + 1
+        blocks = read_archived_blocks(blockchain, max(start_height, 0), end_height) + blocks
+    return blocks
+
+
+def _with_transactions(blocks):
+    return blocks.defer('payload').prefetch_related(Prefetch(
+        'transaction_set',
+        queryset=Transaction.objects.order_by('txid'),
+        to_attr='transaction_list'
+    ))
+
+
+def _serialize_payload_rows(rows):
+    # Blocks mined before payloads existed are serialized from their rows.
+    missing = [blockid for blockid, payload in rows if payload is None]
+    serialized = {}
+    if missing:
+        for block in _with_transactions(Block.objects.filter(pk__in=missing)):
+            serialized[block.blockid] = serialize_block(block, block.transaction_list)
+    for blockid, payload in rows:
+        yield serialized[blockid] if payload is None else decode_block_payload(payload)
+
+
+def get_latest_serialized_blocks(blockchain, count, before_height=None):
+    """
+    Reads the latest serialized blocks of a blockchain from their stored payloads.
+    
+    Serves the same blocks as get_latest_blocks with a single query of
+    payload blobs instead of loading block and transaction rows.
+    
+    Args:
+        blockchain: Blockchain instance to read
+        count: Maximum number of blocks to return
+        before_height: Only return blocks below this height, None to start at the tip
+        
+    Returns:
+        list: Up to count serialize_block dictionaries ordered by height
+    """
+    blocks = Block.objects.filter(chain=blockchain)
+    if before_height is not None:
+        blocks = blocks.filter(height__lt=before_height)
+    rows = list(blocks.order_by('-height').values_list('blockid', 'payload')[:count])
+    rows.reverse()
+    serialized = list(_serialize_payload_rows(rows))
+    
+    # Continue into the archive when the database runs out of blocks
+    if len(serialized) < count and blockchain.archived_height is not None:
+        end_height = blockchain.archived_height
+        if before_height is not None:
+            end_height = min(end_height, before_height - 1)
+        start_height = end_height - (count - len(serialized)) + 1
+        archived = read_archived_blocks(blockchain, max(start_height, 0), end_height)
+        serialized = [
+            serialize_block(block, block.transaction_list) for block in archived
+        ] + serialized
+    return serialized
+
+
+def iter_serialized_blocks(blockchain, start_height=0, chunk_size=500):
+    """
+    Streams the serialized blocks of a blockchain in chain order.
+    
+    Archived blocks come from the chain's archive; the others are read from
+    their stored payloads, chunk_size blocks per query.
+    
+    Args:
+        blockchain: Blockchain instance to read
+        start_height: First block height to include
+        chunk_size: Number of payloads fetched per query
+        
+    Yields:
+        dict: One serialize_block dictionary per block, ordered by height
+    """
+    for block in iter_archived_blocks(blockchain, start_height):
+        yield serialize_block(block, block.transaction_list)
+    
+    blocks = Block.objects.filter(chain=blockchain).order_by('height')
+    next_height = start_height
+    while True:
+        rows = list(
+            blocks.filter(height__gte=next_height)
+            .values_list('height', 'blockid', 'payload')[:chunk_size]
+        )
+        yield from _serialize_payload_rows([(blockid, payload) for _, blockid, payload in rows])
+        if len(rows) < chunk_size:
+            return
+        next_height = rows[-1][0] + 1
+
+
+def serialize_mined_block(block):
+    """
+    Returns the serialized form of a block, from its payload when it has one.
+    
+    Args:
+        block: Block instance, typically fresh from mining
+        
+    Returns:
+        dict: The serialize_block dictionary
+    """
+    payload = block.__dict__.get('payload')
+    if payload is not None:
+        return decode_block_payload(payload)
+    transactions = Transaction.objects.filter(block=block).order_by('txid')
+    return serialize_block(block, transactions)
+
+
+def backfill_block_payloads(batch_size=500):
+    """
+    Materializes the payloads of blocks mined before payloads were stored.
+    
+    Args:
+        batch_size: Number of blocks serialized and updated per round
+        
+    Returns:
+        int: Number of blocks that got a payload
+    """
+    count = 0
+    last_blockid = 0
+    while True:
+        blocks = list(_with_transactions(
+            Block.objects.filter(payload__isnull=True, blockid__gt=last_blockid)
+        ).order_by('blockid')[:batch_size])
+        if not blocks:
+            return count
+        for block in blocks:
+            # Blocks older than the transaction_count column may still hold 0.
+            block.transaction_count = len(block.transaction_list)
+            block.payload = encode_block_payload(serialize_block(block, block.transaction_list))
+        Block.objects.bulk_update(blocks, ['transaction_count', 'payload'])
+        count += len(blocks)
+        last_blockid = blocks[-1].blockid
+
+
+def backfill_merkle_trees(batch_size=500):
+    """
+    Stores the Merkle trees of blocks mined before trees were stored.
+    
+    Args:
+        batch_size: Number of blocks hashed and inserted per round
+        
+    Returns:
+        int: Number of blocks that got a Merkle tree
+    """
+    count = 0
+    last_blockid = 0
+    while True:
+        blocks = list(Block.objects.filter(
+            Exists(Transaction.objects.filter(block=OuterRef('pk'))),
+            merkle_tree__isnull=True, blockid__gt=last_blockid
+        ).order_by('blockid').only('blockid')[:batch_size])
+        if not blocks:
+            return count
+        trees = []
+        for block in blocks:
+            levels = merkle_levels([leaf for _, leaf in get_block_leaves(block)])
+            trees.append(BlockMerkleTree(block=block, levels=encode_merkle_tree(levels)))
+        BlockMerkleTree.objects.bulk_create(trees)
+        count += len(trees)
+        last_blockid = blocks[-1].blockid
+
+
+def build_blockchain_list(blockchain, limit=None, before_height=None):
     """
     Builds ordered list of blocks in blockchain with their transactions and transaction_count.
     
     Args:
         blockchain: Blockchain instance to traverse
+        limit: Only include the latest limit blocks, None for the whole chain
+        before_height: With limit, page backwards from this height
         
     Returns:
         dict: Dictionary mapping blocks to their transactions
     """
-    chain_list = {}
-    current_block = blockchain.genesis
-    block_list = [current_block]
+    if limit is None:
+        end_height = None if before_height is None else before_height - 1
+        blocks = get_chain_blocks(blockchain, end_height=end_height)
+    else:
+        blocks = get_latest_blocks(blockchain, limit, before_height=before_height)
+    return {block: block.transaction_list for block in blocks}
+
+
+def serialize_transaction(transaction):
+    """
+    Serializes a transaction to a plain dictionary.
     
-    try:
-        while hasattr(current_block, 'next') and current_block.next:
-            current_block = current_block.next
-            block_list.append(current_block)
-    except Exception:
-        # Handle any traversal issues gracefully
-        pass
+    Args:
+        transaction: Transaction instance to serialize
+        
+    Returns:
+        dict: JSON-compatible transaction fields
+    """
+    return {
+        'txid': transaction.txid,
+        'sendAddr': str(transaction.sendAddr),
+        'receiveAddr': str(transaction.receiveAddr),
+        'amount': transaction.amount,
+        'transaction_timestamp': transaction.transaction_timestamp.isoformat(),
+    }
+
+
+def serialize_block(block, transactions):
+    """
+    Serializes a block and its transactions to a plain dictionary.
     
-    # Build transactions for each block
-    for block in block_list:
-        transactions = Transaction.objects.filter(block=block)[:]
-        chain_list[block] = transactions
+    Args:
+        block: Block instance to serialize
+        transactions: Iterable of the block's transactions
         
-    return chain_list
+    Returns:
+        dict: JSON-compatible block fields with a nested transactions list
+    """
+    serialized = serialize_block_header(block)
+    serialized['transactions'] = [serialize_transaction(tx) for tx in transactions]
+    return serialized
 
 
-def get_mempool_transactions(user):
+def serialize_block_header(block):
     """
-    Retrieves all pending transactions for a user's mempool/pending queue.
+    Serializes the fields of a block without its transactions.
+    
+    Args:
+        block: Block instance to serialize
+        
+    Returns:
+        dict: JSON-compatible block fields
+    """
+    return {
+        'blockid': block.blockid,
+        'height': block.height,
+        'previous': block.previous_id,
+        'transaction_count': block.transaction_count,
+        'transaction_timestamp': block.transaction_timestamp.isoformat(),
+        'merkle_root': block.merkle_root,
+        'header_hash': block.header_hash,
+    }
+
+
+def get_mempool_transactions(user, priority=None, limit=None):
+    """
+    Retrieves pending transactions for a user's mempool/pending queue.
     
     Args:
         user: User to get mempool pending transactions for
+        priority: One of MEMPOOL_PRIORITIES, None for LEDGER_MEMPOOL_PRIORITY
+        limit: Maximum number of transactions to return, None for all
         
     Returns:
-        QuerySet: Pending transactions in mempool
+        QuerySet or list: Pending transactions in mempool, highest priority
+        first; the fairness priority returns a list
     """
     try:
-        mempool = Mempool.objects.filter(user_name=user)[0]
-        return Transaction.objects.filter(mempool=mempool)
+        mempool = Mempool.objects.filter(user_name=user).order_by('pk')[0]
     except (IndexError, Mempool.DoesNotExist):
         return Transaction.objects.none()
+    return select_by_priority(Transaction.objects.filter(mempool=mempool), priority, limit)
+
+
+def order_by_priority(transactions, priority=None):
+    """
+    Orders pending transactions by mining priority.
+    
+    Every ordering is served by a (mempool, ...) index on Transaction, so
+    picking the best N transactions never sorts the whole mempool:
+    
+    - amount: largest amounts first
+    - age: oldest transactions first
+    
+    The fairness priority is not a single ordering; see fair_round_robin.
+    
+    Args:
+        transactions: QuerySet of pending transactions of one mempool
+        priority: 'amount' or 'age', None for LEDGER_MEMPOOL_PRIORITY
+        
+    Returns:
+        QuerySet: Ordered transactions
+    """
+    priority = priority or settings.LEDGER_MEMPOOL_PRIORITY
+    if priority == 'amount':
+        return transactions.order_by('-amount', 'txid')
+    if priority == 'age':
+        return transactions.order_by('transaction_timestamp', 'txid')
+    raise ValueError('Unknown mempool priority: %s' % priority)
+
+
+def _following_transactions(transactions, cursors, depth):
+    # For every cursor row, the next depth transactions of its sender: one
+    # correlated lookup on tx_mempool_sender_idx per rank, for all senders at once
+    later = transactions.filter(
+        sendAddr=OuterRef('sendAddr'),
+        transaction_timestamp__gte=OuterRef('transaction_timestamp')
+    ).exclude(
+        transaction_timestamp=OuterRef('transaction_timestamp'), txid__lte=OuterRef('txid')
+    ).order_by('transaction_timestamp', 'txid').values('txid')
+    columns = {'next_%d' % rank: Subquery(later[rank:rank + 1]) for rank in range(depth)}
+    rows = Transaction.objects.filter(pk__in=cursors).annotate(**columns).values_list('sendAddr', *columns)
+    following = {sender: [txid for txid in txids if txid is not None] for sender, *txids in rows}
+    loaded = transactions.in_bulk([txid for txids in following.values() for txid in txids])
+    return {
+        sender: [loaded[txid] for txid in txids if txid in loaded]
+        for sender, txids in following.items()
+    }
+
+
+def fair_round_robin(transactions, limit=None):
+    """
+    Takes pending transactions round-robin over their senders.
+    
+    Round n holds the n-th oldest transaction of every sender that has one,
+    ordered by age. One query reads the oldest transaction of every sender;
+    after that all senders advance together, several rounds per batch, with
+    a lookup per rank on the (mempool, sendAddr, transaction_timestamp)
+    index. The number of queries grows with the number of rounds, not with
+    the number of senders.
+    
+    Args:
+        transactions: QuerySet of pending transactions of one mempool
+        limit: Maximum number of transactions, None for all
+        
+    Yields:
+        Transaction: Transactions in fairness order
+    """
+    earlier = transactions.filter(
+        sendAddr=OuterRef('sendAddr'),
+        transaction_timestamp__lte=OuterRef('transaction_timestamp')
+    ).exclude(transaction_timestamp=OuterRef('transaction_timestamp'), txid__gte=OuterRef('txid'))
+    queues = {
+        transaction.sendAddr: deque([transaction])
+        for transaction in transactions.order_by().exclude(Exists(earlier))
+    }
+    last = {sender: queue[-1] for sender, queue in queues.items()}
+    exhausted = set()
+    taken = 0
+    while queues and (limit is None or taken < limit):
+        # Senders advance in lockstep, so their queues run out together
+        refill = [sender for sender, queue in queues.items() if not queue]
+        if refill:
+            # Looking past a sender's last transaction is a single index probe,
+            # so fetch as many rounds as the limit could still need
+            depth = FAIRNESS_MAX_DEPTH if limit is None else min(FAIRNESS_MAX_DEPTH, limit - taken)
+            following = _following_transactions(
+                transactions, [last[sender].txid for sender in refill], depth)
+            for sender in refill:
+                rows = following.get(sender, [])
+                if len(rows) < depth:
+                    exhausted.add(sender)
+                if rows:
+                    queues[sender].extend(rows)
+                    last[sender] = rows[-1]
+                else:
+                    del queues[sender]
+        current = sorted(
+            (queue.popleft() for queue in queues.values()),
+            key=lambda transaction: (transaction.transaction_timestamp, transaction.txid)
+        )
+        for transaction in current:
+            if limit is not None and taken >= limit:
+                return
+            yield transaction
+            taken += 1
+        for sender in [sender for sender, queue in queues.items() if not queue and sender in exhausted]:
+            del queues[sender]
+
+
+def select_by_priority(transactions, priority=None, limit=None):
+    """
+    Picks pending transactions in mining priority order.
+    
+    Args:
+        transactions: QuerySet of pending transactions of one mempool
+        priority: One of MEMPOOL_PRIORITIES, None for LEDGER_MEMPOOL_PRIORITY
+        limit: Maximum number of transactions, None for all
+        
+    Returns:
+        QuerySet or list: Ordered transactions; fairness returns a list
+    """
+    priority = priority or settings.LEDGER_MEMPOOL_PRIORITY
+    if priority == 'fairness':
+        return list(fair_round_robin(transactions, limit))
+    transactions = order_by_priority(transactions, priority)
+    return transactions if limit is None else transactions[:limit]
+
+
+def build_block_template(mempool, max_size=None, priority=None):
+    """
+    Picks the best pending transactions of a mempool for the next block.
+    
+    Args:
+        mempool: Mempool instance to pick transactions from
+        max_size: Maximum number of transactions, None for LEDGER_MAX_BLOCK_SIZE
+        priority: One of MEMPOOL_PRIORITIES, None for LEDGER_MEMPOOL_PRIORITY
+        
+    Returns:
+        list: Transaction ids in priority order
+    """
+    max_size = max_size or settings.LEDGER_MAX_BLOCK_SIZE
+    transactions = Transaction.objects.filter(mempool=mempool)
+    if (priority or settings.LEDGER_MEMPOOL_PRIORITY) == 'fairness':
+        return [transaction.txid for transaction in fair_round_robin(transactions, max_size)]
+    transactions = order_by_priority(transactions, priority)
+    return list(transactions.values_list('txid', flat=True)[:max_size])
+
+
+def mine_next_block(blockchain, mempool, max_size=None, priority=None):
+    """
+    Mines the next full block from the highest priority pending transactions.
+    
+    Args:
+        blockchain: Blockchain instance to add block to
+        mempool: Mempool instance to pick transactions from
+        max_size: Maximum number of transactions, None for LEDGER_MAX_BLOCK_SIZE
+        priority: One of MEMPOOL_PRIORITIES, None for LEDGER_MEMPOOL_PRIORITY
+        
+    Returns:
+        MiningResult: Result of mining the template, or None if the mempool is empty
+    """
+    template = build_block_template(mempool, max_size=max_size, priority=priority)
+    if not template:
+        return None
+    return bulk_mine_transactions(blockchain, template)
 
 
 def calculate_transaction_timestamp():
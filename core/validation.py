@@ -0,0 +1,159 @@
+"""
+Batch validation of block candidates.
+
+Before a selection of pending transactions is mined, the whole candidate set
+is checked in one pass: amounts must be positive, and no sender may spend more
+than it holds. A sender holds LEDGER_OPENING_BALANCE plus its confirmed net
+balance from the balance index; funds received in the same block do not count.
+Each sender's transactions are taken in txid order and accepted while the
+running total of its spend stays within its funds, so an overdraft rejects the
+offending transaction and every later one of the same sender.
+
+Balances are loaded with one query. The running totals are computed with
+array operations, with NumPy when it is installed and a pure Python loop
+otherwise. Candidates larger than LEDGER_VALIDATION_PARALLEL_THRESHOLD are
+partitioned by sender and checked in chunks on a process pool.
+"""
+
+import atexit
+from concurrent.futures import ProcessPoolExecutor
+
+from django.conf import settings
+from home.models import AccountBalance
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+REJECT_INVALID_AMOUNT = 'invalid_amount'
+REJECT_INSUFFICIENT_FUNDS = 'insufficient_funds'
+
+_pool = None
+
+
+def _check_chunk(chunk):
+    """
+    Checks one chunk of candidates; runs in worker processes.
+
+    Args:
+        chunk: (txids, sender_codes, amounts, funds) where funds is indexed by
+            sender code and every sender's transactions are in the chunk
+
+    Returns:
+        list: (txid, reason) pairs of the rejected transactions
+    """
+    txids, codes, amounts, funds = chunk
+    if numpy is not None:
+        return _check_numpy(txids, codes, amounts, funds)
+    return _check_python(txids, codes, amounts, funds)
+
+
+def _check_numpy(txids, codes, amounts, funds):
+    txids = numpy.asarray(txids, dtype=numpy.int64)
+    codes = numpy.asarray(codes, dtype=numpy.int64)
+    amounts = numpy.asarray(amounts, dtype=numpy.int64)
+    funds = numpy.asarray(funds, dtype=numpy.int64)
+
+    order = numpy.lexsort((txids, codes))
+    txids, codes, amounts = txids[order], codes[order], amounts[order]
+    invalid = amounts <= 0
+    spend = numpy.cumsum(numpy.where(invalid, 0, amounts))
+
+    # Running spend per sender: subtract the total of the senders before it.
+    # The totals never decrease, so a running maximum spreads each sender's
+    # offset over its rows.
+    starts = numpy.flatnonzero(numpy.r_[True, codes[1:] != codes[:-1]])
+    offsets = numpy.zeros_like(spend)
+    offsets[starts[1:]] = spend[starts[1:] - 1]
+    spend -= numpy.maximum.accumulate(offsets)
+
+    overdraft = ~invalid & (spend > funds[codes])
+    return (
+        [(int(txid), REJECT_INVALID_AMOUNT) for txid in txids[invalid]] +
+        [(int(txid), REJECT_INSUFFICIENT_FUNDS) for txid in txids[overdraft]]
+    )
+
+
+def _check_python(txids, codes, amounts, funds):
+    rejected = []
+    spent = {}
+    for txid, code, amount in sorted(zip(txids, codes, amounts), key=lambda row: (row[1], row[0])):
+        if amount <= 0:
+            rejected.append((txid, REJECT_INVALID_AMOUNT))
+            continue
+        spent[code] = spent.get(code, 0) + amount
+        if spent[code] > funds[code]:
+            rejected.append((txid, REJECT_INSUFFICIENT_FUNDS))
+    return rejected
+
+
+def _get_pool():
+    global _pool
+    if _pool is None:
+        _pool = ProcessPoolExecutor(max_workers=settings.LEDGER_VALIDATION_WORKERS)
+        atexit.register(_pool.shutdown)
+    return _pool
+
+
+def get_available_funds(addresses, lock=False):
+    """
+    Returns the funds each address may spend.
+
+    Args:
+        addresses: Iterable of addresses (usernames)
+        lock: Lock the balance rows for the rest of the transaction
+
+    Returns:
+        dict: Address to opening balance plus confirmed net balance
+    """
+    balances = AccountBalance.objects.filter(address__in=set(addresses))
+    if lock:
+        balances = balances.select_for_update()
+    funds = dict.fromkeys(addresses, settings.LEDGER_OPENING_BALANCE)
+    for address, net in balances.values_list('address', 'net'):
+        funds[address] += net
+    return funds
+
+
+def validate_block_candidate(transactions, lock=False):
+    """
+    Validates a block candidate as a whole.
+
+    Args:
+        transactions: Iterable of (txid, sender, amount) tuples
+        lock: Lock the senders' balance rows for the rest of the transaction,
+            when the accepted transactions are about to be mined
+
+    Returns:
+        tuple: (accepted txids in txid order, dict of rejected txid to reason)
+    """
+    transactions = list(transactions)
+    if not transactions:
+        return [], {}
+
+    senders = {}
+    codes = [senders.setdefault(str(sender), len(senders)) for _, sender, _ in transactions]
+    available = get_available_funds(senders, lock=lock)
+    funds = [available[sender] for sender in senders]
+    txids = [txid for txid, _, _ in transactions]
+    amounts = [amount for _, _, amount in transactions]
+
+    workers = settings.LEDGER_VALIDATION_WORKERS
+    if len(transactions) < settings.LEDGER_VALIDATION_PARALLEL_THRESHOLD or workers < 2:
+        rejected = _check_chunk((txids, codes, amounts, funds))
+    else:
+        # Partition by sender so every running total stays inside one chunk.
+        chunks = [([], [], [], funds) for _ in range(workers)]
+        for txid, code, amount in zip(txids, codes, amounts):
+            chunk = chunks[code % workers]
+            chunk[0].append(txid)
+            chunk[1].append(code)
+            chunk[2].append(amount)
+        rejected = []
+        for chunk_rejected in _get_pool().map(_check_chunk, [chunk for chunk in chunks if chunk[0]]):
+            rejected.extend(chunk_rejected)
+
+    rejected = dict(rejected)
+    accepted = sorted(txid for txid in txids if txid not in rejected)
+    return accepted, rejected
@@ -46,6 +46,8 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'core.middleware.MetricsMiddleware',
+    'core.middleware.ReplicaRoutingMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -87,6 +89,154 @@ DATABASES = {
 }
 
 
+# Cache
+# https://docs.djangoproject.com/en/3.2/topics/cache/
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+    'fragments': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'ledger-fragments',
+        'OPTIONS': {'MAX_ENTRIES': 5000},
+    }
+}
+
+
+# Ledger
+# Number of blocks shown per page on the mined chain page. The chain snapshot
+# cache keeps this many of the latest blocks per blockchain.
+
+LEDGER_MINED_PAGE_SIZE = 20
+
+# Cache alias, maximum number of cached snapshots (LRU) and timeout in seconds
+# (None keeps snapshots until evicted) of the chain snapshot cache.
+
+LEDGER_CHAIN_CACHE_ALIAS = 'default'
+LEDGER_CHAIN_CACHE_MAX_ENTRIES = 128
+LEDGER_CHAIN_CACHE_TIMEOUT = None
+
+# Rendered block cards of the mined page; bump the version whenever
+# templates/block_card.html changes.
+
+LEDGER_FRAGMENT_CACHE_ALIAS = 'fragments'
+LEDGER_BLOCK_FRAGMENT_VERSION = 1
+LEDGER_BLOCK_FRAGMENT_TIMEOUT = None
+
+# Maximum number of transactions accepted by one batch submission.
+
+LEDGER_MAX_TRANSACTION_BATCH = 10000
+
+# Idempotency keys: keys per generation of the in-process Bloom filter in
+# front of the duplicate check, and its false positive rate when full.
+
+LEDGER_IDEMPOTENCY_FILTER_CAPACITY = 100000
+LEDGER_IDEMPOTENCY_FILTER_ERROR_RATE = 0.001
+
+# Miner directory: seconds the load-ordered directory is cached, and number of
+# least loaded miners offered on the wallet page.
+
+LEDGER_DIRECTORY_TIMEOUT = 5
+LEDGER_DIRECTORY_LISTED = 5
+
+# Default ordering of pending transactions when building a block template
+# ('amount', 'age' or 'fairness') and the maximum transactions per block.
+
+LEDGER_MEMPOOL_PRIORITY = 'amount'
+LEDGER_MAX_BLOCK_SIZE = 1000
+
+# Bounded mempools: pending transactions per mempool (None for no limit) and
+# which to evict when an insert overflows it ('lowest_priority' or 'oldest').
+# Pending transactions older than LEDGER_MEMPOOL_TTL seconds (None keeps them)
+# are expired by `python manage.py expire_mempools` and by the block assembler
+# every LEDGER_MEMPOOL_SWEEP_INTERVAL seconds, LEDGER_MEMPOOL_SWEEP_BATCH rows
+# per delete.
+
+LEDGER_MEMPOOL_CAPACITY = 10000
+LEDGER_MEMPOOL_EVICTION = 'lowest_priority'
+LEDGER_MEMPOOL_TTL = 3 * 24 * 3600
+LEDGER_MEMPOOL_SWEEP_INTERVAL = 60.0
+LEDGER_MEMPOOL_SWEEP_BATCH = 1000
+
+# Concurrent mining: attempts when another miner advances the same chain tip
+# first, and SQLite write-ahead logging and busy timeout for parallel workers.
+
+LEDGER_MINING_RETRIES = 5
+LEDGER_SQLITE_WAL = True
+LEDGER_SQLITE_BUSY_TIMEOUT_MS = 20000
+
+# Block candidate validation: funds every address starts with, and candidate
+# size from which validation is split by sender across a process pool.
+
+LEDGER_OPENING_BALANCE = 1000
+LEDGER_VALIDATION_PARALLEL_THRESHOLD = 50000
+LEDGER_VALIDATION_WORKERS = 4
+
+# Blocks between per-chain state checkpoints (0 disables them).
+
+LEDGER_CHECKPOINT_INTERVAL = 100
+
+# Directory of the append-only segment files of archived blocks.
+
+LEDGER_ARCHIVE_DIR = BASE_DIR / 'archive'
+
+# Background block assembly: when enabled, mining views only enqueue jobs for
+# the run_block_assembler command, which also mines any mempool reaching the
+# threshold or left unassembled for the interval (seconds). Jobs still running
+# after the job timeout (seconds) are queued again.
+
+LEDGER_BACKGROUND_MINING = False
+LEDGER_ASSEMBLY_THRESHOLD = 100
+LEDGER_ASSEMBLY_INTERVAL = 30.0
+LEDGER_ASSEMBLY_POLL_INTERVAL = 1.0
+LEDGER_ASSEMBLY_WORKERS = 4
+LEDGER_ASSEMBLY_JOB_TIMEOUT = 600.0
+
+# Transactions buffered in total by the cursors of the global ledger stream,
+# shared between all chains being merged.
+
+LEDGER_STREAM_BUFFER = 10000
+
+# Server-sent event feed: seconds between polls of the event table (one poller
+# per process), seconds between keepalive comments, and the number of queued
+# events after which a slow subscriber is dropped and has to resume. Every
+# mempool change and block adds an event; run_block_assembler prunes the table
+# to the newest LEDGER_EVENT_RETENTION events (None keeps them all), so
+# deployments that mine inside requests must run it or prune_events themselves.
+
+LEDGER_EVENT_POLL_INTERVAL = 1.0
+LEDGER_EVENT_KEEPALIVE = 15
+LEDGER_EVENT_QUEUE_SIZE = 1000
+LEDGER_EVENT_RETENTION = 100000
+
+# Read replicas: every database alias besides default serves the ledger reads
+# of GET requests (core.routers). Set LEDGER_REPLICA_DB to a second SQLite file,
+# refreshed with `python manage.py sync_replica`, to try it locally. Replicas
+# more than LEDGER_REPLICA_MAX_LAG blocks behind the primary's chain tip are
+# skipped (checked every LEDGER_REPLICA_CHECK_INTERVAL seconds), and a client
+# reads from the primary for LEDGER_REPLICA_PIN_SECONDS after it writes.
+
+if os.environ.get('LEDGER_REPLICA_DB'):
+    DATABASES['replica'] = {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': os.environ['LEDGER_REPLICA_DB'],
+        'TEST': {'MIRROR': 'default'},
+    }
+
+DATABASE_ROUTERS = ['core.routers.ReplicaRouter']
+LEDGER_READ_REPLICAS = [alias for alias in DATABASES if alias != 'default']
+LEDGER_REPLICA_MAX_LAG = 0
+LEDGER_REPLICA_CHECK_INTERVAL = 1.0
+LEDGER_REPLICA_PIN_SECONDS = 5
+
+# Bearer token required to scrape /metrics. With the default of None the
+# endpoint only answers clients in INTERNAL_IPS, or anyone when DEBUG is on.
+
+LEDGER_METRICS_TOKEN = None
+INTERNAL_IPS = ['127.0.0.1', '::1']
+
+
 # Password validation
 # https://docs.djangoproject.com/en/3.2/ref/settings/#auth-password-validators
 
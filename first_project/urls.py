@@ -30,5 +30,19 @@ urlpatterns = [
     path('mine', home_views.mine, name='mine'),
     path('mining', home_views.mining, name='mining'),
     path('mined', home_views.mined, name='mined'),
-    path('delete/<pk>', home_views.deleteTransaction, name='deletetransaction')
+    path('delete/<pk>', home_views.deleteTransaction, name='deletetransaction'),
+    path('export', home_views.export, name='export'),
+    path('api/transactions/batch', home_views.submit_transactions, name='submit_transactions'),
+    path('api/mempool', home_views.mempool_transactions, name='mempool_transactions'),
+    path('api/chain', home_views.chain_blocks, name='chain_blocks'),
+    path('api/blocks/next', home_views.mine_next, name='mine_next'),
+    path('api/blocks/<int:blockid>', home_views.block_payload, name='block_payload'),
+    path('api/jobs/<int:job_id>', home_views.mining_job, name='mining_job'),
+    path('api/proof/<int:txid>', home_views.inclusion_proof, name='inclusion_proof'),
+    path('api/events', home_views.event_stream, name='event_stream'),
+    path('api/ledger', home_views.global_ledger, name='global_ledger'),
+    path('api/history/<str:address>', home_views.address_history, name='address_history'),
+    path('api/state/<int:height>', home_views.ledger_state, name='ledger_state'),
+    path('api/checkpoints', home_views.checkpoints, name='checkpoints'),
+    path('metrics', home_views.metrics, name='metrics')
 ]
@@ -4,3 +4,8 @@ from django.apps import AppConfig
 class HomeConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'home'
+
+    def ready(self):
+        from django.db.backends.signals import connection_created
+        from core.db import configure_sqlite
+        connection_created.connect(configure_sqlite, dispatch_uid='ledger_configure_sqlite')
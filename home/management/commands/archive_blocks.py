@@ -0,0 +1,31 @@
+from django.core.management.base import BaseCommand, CommandError
+from home.models import Blockchain
+from core.archive import archive_blocks
+
+
+class Command(BaseCommand):
+    help = 'Moves old blocks into the append-only archive and prunes their rows.'
+
+    def add_arguments(self, parser):
+        target = parser.add_mutually_exclusive_group(required=True)
+        target.add_argument('--below', type=int,
+                            help='Archive every block under this height.')
+        target.add_argument('--keep', type=int,
+                            help='Archive all but the latest KEEP blocks of each chain.')
+        parser.add_argument('--chain', help='Only archive the blockchain of this user.')
+
+    def handle(self, *args, **options):
+        limit = options['below'] if options['below'] is not None else options['keep']
+        if limit < 1:
+            raise CommandError('--below and --keep must be at least 1.')
+
+        blockchains = Blockchain.objects.select_related('latest').order_by('pk')
+        if options['chain']:
+            blockchains = blockchains.filter(user=options['chain'])
+        for blockchain in blockchains:
+            if options['below'] is not None:
+                below_height = options['below']
+            else:
+                below_height = blockchain.latest.height - options['keep'] + 1
+            archived = archive_blocks(blockchain, below_height)
+            self.stdout.write('%s: archived %d blocks' % (blockchain.user, archived))
@@ -0,0 +1,17 @@
+from django.core.management.base import BaseCommand
+from core.utils import backfill_block_payloads, backfill_merkle_trees
+
+
+class Command(BaseCommand):
+    help = 'Stores the serialized payload and Merkle tree of every block mined before they existed.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size', type=int, default=500,
+            help='Number of blocks serialized per round.')
+
+    def handle(self, *args, **options):
+        count = backfill_block_payloads(options['batch_size'])
+        self.stdout.write(self.style.SUCCESS('Stored payloads for %d blocks.' % count))
+        count = backfill_merkle_trees(options['batch_size'])
+        self.stdout.write(self.style.SUCCESS('Stored Merkle trees for %d blocks.' % count))
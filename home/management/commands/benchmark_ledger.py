@@ -0,0 +1,48 @@
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from core.benchmark import environment, run_benchmarks
+
+
+class Command(BaseCommand):
+    help = 'Benchmarks the core ledger operations on a throwaway SQLite database.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=10)
+        parser.add_argument('--mempool-size', type=int, default=1000)
+        parser.add_argument('--chain-length', type=int, default=100)
+        parser.add_argument('--transactions-per-block', type=int, default=50)
+        parser.add_argument('--format', choices=('text', 'json'), default='text')
+        parser.add_argument(
+            '--sqlite-file',
+            help='Throwaway SQLite file to benchmark on instead of an in-memory database.')
+
+    def handle(self, *args, **options):
+        if connection.vendor != 'sqlite':
+            raise CommandError('Benchmarks run on a throwaway SQLite database only.')
+        if min(options['users'], options['mempool_size'], options['chain_length'],
+               options['transactions_per_block']) < 1:
+            raise CommandError('Every scale parameter must be at least 1.')
+
+        if options['sqlite_file']:
+            connection.settings_dict.setdefault('TEST', {})['NAME'] = options['sqlite_file']
+        old_name = connection.creation.create_test_db(
+            verbosity=0, autoclobber=True, serialize=False)
+        try:
+            results = run_benchmarks(
+                users=options['users'],
+                mempool_size=options['mempool_size'],
+                chain_length=options['chain_length'],
+                transactions_per_block=options['transactions_per_block']
+            )
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+
+        if options['format'] == 'json':
+            self.stdout.write(json.dumps({'environment': environment(), 'results': results}, indent=2))
+            return
+        for result in results:
+            self.stdout.write('%-30s %10.4fs %8d queries %12d bytes  %s' % (
+                result['operation'], result['wall_time'], result['queries'],
+                result['peak_memory'], result['scale']))
@@ -0,0 +1,29 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from home.models import Blockchain
+from core.checkpoints import create_checkpoint
+
+
+class Command(BaseCommand):
+    help = 'Creates the missing state checkpoints of every blockchain.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--interval', type=int, default=settings.LEDGER_CHECKPOINT_INTERVAL,
+                            help='Blocks between checkpoints.')
+        parser.add_argument('--rebuild', action='store_true',
+                            help='Recompute existing checkpoints as well.')
+
+    def handle(self, *args, **options):
+        interval = options['interval']
+        if interval < 1:
+            raise CommandError('--interval must be at least 1.')
+
+        created = 0
+        for blockchain in Blockchain.objects.select_related('latest').order_by('pk'):
+            existing = set(blockchain.checkpoints.values_list('height', flat=True))
+            # Ascending heights, so every checkpoint is built from the previous one.
+            for height in range(interval, blockchain.latest.height + 1, interval):
+                if options['rebuild'] or height not in existing:
+                    create_checkpoint(blockchain, height)
+                    created += 1
+        self.stdout.write(self.style.SUCCESS('Created %d checkpoints.' % created))
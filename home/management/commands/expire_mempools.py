@@ -0,0 +1,23 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from core.utils import expire_pending_transactions
+
+
+class Command(BaseCommand):
+    help = 'Deletes pending transactions older than the mempool TTL, in batches.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--ttl', type=int, default=settings.LEDGER_MEMPOOL_TTL,
+            help='Maximum age of a pending transaction in seconds.')
+        parser.add_argument(
+            '--batch-size', type=int, default=settings.LEDGER_MEMPOOL_SWEEP_BATCH,
+            help='Transactions deleted per statement.')
+
+    def handle(self, *args, **options):
+        if not options['ttl']:
+            raise CommandError('No mempool TTL is configured; pass --ttl.')
+        if options['batch_size'] < 1:
+            raise CommandError('--batch-size must be at least 1.')
+        expired = expire_pending_transactions(options['ttl'], options['batch_size'])
+        self.stdout.write(self.style.SUCCESS('Expired %d pending transactions.' % expired))
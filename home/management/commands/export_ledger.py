@@ -0,0 +1,28 @@
+from django.core.management.base import BaseCommand
+from home.models import Blockchain
+from core.export import EXPORT_FORMATS, export_ledger
+
+
+class Command(BaseCommand):
+    help = 'Streams blocks and their transactions in chain order as JSONL or CSV.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--format', choices=EXPORT_FORMATS, default='jsonl')
+        parser.add_argument(
+            '--from-height', type=int, default=0,
+            help='First block height to export, for resuming an interrupted export.')
+        parser.add_argument('--user', help='Only export the blockchain of this user.')
+        parser.add_argument('--output', help='File to write to instead of standard output.')
+
+    def handle(self, *args, **options):
+        blockchains = Blockchain.objects.order_by('pk')
+        if options['user']:
+            blockchains = blockchains.filter(user=options['user'])
+        chunks = export_ledger(blockchains.iterator(), options['format'], options['from_height'])
+
+        if options['output']:
+            with open(options['output'], 'w', newline='') as output:
+                output.writelines(chunks)
+        else:
+            for chunk in chunks:
+                self.stdout.write(chunk, ending='')
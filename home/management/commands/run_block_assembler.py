@@ -0,0 +1,95 @@
+import signal
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+from core.assembler import assemble_mempool, due_mempools, reclaim_stale_jobs
+from core.events import prune_events
+from core.utils import expire_pending_transactions
+
+
+def _assemble(mempool_id):
+    try:
+        return assemble_mempool(mempool_id)
+    finally:
+        # Pool threads open their own connections; do not leak them.
+        connections.close_all()
+
+
+class Command(BaseCommand):
+    help = 'Assembles blocks from every miner mempool in the background until stopped.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=settings.LEDGER_ASSEMBLY_WORKERS)
+        parser.add_argument('--threshold', type=int, default=settings.LEDGER_ASSEMBLY_THRESHOLD,
+                            help='Pending transactions that trigger a block immediately.')
+        parser.add_argument('--interval', type=float, default=settings.LEDGER_ASSEMBLY_INTERVAL,
+                            help='Seconds after which any non-empty mempool is assembled.')
+        parser.add_argument('--poll', type=float, default=settings.LEDGER_ASSEMBLY_POLL_INTERVAL,
+                            help='Seconds between checks for due mempools.')
+        parser.add_argument('--keep-events', type=int, default=settings.LEDGER_EVENT_RETENTION,
+                            help='Prune the event feed to this many events every round.')
+        parser.add_argument('--once', action='store_true',
+                            help='Run a single round and exit.')
+
+    def handle(self, *args, **options):
+        if options['workers'] < 1 or options['threshold'] < 1:
+            raise CommandError('--workers and --threshold must be at least 1.')
+
+        stopping = threading.Event()
+
+        def stop(signum, frame):
+            self.stdout.write('Finishing in-flight blocks before shutting down...')
+            stopping.set()
+
+        if not options['once']:
+            signal.signal(signal.SIGINT, stop)
+            signal.signal(signal.SIGTERM, stop)
+
+        last_assembled = {}
+        in_flight = {}
+        next_sweep = 0.0
+        with ThreadPoolExecutor(max_workers=options['workers']) as executor:
+            while not stopping.is_set():
+                for mempool_id, future in list(in_flight.items()):
+                    if future.done():
+                        del in_flight[mempool_id]
+                        self._report(mempool_id, future)
+
+                # Jobs of an assembler that died mid-round are run again.
+                reclaimed = reclaim_stale_jobs()
+                if reclaimed:
+                    self.stdout.write('Requeued %d stale mining jobs' % reclaimed)
+
+                # A mempool is assembled by at most one thread at a time.
+                for mempool_id in due_mempools(last_assembled, options['threshold'],
+                                               options['interval']):
+                    if mempool_id not in in_flight:
+                        last_assembled[mempool_id] = time.monotonic()
+                        in_flight[mempool_id] = executor.submit(_assemble, mempool_id)
+
+                if options['keep_events'] is not None:
+                    prune_events(options['keep_events'])
+                if settings.LEDGER_MEMPOOL_TTL and time.monotonic() >= next_sweep:
+                    expired = expire_pending_transactions()
+                    if expired:
+                        self.stdout.write('Expired %d pending transactions' % expired)
+                    next_sweep = time.monotonic() + settings.LEDGER_MEMPOOL_SWEEP_INTERVAL
+                if options['once']:
+                    break
+                stopping.wait(options['poll'])
+
+            for mempool_id, future in in_flight.items():
+                self._report(mempool_id, future)
+
+    def _report(self, mempool_id, future):
+        error = future.exception()
+        if error is not None:
+            self.stderr.write('Mempool %s: %s' % (mempool_id, error))
+            return
+        for block in future.result():
+            self.stdout.write('Mempool %s: mined block %s at height %s with %s transactions' % (
+                mempool_id, block.blockid, block.height, block.transaction_count))
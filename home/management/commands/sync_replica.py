@@ -0,0 +1,27 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from core.db import sync_sqlite_replica
+from core.routers import reset_replica_freshness
+
+
+class Command(BaseCommand):
+    help = 'Copies the primary SQLite database into the configured read replicas.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--database', action='append', dest='databases',
+            help='Replica alias to sync (repeatable); defaults to every LEDGER_READ_REPLICAS alias.')
+
+    def handle(self, *args, **options):
+        aliases = options['databases'] or settings.LEDGER_READ_REPLICAS
+        if not aliases:
+            raise CommandError('No read replicas are configured.')
+        for alias in aliases:
+            if alias not in settings.LEDGER_READ_REPLICAS:
+                raise CommandError('%s is not a read replica.' % alias)
+            try:
+                sync_sqlite_replica(alias)
+            except ValueError as error:
+                raise CommandError(str(error))
+            self.stdout.write(self.style.SUCCESS('Synced replica %s.' % alias))
+        reset_replica_freshness()
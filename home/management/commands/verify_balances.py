@@ -0,0 +1,24 @@
+from django.core.management.base import BaseCommand, CommandError
+from core.balances import rebuild_balance_index, verify_balance_index
+
+
+class Command(BaseCommand):
+    help = 'Compares the account balance index against a full recomputation.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--rebuild', action='store_true',
+            help='Rebuild the index from the confirmed transactions when it is inconsistent.')
+
+    def handle(self, *args, **options):
+        mismatches = verify_balance_index()
+        for mismatch in mismatches:
+            self.stdout.write('%(address)s: expected %(expected)s, indexed %(indexed)s' % mismatch)
+
+        if not mismatches:
+            self.stdout.write(self.style.SUCCESS('Balance index is consistent.'))
+        elif options['rebuild']:
+            count = rebuild_balance_index()
+            self.stdout.write(self.style.SUCCESS('Rebuilt balance index for %d addresses.' % count))
+        else:
+            raise CommandError('%d addresses have inconsistent balances.' % len(mismatches))
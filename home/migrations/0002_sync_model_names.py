@@ -0,0 +1,56 @@
+from django.db import migrations
+from django.db.models import Count
+
+
+def backfill_block_transaction_counts(apps, schema_editor):
+    """Sets every block's transaction_count to its number of mined transactions."""
+    Block = apps.get_model('home', 'Block')
+    Transaction = apps.get_model('home', 'Transaction')
+    counts = dict(
+        Transaction.objects.filter(block__isnull=False)
+        .values('block').annotate(count=Count('txid')).values_list('block', 'count')
+    )
+    blocks = list(Block.objects.only('blockid', 'transaction_count'))
+    for block in blocks:
+        block.transaction_count = counts.get(block.pk, 0)
+    Block.objects.bulk_update(blocks, ['transaction_count'], batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('home', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.RenameModel(
+            old_name='Memepool',
+            new_name='Mempool',
+        ),
+        migrations.RenameField(
+            model_name='mempool',
+            old_name='txcount',
+            new_name='transaction_count',
+        ),
+        migrations.RenameField(
+            model_name='block',
+            old_name='txcount',
+            new_name='transaction_count',
+        ),
+        migrations.RenameField(
+            model_name='block',
+            old_name='time_stamp',
+            new_name='transaction_timestamp',
+        ),
+        migrations.RenameField(
+            model_name='transaction',
+            old_name='time_stamp',
+            new_name='transaction_timestamp',
+        ),
+        migrations.RenameField(
+            model_name='transaction',
+            old_name='memepool',
+            new_name='mempool',
+        ),
+        migrations.RunPython(backfill_block_transaction_counts, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,44 @@
+# Generated by Django 4.2.30 on 2026-10-18 06:00
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def backfill_block_heights(apps, schema_editor):
+    """Walks every chain from its genesis block and records chain and height."""
+    Block = apps.get_model('home', 'Block')
+    Blockchain = apps.get_model('home', 'Blockchain')
+    next_by_previous = dict(
+        Block.objects.filter(previous__isnull=False).values_list('previous_id', 'blockid'))
+    for blockchain in Blockchain.objects.exclude(genesis__isnull=True):
+        height = 0
+        block_id = blockchain.genesis_id
+        while block_id is not None:
+            Block.objects.filter(pk=block_id).update(chain=blockchain.pk, height=height)
+            block_id = next_by_previous.get(block_id)
+            height += 1
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('home', '0002_sync_model_names'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='block',
+            name='chain',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='blocks', to='home.blockchain'),
+        ),
+        migrations.AddField(
+            model_name='block',
+            name='height',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.RunPython(backfill_block_heights, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='block',
+            constraint=models.UniqueConstraint(fields=('chain', 'height'), name='unique_block_height_per_chain'),
+        ),
+    ]
@@ -0,0 +1,45 @@
+# Generated by Django 4.2.30 on 2026-10-18 06:01
+
+from django.db import migrations, models
+import django.db.models.deletion
+from django.db.models import Max, Sum
+
+
+def backfill_account_balances(apps, schema_editor):
+    """Builds the balance index from every confirmed transaction."""
+    Transaction = apps.get_model('home', 'Transaction')
+    AccountBalance = apps.get_model('home', 'AccountBalance')
+    confirmed = Transaction.objects.filter(block__isnull=False)
+    balances = {}
+    for field, column in (('receiveAddr', 'credits'), ('sendAddr', 'debits')):
+        rows = confirmed.values(field).annotate(total=Sum('amount'), last_block=Max('block'))
+        for row in rows:
+            balance = balances.setdefault(
+                row[field], AccountBalance(address=row[field]))
+            setattr(balance, column, row['total'] or 0)
+            if balance.last_block_id is None or row['last_block'] > balance.last_block_id:
+                balance.last_block_id = row['last_block']
+    for balance in balances.values():
+        balance.net = balance.credits - balance.debits
+    AccountBalance.objects.bulk_create(balances.values(), batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('home', '0003_block_height'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AccountBalance',
+            fields=[
+                ('address', models.CharField(max_length=200, primary_key=True, serialize=False)),
+                ('credits', models.BigIntegerField(default=0)),
+                ('debits', models.BigIntegerField(default=0)),
+                ('net', models.BigIntegerField(default=0)),
+                ('last_block', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='home.block')),
+            ],
+        ),
+        migrations.RunPython(backfill_account_balances, migrations.RunPython.noop),
+    ]
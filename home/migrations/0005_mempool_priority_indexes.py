@@ -0,0 +1,25 @@
+# Generated by Django 4.2.30 on 2026-10-18 06:06
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('home', '0004_account_balance'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='transaction',
+            index=models.Index(fields=['mempool', '-amount', 'txid'], name='tx_mempool_amount_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='transaction',
+            index=models.Index(fields=['mempool', 'transaction_timestamp', 'txid'], name='tx_mempool_age_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='transaction',
+            index=models.Index(fields=['mempool', 'sendAddr', 'transaction_timestamp'], name='tx_mempool_sender_idx'),
+        ),
+    ]
@@ -0,0 +1,40 @@
+# Generated by Django 4.2.30 on 2026-10-18 06:07
+
+from django.db import migrations, models
+from core.merkle import block_header_hash, merkle_root, transaction_leaf
+
+
+def backfill_block_hashes(apps, schema_editor):
+    """Seals existing blocks chain by chain, from the genesis block upwards."""
+    Block = apps.get_model('home', 'Block')
+    Transaction = apps.get_model('home', 'Transaction')
+    for chain_id in Block.objects.exclude(chain__isnull=True).values_list('chain', flat=True).distinct():
+        previous_hash = ''
+        for block in Block.objects.filter(chain=chain_id).order_by('height'):
+            rows = Transaction.objects.filter(block=block).order_by('txid').values_list(
+                'txid', 'sendAddr', 'receiveAddr', 'amount', 'transaction_timestamp')
+            root = merkle_root([transaction_leaf(*row) for row in rows])
+            previous_hash = block_header_hash(
+                previous_hash, root, block.height, block.transaction_timestamp)
+            Block.objects.filter(pk=block.pk).update(merkle_root=root, header_hash=previous_hash)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('home', '0005_mempool_priority_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='block',
+            name='header_hash',
+            field=models.CharField(blank=True, default='', max_length=64),
+        ),
+        migrations.AddField(
+            model_name='block',
+            name='merkle_root',
+            field=models.CharField(blank=True, default='', max_length=64),
+        ),
+        migrations.RunPython(backfill_block_hashes, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,22 @@
+# Generated by Django 4.2.30 on 2026-10-18 06:08
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('home', '0006_block_hashes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='LedgerEvent',
+            fields=[
+                ('id', models.BigAutoField(primary_key=True, serialize=False)),
+                ('kind', models.CharField(max_length=32)),
+                ('payload', models.JSONField(default=dict)),
+                ('created', models.DateTimeField(auto_now_add=True)),
+            ],
+        ),
+    ]
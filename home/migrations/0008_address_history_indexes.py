@@ -0,0 +1,21 @@
+# Generated by Django 4.2.30 on 2026-10-18 06:10
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('home', '0007_ledger_event'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='transaction',
+            index=models.Index(fields=['sendAddr', '-txid'], name='tx_sender_history_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='transaction',
+            index=models.Index(fields=['receiveAddr', '-txid'], name='tx_receiver_history_idx'),
+        ),
+    ]
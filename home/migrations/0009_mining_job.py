@@ -0,0 +1,32 @@
+# Generated by Django 4.2.30 on 2026-10-18 06:15
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('home', '0008_address_history_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='MiningJob',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('transaction_ids', models.JSONField(blank=True, null=True)),
+                ('max_size', models.PositiveIntegerField(blank=True, null=True)),
+                ('priority', models.CharField(blank=True, default='', max_length=16)),
+                ('status', models.CharField(choices=[('pending', 'Pending'), ('running', 'Running'), ('done', 'Done'), ('failed', 'Failed')], default='pending', max_length=16)),
+                ('error', models.TextField(blank=True, default='')),
+                ('created', models.DateTimeField(auto_now_add=True)),
+                ('finished', models.DateTimeField(blank=True, null=True)),
+                ('block', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='home.block')),
+                ('mempool', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='mining_jobs', to='home.mempool')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['status', 'mempool'], name='mining_job_status_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,30 @@
+# Generated by Django 4.2.30 on 2026-10-18 06:19
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('home', '0009_mining_job'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='LedgerCheckpoint',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('height', models.PositiveIntegerField()),
+                ('state', models.BinaryField()),
+                ('address_count', models.PositiveIntegerField(default=0)),
+                ('created', models.DateTimeField(auto_now_add=True)),
+                ('block', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='home.block')),
+                ('chain', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='checkpoints', to='home.blockchain')),
+            ],
+        ),
+        migrations.AddConstraint(
+            model_name='ledgercheckpoint',
+            constraint=models.UniqueConstraint(fields=('chain', 'height'), name='unique_checkpoint_height_per_chain'),
+        ),
+    ]
@@ -0,0 +1,24 @@
+# Generated by Django 4.2.30 on 2026-10-18 06:22
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('home', '0010_ledger_checkpoint'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='blockchain',
+            name='archived_height',
+            field=models.PositiveIntegerField(blank=True, null=True),
+        ),
+        migrations.AlterField(
+            model_name='block',
+            name='previous',
+            field=models.OneToOneField(blank=True, db_constraint=False, null=True, on_delete=django.db.models.deletion.DO_NOTHING, related_name='next', to='home.block'),
+        ),
+    ]
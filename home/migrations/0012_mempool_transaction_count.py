@@ -0,0 +1,34 @@
+# Generated by Django 4.2.30 on 2026-10-18 06:24
+
+from django.db import migrations, models
+from django.db.models import Count
+
+
+def backfill_transaction_counts(apps, schema_editor):
+    """Sets every mempool's transaction_count to its number of pending transactions."""
+    Mempool = apps.get_model('home', 'Mempool')
+    Transaction = apps.get_model('home', 'Transaction')
+    counts = dict(
+        Transaction.objects.filter(mempool__isnull=False)
+        .values('mempool').annotate(count=Count('txid')).values_list('mempool', 'count')
+    )
+    mempools = list(Mempool.objects.all())
+    for mempool in mempools:
+        mempool.transaction_count = counts.get(mempool.pk, 0)
+    Mempool.objects.bulk_update(mempools, ['transaction_count'], batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('home', '0011_block_archive'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='mempool',
+            name='user_name',
+            field=models.CharField(db_index=True, max_length=200),
+        ),
+        migrations.RunPython(backfill_transaction_counts, migrations.RunPython.noop),
+    ]
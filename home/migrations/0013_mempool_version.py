@@ -0,0 +1,23 @@
+# Generated by Django 4.2.30 on 2026-10-18 06:28
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('home', '0012_mempool_transaction_count'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='mempool',
+            name='modified',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='mempool',
+            name='version',
+            field=models.PositiveBigIntegerField(default=0),
+        ),
+    ]
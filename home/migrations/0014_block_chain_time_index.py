@@ -0,0 +1,17 @@
+# Generated by Django 4.2.30 on 2026-10-18 06:31
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('home', '0013_mempool_version'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='block',
+            index=models.Index(fields=['chain', 'transaction_timestamp'], name='block_chain_time_idx'),
+        ),
+    ]
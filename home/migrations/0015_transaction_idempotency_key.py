@@ -0,0 +1,22 @@
+# Generated by Django 4.2.30 on 2026-10-18 06:34
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('home', '0014_block_chain_time_index'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='transaction',
+            name='idempotency_key',
+            field=models.CharField(blank=True, max_length=64, null=True),
+        ),
+        migrations.AddConstraint(
+            model_name='transaction',
+            constraint=models.UniqueConstraint(fields=('sendAddr', 'idempotency_key'), name='unique_idempotency_key_per_sender'),
+        ),
+    ]
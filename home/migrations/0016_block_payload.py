@@ -0,0 +1,18 @@
+# Generated by Django 4.2.30 on 2026-10-18 06:42
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('home', '0015_transaction_idempotency_key'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='block',
+            name='payload',
+            field=models.BinaryField(blank=True, null=True),
+        ),
+    ]
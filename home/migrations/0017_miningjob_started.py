@@ -0,0 +1,18 @@
+# Generated by Django 4.2.30 on 2026-10-18 07:02
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('home', '0016_block_payload'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='miningjob',
+            name='started',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+    ]
@@ -0,0 +1,21 @@
+# Generated by Django 4.2.30 on 2026-10-18 07:23
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('home', '0017_miningjob_started'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='BlockMerkleTree',
+            fields=[
+                ('block', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='merkle_tree', serialize=False, to='home.block')),
+                ('levels', models.BinaryField()),
+            ],
+        ),
+    ]
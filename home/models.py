@@ -4,8 +4,11 @@ from django.utils import timezone
 
 class Mempool(models.Model):
     """Represents a mempool for pending transactions."""
-    user_name = models.CharField(max_length=200)
+    user_name = models.CharField(max_length=200, db_index=True)
     transaction_count = models.IntegerField(default=0)
+    # Bumped on every change of the pending transactions, for conditional GETs.
+    version = models.PositiveBigIntegerField(default=0)
+    modified = models.DateTimeField(null=True, blank=True)
 
     def __str__(self):
         return str('Mempool')
@@ -16,8 +19,27 @@ class Block(models.Model):
     blockid = models.AutoField(primary_key=True)
     transaction_count = models.IntegerField(default=0)
     transaction_timestamp = models.DateTimeField()
+    # No database constraint: the first block above the archive keeps pointing
+    # at its archived predecessor after the older rows are pruned.
     previous = models.OneToOneField(
-        'self', null=True, blank=True, related_name="next", on_delete=models.CASCADE)
+        'self', null=True, blank=True, related_name="next",
+        on_delete=models.DO_NOTHING, db_constraint=False)
+    chain = models.ForeignKey(
+        'Blockchain', null=True, blank=True, related_name="blocks", on_delete=models.CASCADE)
+    height = models.PositiveIntegerField(default=0)
+    merkle_root = models.CharField(max_length=64, blank=True, default='')
+    header_hash = models.CharField(max_length=64, blank=True, default='')
+    # zlib-compressed serialize_block output, written once at mining time
+    payload = models.BinaryField(null=True, blank=True, editable=False)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=['chain', 'height'], name='unique_block_height_per_chain'),
+        ]
+        indexes = [
+            models.Index(fields=['chain', 'transaction_timestamp'], name='block_chain_time_idx'),
+        ]
 
     def save(self, *args, **kwargs):
         self.transaction_timestamp = timezone.now()
@@ -38,6 +60,20 @@ class Transaction(models.Model):
         Block, on_delete=models.CASCADE, blank=True, null=True)
     mempool = models.ForeignKey(
         Mempool, on_delete=models.CASCADE, blank=True, null=True)
+    idempotency_key = models.CharField(max_length=64, blank=True, null=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=['sendAddr', 'idempotency_key'], name='unique_idempotency_key_per_sender'),
+        ]
+        indexes = [
+            models.Index(fields=['mempool', '-amount', 'txid'], name='tx_mempool_amount_idx'),
+            models.Index(fields=['mempool', 'transaction_timestamp', 'txid'], name='tx_mempool_age_idx'),
+            models.Index(fields=['mempool', 'sendAddr', 'transaction_timestamp'], name='tx_mempool_sender_idx'),
+            models.Index(fields=['sendAddr', '-txid'], name='tx_sender_history_idx'),
+            models.Index(fields=['receiveAddr', '-txid'], name='tx_receiver_history_idx'),
+        ]
 
     def save(self, *args, **kwargs):
         self.transaction_timestamp = timezone.now()
@@ -47,6 +83,19 @@ class Transaction(models.Model):
         return str(self.txid)
 
 
+class AccountBalance(models.Model):
+    """Represents the confirmed balance of an address, maintained at mining time."""
+    address = models.CharField(max_length=200, primary_key=True)
+    credits = models.BigIntegerField(default=0)
+    debits = models.BigIntegerField(default=0)
+    net = models.BigIntegerField(default=0)
+    last_block = models.ForeignKey(
+        Block, null=True, blank=True, related_name="+", on_delete=models.SET_NULL)
+
+    def __str__(self):
+        return self.address
+
+
 class Blockchain(models.Model):
     """Represents the main blockchain structure."""
     user = models.CharField(max_length=200)
@@ -54,6 +103,7 @@ class Blockchain(models.Model):
         Block, null=True, blank=True, related_name="init_chain", on_delete=models.CASCADE)
     latest = models.OneToOneField(
         Block, null=True, blank=True, related_name="end_chain", on_delete=models.CASCADE)
+    archived_height = models.PositiveIntegerField(null=True, blank=True)
 
     def __str__(self):
         return 'Main Chain'
@@ -73,3 +123,79 @@ class Miner(models.Model):
 
     def __str__(self):
         return self.user
+
+
+class LedgerEvent(models.Model):
+    """Represents an entry of the append-only ledger event feed."""
+    id = models.BigAutoField(primary_key=True)
+    kind = models.CharField(max_length=32)
+    payload = models.JSONField(default=dict)
+    created = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return '%s %s' % (self.id, self.kind)
+
+
+class MiningJob(models.Model):
+    """Represents a mining request queued for the background block assembler."""
+    PENDING = 'pending'
+    RUNNING = 'running'
+    DONE = 'done'
+    FAILED = 'failed'
+    STATUS_CHOICES = [
+        (PENDING, 'Pending'),
+        (RUNNING, 'Running'),
+        (DONE, 'Done'),
+        (FAILED, 'Failed'),
+    ]
+
+    mempool = models.ForeignKey(Mempool, related_name="mining_jobs", on_delete=models.CASCADE)
+    transaction_ids = models.JSONField(null=True, blank=True)
+    max_size = models.PositiveIntegerField(null=True, blank=True)
+    priority = models.CharField(max_length=16, blank=True, default='')
+    status = models.CharField(max_length=16, choices=STATUS_CHOICES, default=PENDING)
+    block = models.ForeignKey(
+        Block, null=True, blank=True, related_name="+", on_delete=models.SET_NULL)
+    error = models.TextField(blank=True, default='')
+    created = models.DateTimeField(auto_now_add=True)
+    started = models.DateTimeField(null=True, blank=True)
+    finished = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['status', 'mempool'], name='mining_job_status_idx'),
+        ]
+
+    def __str__(self):
+        return '%s %s' % (self.pk, self.status)
+
+
+class LedgerCheckpoint(models.Model):
+    """Represents a compressed snapshot of per-address state of a chain at a height."""
+    chain = models.ForeignKey(Blockchain, related_name="checkpoints", on_delete=models.CASCADE)
+    height = models.PositiveIntegerField()
+    block = models.ForeignKey(
+        Block, null=True, blank=True, related_name="+", on_delete=models.SET_NULL)
+    state = models.BinaryField()
+    address_count = models.PositiveIntegerField(default=0)
+    created = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=['chain', 'height'], name='unique_checkpoint_height_per_chain'),
+        ]
+
+    def __str__(self):
+        return '%s@%s' % (self.chain_id, self.height)
+
+
+class BlockMerkleTree(models.Model):
+    """Represents every level of a block's Merkle tree, stored at mining time."""
+    block = models.OneToOneField(
+        Block, primary_key=True, related_name="merkle_tree", on_delete=models.CASCADE)
+    # Packed 32-byte hashes, leaves first (core.merkle.encode_merkle_tree)
+    levels = models.BinaryField()
+
+    def __str__(self):
+        return '%s' % self.block_id
@@ -1,8 +1,60 @@
-from django.test import TestCase
-from django.contrib.auth.models import User
-from home.models import Block, Transaction, Mempool, Blockchain, Miner, Wallet
-from core.utils import create_pending_transaction, validate_mining_request, create_or_get_blockchain
+import asyncio
+import io
+import json
+import os
+import tempfile
+import zlib
+from datetime import datetime, timedelta
+from unittest import mock
 
+from asgiref.sync import async_to_sync, sync_to_async
+from django.contrib.auth.models import User
+from django.core.cache import cache, caches
+from django.core.management import call_command
+from django.db import connection, connections
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from home.models import (
+    Block, Transaction, Mempool, Blockchain, Miner, Wallet, AccountBalance, LedgerEvent,
+    MiningJob, BlockMerkleTree
+)
+from core import validation
+from core.archive import ChainArchive, archive_blocks
+from core.assembler import assemble_mempool, due_mempools, enqueue_mining, reclaim_stale_jobs
+from core.balances import get_balance, verify_balance_index
+from core.benchmark import run_benchmarks
+from core.checkpoints import get_checkpoint, reconstruct_state
+from core.directory import get_miner_directory, pick_miner
+from core.events import EventHub, events_since, format_sse, publish_event
+from core.export import export_ledger
+from core.history import get_address_history
+from core.idempotency import RotatingBloomFilter, idempotency_metrics, reset_key_filter
+from core.ledger import iter_global_ledger
+from core.merkle import block_header_hash, verify_merkle_proof
+from core.metrics import MetricsRegistry
+from core.payloads import decode_block_payload
+from core.routers import reset_replica_freshness
+from core.snapshots import extend_chain_snapshot, get_chain_snapshot, snapshot_key
+from core.utils import (
+    create_pending_transaction,
+    create_pending_transactions,
+    delete_pending_transaction,
+    validate_mining_request,
+    create_or_get_blockchain,
+    bulk_mine_transactions,
+    mine_transactions_to_block,
+    build_blockchain_list,
+    get_chain_blocks,
+    serialize_block,
+    get_latest_blocks,
+    build_block_template,
+    mine_next_block,
+    order_by_priority,
+    fair_round_robin,
+    expire_pending_transactions,
+    get_inclusion_proof
+)
 
 class TransactionTimestampTestCase(TestCase):
     """Test cases for transaction_timestamp functionality."""
@@ -53,3 +105,1360 @@ class BlockchainTestCase(TestCase):
         self.assertIsNotNone(blockchain.genesis)
         self.assertIsNotNone(blockchain.genesis.transaction_timestamp)
         self.assertEqual(blockchain.genesis.transaction_count, 0)
+
+
+class BulkMiningTestCase(TestCase):
+    """Test cases for set-based mining of mempool transactions into blocks."""
+    
+    def setUp(self):
+        self.user = User.objects.create_user(username='bulkminer', password='testpass')
+        self.mempool = Mempool.objects.create(user_name='bulkminer')
+        self.blockchain, _ = create_or_get_blockchain(self.user)
+    
+    def _pending(self, count):
+        return [
+            create_pending_transaction('alice', 'bob', 10, self.mempool).txid
+            for _ in range(count)
+        ]
+    
+    def test_mining_moves_selection_and_reports_skipped(self):
+        """Test that pending transactions are mined and missing or mined ids are skipped."""
+        first = self._pending(2)
+        mine_transactions_to_block(self.blockchain, first[:1])
+        
+        result = bulk_mine_transactions(self.blockchain, first + ['999', 'bad'])
+        self.assertEqual(result.mined_ids, first[1:])
+        self.assertEqual(sorted(map(str, result.skipped_ids)), sorted([str(first[0]), '999', 'bad']))
+        self.assertEqual(result.block.transaction_count, 1)
+        self.assertEqual(Block.objects.get(pk=result.block.pk).transaction_count, 1)
+        self.assertEqual(self.blockchain.latest, result.block)
+        self.assertFalse(Transaction.objects.filter(mempool=self.mempool).exists())
+    
+    def test_query_count_independent_of_block_size(self):
+        """Test that mining latency in queries stays flat as the block grows."""
+        counts = []
+        for size in (2, 50):
+            tx_ids = self._pending(size)
+            with CaptureQueriesContext(connection) as queries:
+                bulk_mine_transactions(self.blockchain, tx_ids)
+            counts.append(len(queries))
+        self.assertEqual(counts[0], counts[1])
+    
+    def test_stale_chain_instances_extend_the_current_tip(self):
+        """Test that miners holding stale chain objects still link blocks in order."""
+        first_miner = Blockchain.objects.get(pk=self.blockchain.pk)
+        second_miner = Blockchain.objects.get(pk=self.blockchain.pk)
+        tx_ids = self._pending(2)
+        
+        first = bulk_mine_transactions(first_miner, tx_ids)
+        second = bulk_mine_transactions(second_miner, tx_ids)
+        self.assertEqual(second.mined_ids, [])
+        self.assertEqual(sorted(second.skipped_ids), sorted(tx_ids))
+        self.assertEqual((first.block.height, second.block.height), (1, 2))
+        self.assertEqual(second.block.previous_id, first.block.pk)
+        self.assertEqual(Blockchain.objects.get(pk=self.blockchain.pk).latest_id, second.block.pk)
+    
+    def test_stale_chain_instances_extend_the_snapshot_of_the_real_predecessor(self):
+        """Test that a block mined past a stale tip extends the snapshot it was mined on."""
+        cache.clear()
+        first_miner = Blockchain.objects.get(pk=self.blockchain.pk)
+        second_miner = Blockchain.objects.get(pk=self.blockchain.pk)
+        get_chain_snapshot(self.blockchain)
+        
+        first = bulk_mine_transactions(first_miner, self._pending(1))
+        extend_chain_snapshot(first_miner, first.block)
+        second = bulk_mine_transactions(second_miner, self._pending(1))
+        extend_chain_snapshot(second_miner, second.block)
+        
+        self.blockchain.refresh_from_db()
+        cached = cache.get(snapshot_key(self.blockchain.pk, second.block.pk))
+        self.assertEqual([entry['height'] for entry in cached], [0, 1, 2])
+        self.assertEqual(get_chain_snapshot(self.blockchain), cached)
+    
+    def test_sqlite_connections_wait_for_the_write_lock(self):
+        """Test that SQLite connections are configured with a busy timeout."""
+        if connection.vendor != 'sqlite':
+            self.skipTest('SQLite only')
+        with connection.cursor() as cursor:
+            cursor.execute('PRAGMA busy_timeout')
+            self.assertEqual(cursor.fetchone()[0], 20000)
+
+
+class ChainReaderTestCase(TestCase):
+    """Test cases for block heights and range reads of the chain."""
+    
+    def setUp(self):
+        self.user = User.objects.create_user(username='reader', password='testpass')
+        self.mempool = Mempool.objects.create(user_name='reader')
+        self.blockchain, _ = create_or_get_blockchain(self.user)
+        for _ in range(5):
+            tx = create_pending_transaction('alice', 'bob', 5, self.mempool)
+            mine_transactions_to_block(self.blockchain, [tx.txid])
+    
+    def test_heights_follow_previous_links(self):
+        """Test that mined blocks are numbered consecutively from the genesis block."""
+        blocks = get_chain_blocks(self.blockchain)
+        self.assertEqual([block.height for block in blocks], list(range(6)))
+        for previous, block in zip(blocks, blocks[1:]):
+            self.assertEqual(block.previous_id, previous.blockid)
+    
+    def test_range_and_latest_reads_use_constant_queries(self):
+        """Test that range reads and tip paging prefetch transactions."""
+        with self.assertNumQueries(2):
+            blocks = get_chain_blocks(self.blockchain, start_height=2, end_height=4)
+            self.assertEqual([len(block.transaction_list) for block in blocks], [1, 1, 1])
+        with self.assertNumQueries(2):
+            latest = get_latest_blocks(self.blockchain, 2, before_height=5)
+        self.assertEqual([block.height for block in latest], [3, 4])
+        with self.assertNumQueries(2):
+            chain = build_blockchain_list(self.blockchain)
+        self.assertEqual(len(chain), 6)
+
+
+class BlockArchiveTestCase(TestCase):
+    """Test cases for archiving cold blocks into segment files."""
+    
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        settings_override = override_settings(LEDGER_ARCHIVE_DIR=directory.name)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        
+        self.user = User.objects.create_user(username='archivist', password='testpass')
+        self.mempool = Mempool.objects.create(user_name='archivist')
+        self.blockchain, _ = create_or_get_blockchain(self.user)
+        for amount in range(1, 7):
+            tx_ids = [
+                create_pending_transaction('alice', receiver, amount, self.mempool).txid
+                for receiver in ('bob', 'carol\u00e9')
+            ]
+            mine_transactions_to_block(self.blockchain, tx_ids)
+        self.chain = self._serialized()
+        self.export = ''.join(export_ledger([self.blockchain], 'jsonl'))
+    
+    def _serialized(self, **kwargs):
+        self.blockchain.refresh_from_db()
+        return [
+            serialize_block(block, transactions)
+            for block, transactions in build_blockchain_list(self.blockchain, **kwargs).items()
+        ]
+    
+    def test_archived_heights_are_served_transparently(self):
+        """Test that readers return the same chain after old rows are pruned."""
+        self.assertEqual(archive_blocks(self.blockchain, 4), 4)
+        self.assertEqual(sorted(Block.objects.values_list('height', flat=True)), [4, 5, 6])
+        self.assertEqual(Transaction.objects.count(), 6)
+        
+        self.assertEqual(self._serialized(), self.chain)
+        self.assertEqual(self._serialized(limit=3, before_height=5), self.chain[2:5])
+        self.assertEqual(''.join(export_ledger([self.blockchain], 'jsonl')), self.export)
+        self.assertEqual(verify_balance_index(), [])
+        self.assertEqual(reconstruct_state(self.blockchain, 3)['balances']['alice']['debits'], 12)
+        
+        block = mine_transactions_to_block(
+            self.blockchain, [create_pending_transaction('bob', 'alice', 1, self.mempool).txid])
+        self.assertEqual(block.height, 7)
+        self.assertEqual(self._serialized()[:7], self.chain)
+    
+    def test_archive_resumes_after_an_interrupted_run(self):
+        """Test that records past the committed boundary are rewritten, and the tip is kept."""
+        archive_blocks(self.blockchain, 2)
+        self.blockchain.refresh_from_db()
+        leftover = get_chain_blocks(self.blockchain, start_height=2, end_height=3)
+        ChainArchive(self.blockchain.pk).append(leftover)
+        
+        self.assertEqual(archive_blocks(self.blockchain, 100), 4)
+        self.assertEqual(list(Block.objects.values_list('height', flat=True)), [6])
+        self.assertEqual(len(ChainArchive(self.blockchain.pk)), 6)
+        self.assertEqual(self._serialized(), self.chain)
+    
+    def test_block_api_serves_archived_blocks(self):
+        """Test that the block API finds pruned blocks in the archive."""
+        archive_blocks(self.blockchain, 4)
+        self.client.force_login(self.user)
+        for block in self.chain[:4]:
+            self.assertEqual(self.client.get('/api/blocks/%d' % block['blockid']).json(), block)
+        self.assertEqual(self.client.get('/api/blocks/%d' % self.chain[4]['blockid']).json(), self.chain[4])
+        self.assertEqual(self.client.get('/api/blocks/999999').status_code, 404)
+
+
+class BalanceIndexTestCase(TestCase):
+    """Test cases for the incrementally maintained balance index."""
+    
+    def setUp(self):
+        self.user = User.objects.create_user(username='balances', password='testpass')
+        self.mempool = Mempool.objects.create(user_name='balances')
+        self.blockchain, _ = create_or_get_blockchain(self.user)
+    
+    def test_mining_updates_balances_once_per_address(self):
+        """Test that a mined block folds aggregated deltas into the index."""
+        tx_ids = [
+            create_pending_transaction('alice', 'bob', 30, self.mempool).txid,
+            create_pending_transaction('alice', 'carol', 20, self.mempool).txid,
+            create_pending_transaction('bob', 'alice', 5, self.mempool).txid,
+        ]
+        pending = create_pending_transaction('carol', 'alice', 99, self.mempool)
+        block = mine_transactions_to_block(self.blockchain, tx_ids)
+        
+        alice = get_balance('alice')
+        self.assertEqual((alice.credits, alice.debits, alice.net), (5, 50, -45))
+        self.assertEqual(alice.last_block, block)
+        self.assertEqual(get_balance('carol').net, 20)
+        self.assertEqual(get_balance('nobody').net, 0)
+        self.assertEqual(verify_balance_index(), [])
+        
+        mine_transactions_to_block(self.blockchain, [pending.txid])
+        self.assertEqual(get_balance('alice').net, 54)
+        self.assertEqual(verify_balance_index(), [])
+    
+    def test_consistency_checker_reports_drift(self):
+        """Test that the checker reports addresses whose index drifted."""
+        tx = create_pending_transaction('alice', 'bob', 10, self.mempool)
+        mine_transactions_to_block(self.blockchain, [tx.txid])
+        AccountBalance.objects.filter(pk='bob').update(credits=11, net=11)
+        
+        mismatches = verify_balance_index()
+        self.assertEqual(len(mismatches), 1)
+        self.assertEqual(mismatches[0]['address'], 'bob')
+        self.assertEqual(mismatches[0]['expected'], (10, 0, 10))
+
+
+@override_settings(LEDGER_OPENING_BALANCE=100)
+class BlockValidationTestCase(TestCase):
+    """Test cases for batch validation of block candidates."""
+    
+    def setUp(self):
+        self.user = User.objects.create_user(username='validator', password='testpass')
+        self.mempool = Mempool.objects.create(user_name='validator')
+        self.blockchain, _ = create_or_get_blockchain(self.user)
+        AccountBalance.objects.create(address='rich', credits=500, net=500)
+        self.candidate = [
+            (1, 'alice', 60), (2, 'bob', 0), (3, 'alice', 30), (4, 'rich', 550),
+            (5, 'alice', 20), (6, 'alice', 5), (7, 'bob', 100), (8, 'bob', 1),
+        ]
+        self.expected = (
+            [1, 3, 4, 7],
+            {2: 'invalid_amount', 5: 'insufficient_funds', 6: 'insufficient_funds',
+             8: 'insufficient_funds'}
+        )
+    
+    def test_running_spend_per_sender_with_and_without_numpy(self):
+        """Test that overdrafts reject a sender's later transactions on every path."""
+        self.assertEqual(validation.validate_block_candidate(self.candidate), self.expected)
+        with mock.patch.object(validation, 'numpy', None):
+            self.assertEqual(validation.validate_block_candidate(self.candidate), self.expected)
+    
+    @override_settings(LEDGER_VALIDATION_PARALLEL_THRESHOLD=1, LEDGER_VALIDATION_WORKERS=2)
+    def test_large_candidates_are_checked_in_chunks(self):
+        """Test that the process pool partitions by sender without changing the result."""
+        with mock.patch.object(validation, '_pool', None):
+            self.assertEqual(validation.validate_block_candidate(self.candidate), self.expected)
+    
+    def test_mining_drops_rejected_transactions(self):
+        """Test that mining claims accepted transactions and drops the rest."""
+        tx_ids = [
+            create_pending_transaction(sender, 'carol', amount, self.mempool).txid
+            for sender, amount in (('alice', 70), ('alice', 40), ('bob', -5), ('bob', 10))
+        ]
+        result = bulk_mine_transactions(self.blockchain, tx_ids)
+        self.assertEqual(result.mined_ids, [tx_ids[0], tx_ids[3]])
+        self.assertEqual(result.rejected, {
+            tx_ids[1]: 'insufficient_funds', tx_ids[2]: 'invalid_amount'})
+        self.assertEqual(result.skipped_ids, [])
+        self.assertFalse(Transaction.objects.filter(block__isnull=True).exists())
+    
+    def test_wallet_rejects_malformed_amounts(self):
+        """Test that the wallet only queues positive whole amounts."""
+        self.client.login(username='validator', password='testpass')
+        for amount in ('-3', '1.5', 'ten', '0'):
+            self.client.post('/wallet', {'miner': 'validator', 'reciever': 'bob', 'amount': amount})
+        self.assertFalse(Transaction.objects.exists())
+        self.client.post('/wallet', {'miner': 'validator', 'reciever': 'bob', 'amount': '7'})
+        self.assertEqual(Transaction.objects.get().amount, 7)
+
+
+class BlockPayloadTestCase(TestCase):
+    """Test cases for block payloads materialized at mining time."""
+    
+    def setUp(self):
+        self.user = User.objects.create_user(username='payloads', password='testpass')
+        self.mempool = Mempool.objects.create(user_name='payloads')
+        self.blockchain, _ = create_or_get_blockchain(self.user)
+        for amount in (1, 2):
+            mine_transactions_to_block(self.blockchain, [
+                create_pending_transaction('alice', receiver, amount, self.mempool).txid
+                for receiver in ('bob', 'carol')
+            ])
+        self.blockchain.refresh_from_db()
+        self.chain = [
+            serialize_block(block, transactions)
+            for block, transactions in build_blockchain_list(self.blockchain).items()
+        ]
+        self.client.login(username='payloads', password='testpass')
+    
+    def test_payload_matches_the_serialized_block(self):
+        """Test that every block, genesis included, stores its serialized form."""
+        payloads = Block.objects.order_by('height').values_list('payload', flat=True)
+        self.assertEqual([decode_block_payload(payload) for payload in payloads], self.chain)
+    
+    def test_block_api_reads_only_the_payload(self):
+        """Test that the block API serves the payload with one block query."""
+        blockid = self.chain[-1]['blockid']
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get('/api/blocks/%d' % blockid)
+        self.assertEqual(response.json(), self.chain[-1])
+        ledger_queries = [query['sql'] for query in queries if '"home_' in query['sql']]
+        self.assertEqual(len(ledger_queries), 1)
+        
+        response = self.client.get('/api/blocks/%d' % blockid, HTTP_ACCEPT_ENCODING='gzip, deflate')
+        self.assertEqual(response['Content-Encoding'], 'deflate')
+        self.assertEqual(json.loads(zlib.decompress(response.content)), self.chain[-1])
+        self.assertEqual(self.client.get('/api/blocks/999999').status_code, 404)
+    
+    def test_readers_fall_back_until_payloads_are_backfilled(self):
+        """Test that blocks without payloads are still served and get them from the command."""
+        Block.objects.update(payload=None)
+        export = ''.join(export_ledger([self.blockchain], 'jsonl'))
+        self.assertEqual(get_chain_snapshot(self.blockchain), self.chain)
+        self.assertEqual(self.client.get('/api/blocks/%d' % self.chain[1]['blockid']).json(), self.chain[1])
+        
+        output = io.StringIO()
+        call_command('backfill_block_payloads', batch_size=2, stdout=output)
+        self.assertIn('Stored payloads for 3 blocks.', output.getvalue())
+        self.assertFalse(Block.objects.filter(payload__isnull=True).exists())
+        self.assertEqual(''.join(export_ledger([self.blockchain], 'jsonl')), export)
+    
+    def test_backfill_counts_the_serialized_transactions(self):
+        """Test that blocks mined before transaction counts were stored get a correct payload."""
+        Block.objects.update(payload=None, transaction_count=0)
+        call_command('backfill_block_payloads', stdout=io.StringIO())
+        payloads = Block.objects.order_by('height').values_list('payload', flat=True)
+        self.assertEqual([decode_block_payload(payload) for payload in payloads], self.chain)
+        self.assertEqual(list(Block.objects.order_by('height').values_list('transaction_count', flat=True)), [0, 2, 2])
+
+
+class ChainSnapshotCacheTestCase(TestCase):
+    """Test cases for the tip-versioned chain snapshot cache."""
+    
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(username='snapshots', password='testpass')
+        self.mempool = Mempool.objects.create(user_name='snapshots')
+        self.blockchain, _ = create_or_get_blockchain(self.user)
+    
+    def _mine(self, blockchain):
+        tx = create_pending_transaction('alice', 'bob', 1, self.mempool)
+        block = mine_transactions_to_block(blockchain, [tx.txid])
+        extend_chain_snapshot(blockchain, block)
+        return block
+    
+    def test_mining_extends_cached_snapshot(self):
+        """Test that mining appends to the cached snapshot instead of rebuilding it."""
+        self.assertEqual(len(get_chain_snapshot(self.blockchain)), 1)
+        block = self._mine(self.blockchain)
+        
+        with self.assertNumQueries(0):
+            snapshot = get_chain_snapshot(self.blockchain)
+        self.assertEqual([entry['height'] for entry in snapshot], [0, 1])
+        self.assertEqual(snapshot[-1]['blockid'], block.blockid)
+        self.assertEqual(len(snapshot[-1]['transactions']), 1)
+        self.assertIsNone(cache.get(snapshot_key(self.blockchain.pk, block.previous_id)))
+    
+    @override_settings(LEDGER_CHAIN_CACHE_MAX_ENTRIES=1)
+    def test_snapshots_are_evicted_least_recently_used_first(self):
+        """Test that the cache keeps a bounded number of snapshots."""
+        other_user = User.objects.create_user(username='snapshots2', password='testpass')
+        other_chain, _ = create_or_get_blockchain(other_user)
+        get_chain_snapshot(self.blockchain)
+        get_chain_snapshot(other_chain)
+        
+        self.assertIsNone(cache.get(snapshot_key(self.blockchain.pk, self.blockchain.latest_id)))
+        self.assertIsNotNone(cache.get(snapshot_key(other_chain.pk, other_chain.latest_id)))
+
+
+class BlockFragmentCacheTestCase(TestCase):
+    """Test cases for cached block cards on the mined chain page."""
+    
+    def setUp(self):
+        cache.clear()
+        caches['fragments'].clear()
+        self.user = User.objects.create_user(username='fragments', password='testpass')
+        self.client.login(username='fragments', password='testpass')
+        self.mempool = Mempool.objects.create(user_name='fragments')
+        self.blockchain, _ = create_or_get_blockchain(self.user)
+        for _ in range(3):
+            self._mine()
+    
+    def _mine(self):
+        tx = create_pending_transaction('alice', 'bob', 1, self.mempool)
+        return mine_transactions_to_block(self.blockchain, [tx.txid])
+    
+    def _rendered_cards(self, response):
+        return [t.name for t in response.templates].count('block_card.html')
+    
+    def test_cards_are_rendered_once_per_block_and_version(self):
+        """Test that page views only render blocks without a cached card."""
+        first = self.client.get('/mined')
+        self.assertEqual(self._rendered_cards(first), 4)
+        second = self.client.get('/mined')
+        self.assertEqual(self._rendered_cards(second), 0)
+        self.assertEqual(first.content, second.content)
+        
+        block = self._mine()
+        response = self.client.get('/mined')
+        self.assertEqual(self._rendered_cards(response), 1)
+        self.assertContains(response, 'Block %s' % block.blockid)
+        with self.settings(LEDGER_BLOCK_FRAGMENT_VERSION=2):
+            self.assertEqual(self._rendered_cards(self.client.get('/mined')), 5)
+    
+    @override_settings(LEDGER_MINED_PAGE_SIZE=2)
+    def test_older_blocks_load_as_fragments(self):
+        """Test that older blocks are served as bare cards with the next page height."""
+        response = self.client.get('/mined?partial=1&before=2')
+        self.assertEqual(response['X-Older-Height'], '0')
+        self.assertNotContains(response, '<html')
+        self.assertEqual(response.content.decode().count('class="card"'), 2)
+
+
+class ConditionalGetTestCase(TestCase):
+    """Test cases for ETag and Last-Modified on chain and mempool views."""
+    
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(username='poller', password='testpass')
+        self.client.login(username='poller', password='testpass')
+        self.mempool = Mempool.objects.create(user_name='poller')
+        self.blockchain, _ = create_or_get_blockchain(self.user)
+        self.tx = create_pending_transaction('alice', 'bob', 1, self.mempool)
+    
+    def _assert_not_modified(self, url, etag):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        self.assertFalse([q for q in queries.captured_queries if 'home_transaction' in q['sql']])
+    
+    def test_chain_views_revalidate_on_the_tip(self):
+        """Test that chain polls return 304 until a block is mined."""
+        for url in ('/mined', '/api/chain'):
+            response = self.client.get(url)
+            self.assertTrue(response.has_header('Last-Modified'))
+            self._assert_not_modified(url, response['ETag'])
+        etag = response['ETag']
+        
+        mine_transactions_to_block(self.blockchain, [self.tx.txid])
+        response = self.client.get('/api/chain', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.json()['blocks']), 2)
+    
+    def test_mempool_views_revalidate_on_the_mempool_version(self):
+        """Test that mempool polls return 304 until the mempool changes."""
+        for url in ('/mining', '/api/mempool'):
+            response = self.client.get(url)
+            self._assert_not_modified(url, response['ETag'])
+        etag = response['ETag']
+        
+        delete_pending_transaction(self.tx.txid)
+        response = self.client.get('/api/mempool', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+
+
+class LedgerExportTestCase(TestCase):
+    """Test cases for the streaming JSONL and CSV ledger export."""
+    
+    def setUp(self):
+        self.user = User.objects.create_user(username='exporter', password='testpass')
+        self.mempool = Mempool.objects.create(user_name='exporter')
+        self.blockchain, _ = create_or_get_blockchain(self.user)
+        self.tx_ids = [
+            create_pending_transaction('alice', 'bob', amount, self.mempool).txid
+            for amount in (1, 2, 3)
+        ]
+        mine_transactions_to_block(self.blockchain, self.tx_ids[:2])
+        mine_transactions_to_block(self.blockchain, [])
+        mine_transactions_to_block(self.blockchain, self.tx_ids[2:])
+    
+    def test_jsonl_export_in_chain_order_with_resume(self):
+        """Test that JSONL records follow chain order and honour the start height."""
+        records = [json.loads(line) for line in export_ledger([self.blockchain], 'jsonl')]
+        self.assertEqual(
+            [(record['type'], record.get('height', record.get('txid'))) for record in records],
+            [('block', 0), ('block', 1), ('transaction', self.tx_ids[0]),
+             ('transaction', self.tx_ids[1]), ('block', 2), ('block', 3),
+             ('transaction', self.tx_ids[2])]
+        )
+        resumed = [json.loads(line) for line in export_ledger([self.blockchain], 'jsonl', 3)]
+        self.assertEqual([record['type'] for record in resumed], ['block', 'transaction'])
+    
+    def test_csv_export_streams_from_view(self):
+        """Test that the export view streams CSV with one row per transaction or empty block."""
+        self.client.login(username='exporter', password='testpass')
+        response = self.client.get('/export', {'format': 'csv'})
+        self.assertTrue(response.streaming)
+        rows = b''.join(response.streaming_content).decode().splitlines()
+        self.assertEqual(rows[0].split(',')[:3], ['chain', 'height', 'blockid'])
+        self.assertEqual([row.split(',')[1] for row in rows[1:]], ['0', '1', '1', '2', '3'])
+        self.assertEqual(self.client.get('/export', {'format': 'xml'}).status_code, 400)
+
+
+class GlobalLedgerTestCase(TestCase):
+    """Test cases for the merged cross-chain ledger stream."""
+    
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        settings_override = override_settings(LEDGER_ARCHIVE_DIR=directory.name)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        
+        self.chains = {}
+        for name in ('ledger-a', 'ledger-b', 'ledger-c'):
+            user = User.objects.create_user(username=name, password='testpass')
+            mempool = Mempool.objects.create(user_name=name)
+            self.chains[name] = (create_or_get_blockchain(user)[0], mempool)
+        self.blocks = []
+        for round_number in range(4):
+            for name, (blockchain, mempool) in self.chains.items():
+                tx_ids = [
+                    create_pending_transaction('alice', 'bob', amount, mempool).txid
+                    for amount in range(1, round_number + 2)
+                ]
+                self.blocks.append(mine_transactions_to_block(blockchain, tx_ids))
+    
+    def _keys(self, records):
+        return [(record['confirmed'], record['height'], record['txid']) for record in records]
+    
+    def test_chains_are_merged_by_confirmation_time(self):
+        """Test that all chains interleave in order, including archived blocks and short pages."""
+        archive_blocks(self.chains['ledger-b'][0], 3)
+        with self.settings(LEDGER_STREAM_BUFFER=1):
+            records = list(iter_global_ledger())
+        
+        self.assertEqual(len(records), Transaction.objects.filter(block__isnull=False).count() + 3)
+        self.assertEqual(self._keys(records), sorted(self._keys(records)))
+        self.assertEqual([record['chain'] for record in records[:3]], ['ledger-a', 'ledger-b', 'ledger-c'])
+        self.assertEqual(records[-1]['chain'], 'ledger-c')
+    
+    def test_cursors_together_hold_at_most_the_stream_buffer(self):
+        """Test that per-chain pages split LEDGER_STREAM_BUFFER, down to a single row."""
+        for buffer_size, page_size in ((7, 2), (2, 1)):
+            with self.settings(LEDGER_STREAM_BUFFER=buffer_size):
+                with CaptureQueriesContext(connection) as queries:
+                    records = list(iter_global_ledger())
+            limits = {
+                query['sql'].rsplit('LIMIT', 1)[1].split()[0]
+                for query in queries.captured_queries if 'LIMIT' in query['sql']
+            }
+            self.assertEqual(limits, {str(page_size)})
+            self.assertEqual(len(records), Transaction.objects.filter(block__isnull=False).count())
+    
+    def test_time_window_and_view(self):
+        """Test that since is inclusive, until exclusive and the view streams JSON lines."""
+        since, until = self.blocks[3].transaction_timestamp, self.blocks[6].transaction_timestamp
+        records = list(iter_global_ledger(since=since, until=until))
+        self.assertEqual({record['blockid'] for record in records},
+                         {block.blockid for block in self.blocks[3:6]})
+        
+        self.client.login(username='ledger-a', password='testpass')
+        response = self.client.get('/api/ledger', {'since': since.isoformat(), 'until': until.isoformat()})
+        self.assertTrue(response.streaming)
+        lines = b''.join(response.streaming_content).decode().splitlines()
+        self.assertEqual([json.loads(line) for line in lines], records)
+        self.assertEqual(self.client.get('/api/ledger', {'since': 'yesterday'}).status_code, 400)
+
+
+class BatchSubmissionTestCase(TestCase):
+    """Test cases for the JSON batch transaction submission endpoint."""
+    
+    def setUp(self):
+        self.user = User.objects.create_user(username='gateway', password='testpass')
+        self.client.login(username='gateway', password='testpass')
+        self.first = Mempool.objects.create(user_name='miner1')
+        self.second = Mempool.objects.create(user_name='miner2')
+    
+    def _post(self, payload):
+        return self.client.post(
+            '/api/transactions/batch', json.dumps(payload), content_type='application/json')
+    
+    def test_batch_is_bulk_inserted_per_mempool(self):
+        """Test that a valid batch is inserted and txids are returned in order."""
+        entries = [
+            {'receiver': 'bob', 'amount': 5, 'miner': 'miner1'},
+            {'receiver': 'carol', 'amount': '7', 'miner': 'miner2'},
+            {'receiver': 'dave', 'amount': 9, 'miner': 'miner1'},
+        ]
+        with CaptureQueriesContext(connection) as queries:
+            response = self._post({'transactions': entries})
+        self.assertEqual(response.status_code, 200)
+        inserts = [
+            query for query in queries
+            if query['sql'].startswith('INSERT INTO "home_transaction"')
+        ]
+        self.assertEqual(len(inserts), 2)
+        txids = response.json()['txids']
+        self.assertEqual(len(txids), 3)
+        created = Transaction.objects.in_bulk(txids)
+        self.assertEqual([created[txid].receiveAddr for txid in txids], ['bob', 'carol', 'dave'])
+        self.assertEqual(created[txids[1]].mempool, self.second)
+        self.assertTrue(all(tx.sendAddr == 'gateway' for tx in created.values()))
+    
+    def test_invalid_batch_is_rejected_as_a_whole(self):
+        """Test that one invalid entry rejects the batch and reports every error."""
+        response = self._post([
+            {'receiver': 'bob', 'amount': 5, 'miner': 'miner1'},
+            {'receiver': 'bob', 'amount': -1, 'miner': 'miner1'},
+            {'receiver': 'bob', 'amount': 1, 'miner': 'nobody'},
+        ])
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual([error['index'] for error in response.json()['errors']], [1, 2])
+        self.assertFalse(Transaction.objects.exists())
+    
+    def test_amounts_beyond_the_integer_column_are_rejected(self):
+        """Test that oversized amounts get a validation error instead of a database overflow."""
+        response = self._post([
+            {'receiver': 'bob', 'amount': 2 ** 31 - 1, 'miner': 'miner1'},
+            {'receiver': 'bob', 'amount': 10 ** 20, 'miner': 'miner1'},
+            {'receiver': 'bob', 'amount': str(2 ** 31), 'miner': 'miner1'},
+        ])
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual([error['index'] for error in response.json()['errors']], [1, 2])
+        
+        response = self.client.post(
+            '/wallet', {'miner': 'miner1', 'reciever': 'bob', 'amount': '99999999999999999999'})
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('positive whole amount', response.content.decode())
+        self.assertFalse(Transaction.objects.exists())
+
+
+class IdempotencyKeyTestCase(TestCase):
+    """Test cases for idempotent transaction submission."""
+    
+    def setUp(self):
+        reset_key_filter()
+        self.addCleanup(reset_key_filter)
+        self.user = User.objects.create_user(username='retrier', password='testpass')
+        self.client.login(username='retrier', password='testpass')
+        self.mempool = Mempool.objects.create(user_name='miner1')
+    
+    def _lookups(self):
+        return dict(
+            (labels['result'], value) for name, _, _, samples in idempotency_metrics()
+            if name == 'ledger_idempotency_lookups_total' for labels, value in samples
+        )
+    
+    def test_fresh_keys_skip_the_duplicate_query(self):
+        """Test that a new key is inserted without a lookup and a retry returns the original."""
+        with CaptureQueriesContext(connection) as queries:
+            first = create_pending_transaction('retrier', 'bob', 5, self.mempool, idempotency_key='k1')
+        self.assertFalse([query for query in queries if 'idempotency_key" IN' in query['sql']])
+        retry = create_pending_transaction('retrier', 'bob', 5, self.mempool, idempotency_key='k1')
+        other_sender = create_pending_transaction('alice', 'bob', 5, self.mempool, idempotency_key='k1')
+        
+        self.assertEqual(retry.txid, first.txid)
+        self.assertNotEqual(other_sender.txid, first.txid)
+        self.mempool.refresh_from_db()
+        self.assertEqual(self.mempool.transaction_count, 2)
+        self.assertEqual(self._lookups(), {'filter_miss': 2, 'duplicate': 1, 'false_positive': 0})
+    
+    def test_unique_constraint_catches_keys_the_filter_never_saw(self):
+        """Test that a retry reaching a fresh process is still deduplicated."""
+        first = create_pending_transaction('retrier', 'bob', 5, self.mempool, idempotency_key='k1')
+        reset_key_filter()
+        retry = create_pending_transaction('retrier', 'bob', 5, self.mempool, idempotency_key='k1')
+        self.assertEqual(retry.txid, first.txid)
+        
+        txids = create_pending_transactions(
+            'retrier', [('bob', 1, self.mempool), ('carol', 2, self.mempool)], ['k2', 'k1']).txids
+        self.assertEqual(txids[1], first.txid)
+        self.assertEqual(Transaction.objects.count(), 2)
+    
+    def test_batch_and_wallet_retries(self):
+        """Test that retried batches and resubmitted wallet forms create nothing new."""
+        entries = [
+            {'receiver': 'bob', 'amount': 5, 'miner': 'miner1', 'idempotency_key': 'a'},
+            {'receiver': 'bob', 'amount': 5, 'miner': 'miner1', 'idempotency_key': 'a'},
+            {'receiver': 'carol', 'amount': 7, 'miner': 'miner1'},
+        ]
+        post = lambda: self.client.post(
+            '/api/transactions/batch', json.dumps(entries), content_type='application/json')
+        txids = post().json()['txids']
+        self.assertEqual(txids[0], txids[1])
+        retried = post().json()['txids']
+        self.assertEqual(retried[:2], txids[:2])
+        self.assertEqual(Transaction.objects.count(), 3)
+        entries[2]['idempotency_key'] = 'x' * 65
+        self.assertEqual(post().status_code, 400)
+        
+        key = self.client.get('/wallet').context['idempotency_key']
+        form = {'miner': 'miner1', 'reciever': 'dave', 'amount': '3', 'idempotency_key': key}
+        self.client.post('/wallet', form)
+        self.client.post('/wallet', form)
+        self.assertEqual(Transaction.objects.filter(receiveAddr='dave').count(), 1)
+    
+    def test_filter_rotation_bounds_size_and_error_rate(self):
+        """Test that the filter keeps two generations and reports its false positive rate."""
+        key_filter = RotatingBloomFilter(100, 0.01)
+        for index in range(250):
+            key_filter.add('key-%d' % index)
+        self.assertEqual(key_filter.rotations, 2)
+        self.assertTrue(all('key-%d' % index in key_filter for index in range(100, 250)))
+        false_positives = sum('other-%d' % index in key_filter for index in range(10000))
+        self.assertLess(false_positives / 10000, 0.05)
+        self.assertLess(key_filter.false_positive_rate(), 0.02)
+        
+        body = self.client.get('/metrics').content.decode()
+        self.assertIn('ledger_idempotency_filter_target_false_positive_rate 0.001', body)
+        self.assertIn('ledger_idempotency_filter_bytes{generation="current"} ', body)
+
+
+class ReplicaRoutingTestCase(TransactionTestCase):
+    """
+    Test cases for routing ledger reads to a SQLite read replica.
+    
+    The replica is synced with SQLite's backup API, which waits for open write
+    transactions, so these tests commit.
+    """
+    
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        connections.settings['replica'] = connections.configure_settings({
+            'default': dict(connections.settings['default']),
+            'replica': {
+                'ENGINE': 'django.db.backends.sqlite3',
+                'NAME': os.path.join(directory.name, 'replica.sqlite3'),
+            },
+        })['replica']
+        self.addCleanup(connections.settings.pop, 'replica')
+        self.addCleanup(connections.__delitem__, 'replica')
+        self.addCleanup(connections['replica'].close)
+        settings_override = override_settings(LEDGER_READ_REPLICAS=['replica'])
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        reset_replica_freshness()
+        self.addCleanup(reset_replica_freshness)
+        
+        self.user = User.objects.create_user(username='reader', password='testpass')
+        self.mempool = Mempool.objects.create(user_name='reader')
+        self.blockchain, _ = create_or_get_blockchain(self.user)
+        mine_transactions_to_block(
+            self.blockchain, [create_pending_transaction('alice', 'bob', 1, self.mempool).txid])
+        call_command('sync_replica', stdout=io.StringIO())
+        self.client.login(username='reader', password='testpass')
+    
+    def _get(self, path):
+        with CaptureQueriesContext(connections['replica']) as replica_queries:
+            response = self.client.get(path)
+        return response, [query['sql'] for query in replica_queries]
+    
+    def test_reads_go_to_a_fresh_replica(self):
+        """Test that GET requests read the ledger from the replica."""
+        response, replica_queries = self._get('/api/chain')
+        self.assertEqual(len(response.json()['blocks']), 2)
+        self.assertTrue(any('"home_block"' in sql for sql in replica_queries))
+        self.assertEqual(Block.objects.using('replica').count(), 2)
+    
+    def test_stale_replica_and_writes_use_the_primary(self):
+        """Test the chain tip staleness guard and the pin after a write."""
+        mine_transactions_to_block(self.blockchain, [])
+        reset_replica_freshness()
+        response, replica_queries = self._get('/api/chain')
+        self.assertEqual(len(response.json()['blocks']), 3)
+        # Only the tip comparison touched the stale replica
+        self.assertEqual(len(replica_queries), 1)
+        
+        call_command('sync_replica', stdout=io.StringIO())
+        with CaptureQueriesContext(connections['replica']) as replica_queries:
+            response = self.client.post('/wallet', {'miner': 'reader', 'reciever': 'bob', 'amount': '2'})
+        self.assertEqual(len(replica_queries), 0)
+        self.assertIn('ledger_primary', response.cookies)
+        
+        response, replica_queries = self._get('/api/mempool')
+        self.assertEqual(len(response.json()['transactions']), 1)
+        self.assertEqual(replica_queries, [])
+
+
+class MinerDirectoryTestCase(TestCase):
+    """Test cases for mempool load tracking and the miner directory."""
+    
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(username='router', password='testpass')
+        self.client.login(username='router', password='testpass')
+        self.busy = Mempool.objects.create(user_name='busy')
+        self.idle = Mempool.objects.create(user_name='idle')
+        self.blockchain, _ = create_or_get_blockchain(self.user)
+    
+    def _counts(self):
+        return list(Mempool.objects.order_by('pk').values_list('transaction_count', flat=True))
+    
+    def test_transaction_count_follows_adds_deletes_and_mining(self):
+        """Test that the pending count is maintained by every mempool change."""
+        first = create_pending_transaction('alice', 'bob', 5, self.busy)
+        txids = create_pending_transactions('alice', [('bob', 1, self.busy), ('bob', 2, self.idle)]).txids
+        overdraft = create_pending_transaction('carol', 'bob', 10 ** 9, self.idle)
+        self.assertEqual(self._counts(), [2, 2])
+        
+        delete_pending_transaction(first.txid)
+        self.assertEqual(self._counts(), [1, 2])
+        bulk_mine_transactions(self.blockchain, txids + [overdraft.txid])
+        self.assertEqual(self._counts(), [0, 0])
+    
+    def test_concurrently_claimed_candidates_are_not_counted_twice(self):
+        """Test that mining only decrements the mempools of the rows it claimed or dropped."""
+        txids = create_pending_transactions('alice', [('bob', 1, self.busy), ('bob', 2, self.idle)]).txids
+        overdraft = create_pending_transaction('carol', 'bob', 10 ** 9, self.idle)
+        other_chain, _ = create_or_get_blockchain(User.objects.create_user(username='rival'))
+        
+        claimed = []
+        
+        def claim_first(*args, **kwargs):
+            # Another miner takes a candidate after it was read
+            if not claimed:
+                claimed.append(txids[0])
+                bulk_mine_transactions(other_chain, claimed)
+            return validation.validate_block_candidate(*args, **kwargs)
+        
+        with mock.patch('core.utils.validate_block_candidate', side_effect=claim_first):
+            bulk_mine_transactions(self.blockchain, txids + [overdraft.txid])
+        self.assertEqual(self._counts(), [0, 0])
+    
+    def test_directory_is_cached_and_routes_to_the_less_loaded_miner(self):
+        """Test that pick for me avoids the busy miner without querying every time."""
+        create_pending_transactions('alice', [('bob', 1, self.busy)] * 3)
+        self.assertEqual(get_miner_directory(), [('idle', self.idle.pk, 0), ('busy', self.busy.pk, 3)])
+        with self.assertNumQueries(0):
+            self.assertEqual(pick_miner(), 'idle')
+        
+        response = self.client.get('/wallet')
+        self.assertEqual(response.context['miners'], ['idle', 'busy'])
+        self.client.post('/wallet', {'miner': 'auto', 'reciever': 'bob', 'amount': '4'})
+        self.assertEqual(Transaction.objects.get(amount=4).mempool, self.idle)
+
+
+@override_settings(LEDGER_MEMPOOL_CAPACITY=3)
+class BoundedMempoolTestCase(TestCase):
+    """Test cases for mempool capacity limits and TTL expiry."""
+    
+    def setUp(self):
+        self.user = User.objects.create_user(username='spammer', password='testpass')
+        self.mempool = Mempool.objects.create(user_name='miner1')
+    
+    def _pending(self):
+        self.mempool.refresh_from_db()
+        self.assertEqual(self.mempool.transaction_count, Transaction.objects.filter(mempool=self.mempool).count())
+        return sorted(Transaction.objects.filter(mempool=self.mempool).values_list('amount', flat=True))
+    
+    def test_inserts_below_capacity_skip_eviction(self):
+        """Test that an insert into a mempool with room reads its count once and evicts nothing."""
+        create_pending_transaction('alice', 'bob', 5, self.mempool)
+        with CaptureQueriesContext(connection) as queries:
+            create_pending_transaction('alice', 'bob', 6, self.mempool)
+        mempool_reads = [query['sql'] for query in queries if query['sql'].startswith('SELECT')]
+        self.assertEqual(len(mempool_reads), 1)
+        self.assertEqual(self._pending(), [5, 6])
+    
+    def test_lowest_priority_is_evicted_on_insert(self):
+        """Test that an overflowing insert evicts the smallest amount and reports it."""
+        for amount in (5, 1, 7):
+            self.assertEqual(create_pending_transaction('alice', 'bob', amount, self.mempool).evicted, [])
+        low = Transaction.objects.get(amount=1)
+        transaction = create_pending_transaction('carol', 'bob', 4, self.mempool)
+        self.assertEqual(transaction.evicted, [low.txid])
+        self.assertEqual(self._pending(), [4, 5, 7])
+        event = LedgerEvent.objects.filter(payload__reason='evicted').get()
+        self.assertEqual(event.payload['senders'], {str(low.txid): 'alice'})
+        
+        self.client.login(username='spammer', password='testpass')
+        response = self.client.post('/api/transactions/batch', json.dumps([
+            {'receiver': 'bob', 'amount': 2, 'miner': 'miner1'},
+            {'receiver': 'bob', 'amount': 9, 'miner': 'miner1'},
+        ]), content_type='application/json').json()
+        self.assertEqual(response['evicted'], [response['txids'][0], transaction.txid])
+        self.assertEqual(self._pending(), [5, 7, 9])
+        
+        response = self.client.post('/wallet', {'miner': 'miner1', 'reciever': 'bob', 'amount': '1'})
+        self.assertIn('your transaction was evicted', response.content.decode())
+        self.assertEqual(self._pending(), [5, 7, 9])
+    
+    @override_settings(LEDGER_MEMPOOL_EVICTION='oldest')
+    def test_oldest_first_eviction(self):
+        """Test the oldest first eviction policy."""
+        first = create_pending_transaction('alice', 'bob', 9, self.mempool)
+        create_pending_transactions('alice', [('bob', 1, self.mempool)] * 3)
+        self.assertFalse(Transaction.objects.filter(pk=first.pk).exists())
+        self.assertEqual(self._pending(), [1, 1, 1])
+    
+    def test_expired_transactions_are_swept_in_batches(self):
+        """Test that stale pending transactions are deleted a batch at a time."""
+        other = Mempool.objects.create(user_name='miner2')
+        create_pending_transactions('alice', [('bob', 1, self.mempool)] * 3 + [('bob', 2, other)] * 2)
+        Transaction.objects.filter(amount=1).update(
+            transaction_timestamp=timezone.now() - timedelta(hours=2))
+        
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual(expire_pending_transactions(ttl=3600, batch_size=2), 3)
+        deletes = [query for query in queries if query['sql'].startswith('DELETE FROM "home_transaction"')]
+        self.assertEqual(len(deletes), 2)
+        self.assertEqual(self._pending(), [])
+        other.refresh_from_db()
+        self.assertEqual(other.transaction_count, 2)
+        self.assertEqual(
+            sum(len(event.payload['txids']) for event in LedgerEvent.objects.filter(payload__reason='expired')), 3)
+        
+        output = io.StringIO()
+        call_command('expire_mempools', ttl=1, stdout=output)
+        self.assertIn('Expired 0 pending transactions.', output.getvalue())
+
+
+class BlockTemplateTestCase(TestCase):
+    """Test cases for priority ordered block templates."""
+    
+    def setUp(self):
+        self.user = User.objects.create_user(username='templater', password='testpass')
+        self.mempool = Mempool.objects.create(user_name='templater')
+        self.blockchain, _ = create_or_get_blockchain(self.user)
+        self.txids = [
+            create_pending_transaction(sender, 'bob', amount, self.mempool).txid
+            for sender, amount in (('alice', 5), ('alice', 50), ('alice', 20), ('carol', 1))
+        ]
+    
+    def test_template_orders_by_priority_up_to_max_size(self):
+        """Test amount, age and sender fairness orderings."""
+        a5, a50, a20, c1 = self.txids
+        self.assertEqual(build_block_template(self.mempool, 3, 'amount'), [a50, a20, a5])
+        self.assertEqual(build_block_template(self.mempool, 3, 'age'), [a5, a50, a20])
+        self.assertEqual(build_block_template(self.mempool, 3, 'fairness'), [a5, c1, a50])
+    
+    def test_fairness_interleaves_senders_round_by_round(self):
+        """Test that each round takes every sender's next oldest transaction, oldest first."""
+        a5, a50, a20, c1 = self.txids
+        d = [create_pending_transaction('dave', 'bob', amount, self.mempool).txid for amount in (1, 2)]
+        c2 = create_pending_transaction('carol', 'bob', 2, self.mempool).txid
+        self.assertEqual(
+            build_block_template(self.mempool, 10, 'fairness'), [a5, c1, d[0], a50, d[1], c2, a20])
+        self.assertEqual(build_block_template(self.mempool, 4, 'fairness'), [a5, c1, d[0], a50])
+        with mock.patch('core.utils.FAIRNESS_MAX_DEPTH', 1):
+            pending = Transaction.objects.filter(mempool=self.mempool)
+            self.assertEqual(
+                [tx.txid for tx in fair_round_robin(pending)], [a5, c1, d[0], a50, d[1], c2, a20])
+    
+    def test_orderings_are_served_by_an_index(self):
+        """Test that no template sorts the mempool or queries once per sender."""
+        pending = Transaction.objects.filter(mempool=self.mempool)
+        for priority in ('amount', 'age'):
+            plan = order_by_priority(pending, priority)[:10].explain()
+            self.assertNotIn('TEMP B-TREE', plan)
+        create_pending_transactions('erin', [('bob', amount, self.mempool) for amount in range(1, 40)])
+        for index in range(60):
+            create_pending_transaction('sender%d' % index, 'bob', 1, self.mempool)
+        
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual(len(build_block_template(self.mempool, 50, 'fairness')), 50)
+        self.assertEqual(len(queries), 1)
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual(len(build_block_template(self.mempool, 100, 'fairness')), 100)
+        self.assertEqual(len(queries), 3)
+        for query in queries:
+            with connection.cursor() as cursor:
+                cursor.execute('EXPLAIN QUERY PLAN ' + query['sql'])
+                plan = ' '.join(str(row) for row in cursor.fetchall())
+            self.assertNotIn('TEMP B-TREE', plan)
+    
+    def test_mine_next_block_takes_the_template(self):
+        """Test that the next full block is mined in one call."""
+        result = mine_next_block(self.blockchain, self.mempool, max_size=2, priority='amount')
+        self.assertEqual(result.mined_ids, sorted(self.txids[1:3]))
+        self.assertEqual(Transaction.objects.filter(mempool=self.mempool).count(), 2)
+        mine_next_block(self.blockchain, self.mempool)
+        self.assertIsNone(mine_next_block(self.blockchain, self.mempool))
+
+
+class BlockAssemblerTestCase(TestCase):
+    """Test cases for background block assembly."""
+    
+    def setUp(self):
+        self.user = User.objects.create_user(username='assembler', password='testpass')
+        self.client.login(username='assembler', password='testpass')
+        self.mempool = Mempool.objects.create(user_name='assembler')
+        self.idle = Mempool.objects.create(user_name='idle')
+        self.txids = [
+            create_pending_transaction('alice', 'bob', amount, self.mempool).txid
+            for amount in (5, 50, 20)
+        ]
+    
+    def test_due_mempools_by_threshold_interval_and_jobs(self):
+        """Test that only mempools with enough work or waiting too long are due."""
+        self.assertEqual(due_mempools({}, threshold=10, interval=30, now=100), [self.mempool.pk])
+        recently = {self.mempool.pk: 90}
+        self.assertEqual(due_mempools(recently, threshold=10, interval=30, now=100), [])
+        self.assertEqual(due_mempools(recently, threshold=3, interval=30, now=100), [self.mempool.pk])
+        enqueue_mining(self.idle)
+        self.assertEqual(due_mempools(recently, threshold=10, interval=30, now=100), [self.idle.pk])
+    
+    def test_stale_running_jobs_are_queued_again(self):
+        """Test that jobs claimed by an assembler that never finished them run again."""
+        stale = enqueue_mining(self.mempool, transaction_ids=self.txids[:1])
+        fresh = enqueue_mining(self.mempool, transaction_ids=self.txids[1:2])
+        MiningJob.objects.filter(pk=stale.pk).update(
+            status=MiningJob.RUNNING, started=timezone.now() - timedelta(hours=1))
+        MiningJob.objects.filter(pk=fresh.pk).update(status=MiningJob.RUNNING, started=timezone.now())
+        
+        self.assertEqual(reclaim_stale_jobs(timeout=600), 1)
+        self.assertEqual(MiningJob.objects.get(pk=fresh.pk).status, MiningJob.RUNNING)
+        blocks = assemble_mempool(self.mempool.pk)
+        self.assertEqual(MiningJob.objects.get(pk=stale.pk).block, blocks[0])
+        self.assertEqual(Transaction.objects.get(pk=self.txids[0]).block, blocks[0])
+    
+    @override_settings(LEDGER_BACKGROUND_MINING=True)
+    def test_views_enqueue_and_assembler_mines(self):
+        """Test that web requests only queue jobs that the assembler then runs."""
+        response = self.client.post('/api/blocks/next', {'max_size': 1})
+        self.assertEqual(response.status_code, 202)
+        self.client.post('/mining_block', {'%dbox' % self.txids[0]: 'on'})
+        self.assertFalse(Block.objects.exists())
+        self.assertEqual(MiningJob.objects.filter(status=MiningJob.PENDING).count(), 2)
+        
+        blocks = assemble_mempool(self.mempool.pk)
+        self.assertEqual([block.height for block in blocks], [1, 2])
+        self.assertEqual(Transaction.objects.get(pk=self.txids[1]).block, blocks[0])
+        self.assertEqual(Transaction.objects.get(pk=self.txids[0]).block, blocks[1])
+        job = self.client.get('/api/jobs/%s' % response.json()['job']).json()
+        self.assertEqual((job['status'], job['blockid']), ('done', blocks[0].blockid))
+        
+        self.assertEqual([len(b.transaction_set.all()) for b in assemble_mempool(self.mempool.pk)], [1])
+        self.assertEqual(assemble_mempool(self.mempool.pk), [])
+
+
+class MerkleProofTestCase(TestCase):
+    """Test cases for block header hashes and Merkle inclusion proofs."""
+    
+    def setUp(self):
+        self.user = User.objects.create_user(username='auditor', password='testpass')
+        self.mempool = Mempool.objects.create(user_name='auditor')
+        self.blockchain, _ = create_or_get_blockchain(self.user)
+        self.txids = [
+            create_pending_transaction('alice', 'bob', amount, self.mempool).txid
+            for amount in range(1, 8)
+        ]
+        self.block = mine_transactions_to_block(self.blockchain, self.txids)
+    
+    def test_header_hash_links_to_previous_block(self):
+        """Test that the header hash commits to the previous header and the Merkle root."""
+        block = Block.objects.get(pk=self.block.pk)
+        genesis = Block.objects.get(pk=block.previous_id)
+        self.assertEqual(len(block.merkle_root), 64)
+        self.assertEqual(block.header_hash, block_header_hash(
+            genesis.header_hash, block.merkle_root, block.height, block.transaction_timestamp))
+    
+    def test_every_transaction_has_a_logarithmic_proof(self):
+        """Test that each proof verifies against the block's Merkle root."""
+        for txid in self.txids:
+            proof = get_inclusion_proof(txid)
+            self.assertLessEqual(len(proof['proof']), 3)
+            self.assertTrue(verify_merkle_proof(proof['leaf'], proof['proof'], proof['merkle_root']))
+        tampered = get_inclusion_proof(self.txids[0])
+        self.assertFalse(verify_merkle_proof(
+            tampered['leaf'], tampered['proof'][1:], tampered['merkle_root']))
+    
+    def test_proof_endpoint(self):
+        """Test that the proof endpoint returns proofs for mined transactions only."""
+        self.client.login(username='auditor', password='testpass')
+        response = self.client.get('/api/proof/%d' % self.txids[3])
+        self.assertEqual(response.json()['blockid'], self.block.blockid)
+        pending = create_pending_transaction('alice', 'bob', 1, self.mempool)
+        self.assertEqual(self.client.get('/api/proof/%d' % pending.txid).status_code, 404)
+    
+    def test_proofs_are_read_from_the_stored_tree(self):
+        """Test that a proof slices the tree stored at mining time instead of re-hashing the block."""
+        self.assertTrue(BlockMerkleTree.objects.filter(block=self.block).exists())
+        with mock.patch('core.utils.transaction_leaf') as transaction_leaf:
+            with CaptureQueriesContext(connection) as queries:
+                proof = get_inclusion_proof(self.txids[6])
+        transaction_leaf.assert_not_called()
+        self.assertEqual(len(queries), 4)
+        self.assertTrue(verify_merkle_proof(proof['leaf'], proof['proof'], proof['merkle_root']))
+    
+    def test_header_hash_can_be_recomputed_from_a_proof(self):
+        """Test that a proof carries the previous header hash and timestamp of its block."""
+        self.client.login(username='auditor', password='testpass')
+        proof = self.client.get('/api/proof/%d' % self.txids[2]).json()
+        self.assertEqual(proof['header_hash'], block_header_hash(
+            proof['previous_header_hash'], proof['merkle_root'], proof['height'],
+            datetime.fromisoformat(proof['transaction_timestamp'])))
+    
+    def test_blocks_without_a_stored_tree_are_rehashed_and_backfilled(self):
+        """Test that proofs fall back to the transaction rows until the tree is backfilled."""
+        expected = [get_inclusion_proof(txid) for txid in self.txids]
+        BlockMerkleTree.objects.all().delete()
+        self.assertEqual([get_inclusion_proof(txid) for txid in self.txids], expected)
+        
+        output = io.StringIO()
+        call_command('backfill_block_payloads', stdout=output)
+        self.assertIn('Stored Merkle trees for 1 blocks.', output.getvalue())
+        self.assertEqual([get_inclusion_proof(txid) for txid in self.txids], expected)
+
+
+class LedgerEventFeedTestCase(TestCase):
+    """Test cases for the ledger event feed behind the server-sent event stream."""
+    
+    def setUp(self):
+        self.user = User.objects.create_user(username='subscriber', password='testpass')
+        self.mempool = Mempool.objects.create(user_name='subscriber')
+        self.blockchain, _ = create_or_get_blockchain(self.user)
+    
+    def test_mempool_and_block_changes_are_published(self):
+        """Test that additions, deletions and mined blocks append events."""
+        kept = create_pending_transaction('alice', 'bob', 1, self.mempool)
+        dropped = create_pending_transaction('alice', 'bob', 2, self.mempool)
+        self.client.login(username='subscriber', password='testpass')
+        self.client.get('/delete/%d' % dropped.txid)
+        block = mine_transactions_to_block(self.blockchain, [kept.txid])
+        
+        events = events_since(0)
+        self.assertEqual(
+            [event.kind for event in events],
+            ['mempool_add', 'mempool_add', 'mempool_remove', 'mempool_remove', 'block']
+        )
+        self.assertEqual(events[2].payload['txids'], [dropped.txid])
+        self.assertEqual(events[4].payload['blockid'], block.blockid)
+        self.assertTrue(format_sse(events[4]).startswith('id: %d\nevent: block\n' % events[4].id))
+    
+    def test_subscriber_resumes_from_last_event_id(self):
+        """Test that a subscriber replays the events after its last seen id."""
+        first = create_pending_transaction('alice', 'bob', 1, self.mempool)
+        create_pending_transaction('alice', 'bob', 2, self.mempool)
+        last_seen = LedgerEvent.objects.get(payload__transactions__0__txid=first.txid).id
+        
+        async def replay():
+            stream = EventHub().subscribe(last_event_id=last_seen)
+            event = await stream.__anext__()
+            await stream.aclose()
+            return event
+        
+        event = async_to_sync(replay)()
+        self.assertEqual(event.kind, 'mempool_add')
+        self.assertGreater(event.id, last_seen)
+    
+    @override_settings(LEDGER_EVENT_RETENTION=2)
+    def test_assembler_prunes_the_feed_by_default(self):
+        """Test that the block assembler keeps only the configured number of events."""
+        for index in range(5):
+            publish_event('block', {'index': index})
+        call_command('run_block_assembler', once=True, stdout=io.StringIO())
+        self.assertEqual(
+            [event.payload['index'] for event in LedgerEvent.objects.order_by('id')], [3, 4])
+    
+    @override_settings(LEDGER_EVENT_POLL_INTERVAL=0.01, LEDGER_EVENT_KEEPALIVE=0.1)
+    def test_resuming_subscriber_gets_events_committed_during_its_backlog(self):
+        """Test that an event written right after the backlog read is still delivered."""
+        create_pending_transaction('alice', 'bob', 1, self.mempool)
+        last_seen = LedgerEvent.objects.get().id
+        
+        published = []
+        
+        def backlog_then_publish(last_id, *args, **kwargs):
+            events = events_since(last_id, *args, **kwargs)
+            if not published:
+                published.append(create_pending_transaction('alice', 'bob', 2, self.mempool))
+            return events
+        
+        async def resume():
+            stream = EventHub().subscribe(last_event_id=last_seen)
+            try:
+                for _ in range(50):
+                    event = await stream.__anext__()
+                    if event is not None:
+                        return event
+            finally:
+                await stream.aclose()
+        
+        with mock.patch('core.events.events_since', side_effect=backlog_then_publish):
+            event = async_to_sync(resume)()
+        self.assertIsNotNone(event)
+        self.assertEqual(event.payload['transactions'][0]['amount'], 2)
+    
+    @override_settings(LEDGER_EVENT_POLL_INTERVAL=0.01, LEDGER_EVENT_KEEPALIVE=0.1)
+    def test_resubscribing_while_the_poller_stops_gets_live_events(self):
+        """Test that a subscriber replacing the last one in the same loop turn is polled for."""
+        hub = EventHub()
+        
+        async def publish_later():
+            await asyncio.sleep(0.3)
+            await sync_to_async(create_pending_transaction)('alice', 'bob', 1, self.mempool)
+        
+        async def resubscribe():
+            first = hub.subscribe()
+            self.assertIsNone(await first.__anext__())
+            publisher = asyncio.ensure_future(publish_later())
+            # Closing the last subscriber cancels the poller, and the next
+            # subscriber arrives before the loop lets the poller finish.
+            await first.aclose()
+            second = hub.subscribe()
+            try:
+                for _ in range(50):
+                    event = await second.__anext__()
+                    if event is not None:
+                        return event
+            finally:
+                await second.aclose()
+                await publisher
+        
+        event = async_to_sync(resubscribe)()
+        self.assertIsNotNone(event)
+        self.assertEqual(event.kind, 'mempool_add')
+
+
+class AddressHistoryTestCase(TestCase):
+    """Test cases for keyset paginated address history."""
+    
+    def setUp(self):
+        self.user = User.objects.create_user(username='historian', password='testpass')
+        self.mempool = Mempool.objects.create(user_name='historian')
+        self.blockchain, _ = create_or_get_blockchain(self.user)
+        self.txids = [
+            create_pending_transaction(sender, receiver, 1, self.mempool).txid
+            for sender, receiver in (
+                ('alice', 'bob'), ('carol', 'alice'), ('bob', 'carol'),
+                ('alice', 'alice'), ('dave', 'alice'),
+            )
+        ]
+        mine_transactions_to_block(self.blockchain, self.txids[:2])
+    
+    def test_pages_cover_sent_and_received_newest_first(self):
+        """Test that cursors walk the whole history without gaps or duplicates."""
+        expected = [self.txids[4], self.txids[3], self.txids[1], self.txids[0]]
+        seen = []
+        cursor = None
+        while True:
+            page = get_address_history('alice', cursor=cursor and int(cursor), limit=2)
+            seen.extend(tx['txid'] for tx in page['transactions'])
+            cursor = page['next_cursor']
+            if cursor is None:
+                break
+        self.assertEqual(seen, expected)
+        
+        first = get_address_history('alice', limit=4)['transactions']
+        self.assertEqual([tx['status'] for tx in first], ['pending', 'pending', 'confirmed', 'confirmed'])
+        self.assertEqual(first[2]['direction'], 'received')
+    
+    def test_history_reads_use_the_address_indexes(self):
+        """Test that each side of the history is served by an index without sorting."""
+        for field in ('sendAddr', 'receiveAddr'):
+            plan = Transaction.objects.filter(
+                **{field: 'alice', 'txid__lt': 100}).order_by('-txid')[:51].explain()
+            self.assertIn('history_idx', plan)
+            self.assertNotIn('TEMP B-TREE', plan)
+
+
+@override_settings(LEDGER_CHECKPOINT_INTERVAL=2)
+class LedgerCheckpointTestCase(TestCase):
+    """Test cases for periodic state checkpoints and reconstruction."""
+    
+    def setUp(self):
+        self.user = User.objects.create_user(username='checkpointer', password='testpass')
+        self.client.login(username='checkpointer', password='testpass')
+        self.mempool = Mempool.objects.create(user_name='checkpointer')
+        self.blockchain, _ = create_or_get_blockchain(self.user)
+        for amount in range(1, 6):
+            tx = create_pending_transaction('alice', 'bob', amount, self.mempool)
+            mine_transactions_to_block(self.blockchain, [tx.txid])
+    
+    def test_mining_stores_checkpoints_every_interval(self):
+        """Test that checkpoints land on multiples of the interval."""
+        self.assertEqual(
+            list(self.blockchain.checkpoints.order_by('height').values_list('height', flat=True)),
+            [2, 4])
+        self.assertEqual(get_checkpoint(self.blockchain, 3).height, 2)
+        self.assertIsNone(get_checkpoint(self.blockchain, 1))
+    
+    def test_reconstruction_replays_only_blocks_after_the_checkpoint(self):
+        """Test that reconstructed state matches a replay from the genesis block."""
+        state = reconstruct_state(self.blockchain, 3)
+        self.assertEqual((state['checkpoint_height'], state['replayed_blocks']), (2, 1))
+        self.assertEqual(state['balances']['alice'], {'credits': 0, 'debits': 6, 'net': -6})
+        self.assertEqual(state['balances']['bob']['net'], 6)
+        
+        expected = {height: reconstruct_state(self.blockchain, height)['balances'] for height in range(6)}
+        self.blockchain.checkpoints.all().delete()
+        for height in range(6):
+            self.assertEqual(reconstruct_state(self.blockchain, height)['balances'], expected[height])
+        
+        call_command('create_checkpoints', interval=2, stdout=io.StringIO())
+        self.assertEqual(self.blockchain.checkpoints.count(), 2)
+        self.assertEqual(self.client.get('/api/state/5').json()['balances']['bob']['credits'], 15)
+        self.assertEqual(self.client.get('/api/state/6').status_code, 404)
+
+
+class BenchmarkSuiteTestCase(TestCase):
+    """Test cases for the core.utils micro-benchmarks."""
+    
+    def test_benchmarks_report_time_queries_and_memory(self):
+        """Test that every hot path is measured at the requested scale."""
+        results = run_benchmarks(users=2, mempool_size=4, chain_length=2, transactions_per_block=2)
+        self.assertEqual([result['operation'] for result in results], [
+            'create_pending_transaction', 'create_pending_transactions',
+            'get_mempool_transactions', 'mine_transactions_to_block', 'build_blockchain_list',
+        ])
+        for result in results:
+            self.assertGreaterEqual(result['wall_time'], 0)
+            self.assertGreater(result['queries'], 0)
+            self.assertGreater(result['peak_memory'], 0)
+        self.assertEqual(results[-1]['scale']['blocks'], 3)
+        json.dumps(results)
+    
+    @override_settings(LEDGER_MEMPOOL_CAPACITY=2)
+    def test_benchmarks_ignore_the_mempool_capacity(self):
+        """Test that mempools are filled to the requested size when a capacity is configured."""
+        run_benchmarks(users=2, mempool_size=4, chain_length=1, transactions_per_block=2)
+        self.assertFalse(LedgerEvent.objects.filter(payload__reason='evicted').exists())
+
+
+class MetricsTestCase(TestCase):
+    """Test cases for request instrumentation and the metrics endpoint."""
+    
+    def setUp(self):
+        self.user = User.objects.create_user(username='observer', password='testpass')
+        self.mempool = Mempool.objects.create(user_name='observer')
+        create_or_get_blockchain(self.user)
+        create_pending_transaction('alice', 'bob', 1, self.mempool)
+    
+    def test_metrics_endpoint_reports_views_and_ledger_gauges(self):
+        """Test that views are recorded per URL name next to the ledger gauges."""
+        self.client.login(username='observer', password='testpass')
+        self.client.get('/mining')
+        body = self.client.get('/metrics').content.decode()
+        self.assertIn('ledger_request_duration_seconds_count{view="mining"} ', body)
+        self.assertIn('ledger_requests_total{status="2xx",view="mining"} ', body)
+        self.assertIn('ledger_mempool_depth{miner="observer"} 1', body)
+        self.assertIn('ledger_chain_height{chain="observer"} 0', body)
+    
+    def test_histogram_buckets_are_cumulative(self):
+        """Test the exposition of latency buckets and SQL counters."""
+        registry = MetricsRegistry()
+        registry.observe_request('wallet', 200, 0.02, 3, 0.001)
+        registry.observe_request('wallet', 500, 3.0, 5, 0.002)
+        body = registry.render()
+        self.assertIn('ledger_request_duration_seconds_bucket{view="wallet",le="0.025"} 1', body)
+        self.assertIn('ledger_request_duration_seconds_bucket{view="wallet",le="5.0"} 2', body)
+        self.assertIn('ledger_request_sql_queries_total{view="wallet"} 8', body)
+        self.assertIn('ledger_requests_total{status="5xx",view="wallet"} 1', body)
+    
+    @override_settings(LEDGER_METRICS_TOKEN='secret')
+    def test_metrics_token(self):
+        """Test that a configured token protects the endpoint."""
+        self.assertEqual(self.client.get('/metrics').status_code, 401)
+        response = self.client.get('/metrics', HTTP_AUTHORIZATION='Bearer secret')
+        self.assertEqual(response.status_code, 200)
+    
+    def test_metrics_without_token_only_serve_internal_clients(self):
+        """Test that the endpoint is closed to remote clients unless a token or DEBUG opens it."""
+        self.assertEqual(self.client.get('/metrics').status_code, 200)
+        self.assertEqual(self.client.get('/metrics', REMOTE_ADDR='203.0.113.7').status_code, 403)
+        with self.settings(DEBUG=True):
+            self.assertEqual(self.client.get('/metrics', REMOTE_ADDR='203.0.113.7').status_code, 200)
+        with self.settings(LEDGER_METRICS_TOKEN='secret'):
+            response = self.client.get(
+                '/metrics', REMOTE_ADDR='203.0.113.7', HTTP_AUTHORIZATION='Bearer secret')
+            self.assertEqual(response.status_code, 200)
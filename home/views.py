@@ -1,17 +1,49 @@
+import json
+import uuid
+import zlib
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.http import HttpResponse, HttpResponseBadRequest, JsonResponse, StreamingHttpResponse
 from django.shortcuts import redirect, render
+from django.views.decorators.http import condition, require_POST
+from django.contrib import messages
 from django.contrib.auth.decorators import login_required
-from home.models import Block, Transaction, Mempool, Blockchain, Miner, Wallet
+from django.utils import timezone
+from django.utils.cache import patch_vary_headers
+from django.utils.dateparse import parse_datetime
+from home.models import Block, Transaction, Mempool, Blockchain, Miner, Wallet, MiningJob
 from core.utils import (
     create_pending_transaction,
     validate_mining_request,
     create_or_get_blockchain,
     mine_transactions_to_block,
-    build_blockchain_list,
-    get_mempool_transactions
+    get_mempool_transactions,
+    validate_transaction_batch,
+    create_pending_transactions,
+    mine_next_block,
+    get_inclusion_proof,
+    delete_pending_transaction,
+    parse_transaction_amount,
+    serialize_transaction,
+    get_latest_serialized_blocks,
+    serialize_mined_block,
+    serialize_block,
+    MEMPOOL_PRIORITIES
 )
-
-# Global storage for blockchain visualization
-chain_list = {}
+from core.snapshots import extend_chain_snapshot, get_chain_snapshot
+from core.fragments import render_block_cards
+from core.assembler import enqueue_mining
+from core.idempotency import is_valid_idempotency_key
+from core.directory import AUTO_MINER, get_miner_directory, invalidate_miner_directory, pick_miner
+from core.export import EXPORT_CONTENT_TYPES, EXPORT_FORMATS, export_ledger
+from core.events import format_sse, get_event_hub
+from core.history import HISTORY_PAGE_SIZE, get_address_history
+from core.ledger import iter_global_ledger
+from core.checkpoints import reconstruct_state
+from core.payloads import load_block_payload
+from core.archive import find_archived_block
+from core.metrics import registry
 
 
 @login_required
@@ -22,30 +54,56 @@ def home(request):
 @login_required
 def wallet(request):
     if request.method == 'POST':
-        print(request.POST)
-        mempool = Mempool.objects.filter(user_name=request.POST['miner'])[0]
-        pending_transaction = create_pending_transaction(
-            sender=request.user,
-            receiver=request.POST['recieve'],
-            amount=request.POST['amount'],
-            mempool=mempool
-        )
+        miner = request.POST.get('miner')
+        if miner == AUTO_MINER:
+            miner = pick_miner()
+        mempool = Mempool.objects.filter(user_name=miner).order_by('pk').first()
+        amount = parse_transaction_amount(request.POST.get('amount'))
+        receiver = request.POST.get('reciever', '').strip()
+        # Each rendered form carries its own key, so resubmitting it is a no-op
+        idempotency_key = request.POST.get('idempotency_key')
+        if not is_valid_idempotency_key(idempotency_key):
+            idempotency_key = None
+        if mempool is None or amount is None or not receiver:
+            messages.error(request, 'Choose a miner, a receiver and a positive whole amount.')
+        else:
+            pending_transaction = create_pending_transaction(
+                sender=request.user,
+                receiver=receiver,
+                amount=amount,
+                mempool=mempool,
+                idempotency_key=idempotency_key
+            )
+            if pending_transaction.txid in pending_transaction.evicted:
+                messages.error(request, 'The mempool of %s is full; your transaction was evicted.' % miner)
         
-    if (len(Miner.objects.filter()) > 5):
-        miners = Miner.objects.filter()[0:4]
-    else:
-        miners = Miner.objects.filter()[0:]
-    my_dict = {'miners': miners}
+    miners = [
+        user_name for user_name, _, _ in
+        get_miner_directory()[:settings.LEDGER_DIRECTORY_LISTED]
+    ]
+    my_dict = {'miners': miners, 'auto_miner': AUTO_MINER, 'idempotency_key': uuid.uuid4().hex}
     return render(request, 'wallet.html', context=my_dict)
 
 
 @login_required
 def mining_block(request):
     if request.method == 'POST':
+        if request.POST.get('next_block') == 'yes':
+            mempool = Mempool.objects.filter(user_name=request.user.username).first()
+            if mempool is None:
+                return redirect('mining')
+            if settings.LEDGER_BACKGROUND_MINING:
+                enqueue_mining(mempool)
+                return redirect('mining')
+            blockchain, is_new = create_or_get_blockchain(request.user)
+            result = mine_next_block(blockchain, mempool)
+            if result is None:
+                return redirect('mining')
+            extend_chain_snapshot(blockchain, result.block)
+            return redirect('/mined')
+        
         if not validate_mining_request(request.POST):
             return redirect('mining')
-            
-        blockchain, is_new = create_or_get_blockchain(request.user)
         
         # Extract selected transaction IDs from POST data
         selected_transaction_ids = []
@@ -53,12 +111,19 @@ def mining_block(request):
             if key[-3:] == 'box':
                 selected_transaction_ids.append(key[0:-3])
         
+        # Leave the mining to the background assembler if it is enabled
+        mempool = Mempool.objects.filter(user_name=request.user.username).first()
+        if settings.LEDGER_BACKGROUND_MINING and mempool is not None:
+            enqueue_mining(mempool, transaction_ids=selected_transaction_ids)
+            return redirect('mining')
+        
+        blockchain, is_new = create_or_get_blockchain(request.user)
+        
         # Mine transactions into new block
         new_block = mine_transactions_to_block(blockchain, selected_transaction_ids)
         
-        # Build blockchain visualization data
-        global chain_list
-        chain_list = build_blockchain_list(blockchain)
+        # Append the new block to the cached chain snapshot
+        extend_chain_snapshot(blockchain, new_block)
         
         return redirect('/mined')
 
@@ -72,7 +137,48 @@ def mine(request):
     return redirect('mining')
 
 
+def _chain_tip(request):
+    # Shared by the ETag and Last-Modified functions of one request.
+    if not hasattr(request, '_ledger_chain_tip'):
+        request._ledger_chain_tip = Blockchain.objects.filter(user=request.user).order_by(
+            'pk').values_list('pk', 'latest', 'latest__transaction_timestamp').first()
+    return request._ledger_chain_tip
+
+
+def _chain_etag(request, *args, **kwargs):
+    tip = _chain_tip(request)
+    if tip is None:
+        return 'chain-none'
+    return 'chain-%s-%s-%s' % (tip[0], tip[1], settings.LEDGER_BLOCK_FRAGMENT_VERSION)
+
+
+def _chain_last_modified(request, *args, **kwargs):
+    tip = _chain_tip(request)
+    return tip[2] if tip is not None else None
+
+
+def _mempool_state(request):
+    if not hasattr(request, '_ledger_mempool_state'):
+        request._ledger_mempool_state = Mempool.objects.filter(
+            user_name=request.user.username).order_by('pk').values_list(
+            'pk', 'version', 'modified').first()
+    return request._ledger_mempool_state
+
+
+def _mempool_etag(request, *args, **kwargs):
+    state = _mempool_state(request)
+    if state is None:
+        return 'mempool-none'
+    return 'mempool-%s-%s' % (state[0], state[1])
+
+
+def _mempool_last_modified(request, *args, **kwargs):
+    state = _mempool_state(request)
+    return state[2] if state is not None else None
+
+
 @login_required
+@condition(etag_func=_mempool_etag, last_modified_func=_mempool_last_modified)
 def mining(request):
     if request.method == 'POST':
         if (request.POST.get('option', 'off') == 'yes'):
@@ -80,6 +186,7 @@ def mining(request):
             mempool = Mempool(user_name=request.user.username)
             miner.save()
             mempool.save()
+            invalidate_miner_directory()
             return render(request, 'mining.html')
         elif (request.POST.get('option', 'off') == 'no'):
             return render(request, 'mine.html')
@@ -89,14 +196,281 @@ def mining(request):
         return render(request, 'mining.html', context=my_dict)
 
 
+def _chain_page(request):
+    blockchain = Blockchain.objects.filter(user=request.user).order_by('pk').first()
+    before_height = request.GET.get('before')
+    if blockchain is None:
+        return []
+    if before_height is not None and before_height.isdigit():
+        return get_latest_serialized_blocks(
+            blockchain, settings.LEDGER_MINED_PAGE_SIZE, before_height=int(before_height))
+    return get_chain_snapshot(blockchain)
+
+
 @login_required
+@condition(etag_func=_chain_etag, last_modified_func=_chain_last_modified)
 def mined(request):
-    my_dict = {'chain': chain_list}
+    chain = _chain_page(request)
+    oldest_height = chain[0]['height'] if chain else 0
+    cards = render_block_cards(chain)
+    if request.GET.get('partial') == '1':
+        # Older blocks requested by the page's "Older blocks" button
+        response = HttpResponse(''.join(cards))
+        response['X-Older-Height'] = oldest_height
+        return response
+    my_dict = {'chain': chain, 'cards': cards, 'older_height': oldest_height}
     return render(request, 'mined.html', context=my_dict)
 
 
+@login_required
+@condition(etag_func=_chain_etag, last_modified_func=_chain_last_modified)
+def chain_blocks(request):
+    chain = _chain_page(request)
+    return JsonResponse({
+        'blocks': chain,
+        'older_height': chain[0]['height'] if chain else 0,
+    })
+
+
 @login_required
 def deleteTransaction(request, pk):
-    transaction = Transaction.objects.get(pk=pk)
-    transaction.delete()
+    delete_pending_transaction(pk)
     return redirect('mining')
+
+
+@login_required
+def export(request):
+    export_format = request.GET.get('format', 'jsonl')
+    from_height = request.GET.get('from_height', '0')
+    if export_format not in EXPORT_FORMATS or not from_height.isdigit():
+        return HttpResponseBadRequest('Expected format=jsonl|csv and a numeric from_height.')
+    
+    blockchains = Blockchain.objects.filter(user=request.user).order_by('pk')
+    response = StreamingHttpResponse(
+        export_ledger(blockchains, export_format, int(from_height)),
+        content_type=EXPORT_CONTENT_TYPES[export_format]
+    )
+    response['Content-Disposition'] = 'attachment; filename="ledger.%s"' % export_format
+    return response
+
+
+@login_required
+@require_POST
+def submit_transactions(request):
+    try:
+        payload = json.loads(request.body)
+    except ValueError:
+        return JsonResponse({'error': 'Request body must be JSON.'}, status=400)
+    entries = payload.get('transactions') if isinstance(payload, dict) else payload
+    if not isinstance(entries, list) or not entries:
+        return JsonResponse({'error': 'Expected a non-empty list of transactions.'}, status=400)
+    if len(entries) > settings.LEDGER_MAX_TRANSACTION_BATCH:
+        return JsonResponse(
+            {'error': 'At most %d transactions per batch.' % settings.LEDGER_MAX_TRANSACTION_BATCH},
+            status=400
+        )
+    
+    valid, errors = validate_transaction_batch(entries)
+    if errors:
+        return JsonResponse({'errors': errors}, status=400)
+    idempotency_keys = [entry.get('idempotency_key') for entry in entries]
+    result = create_pending_transactions(request.user, valid, idempotency_keys)
+    return JsonResponse({'count': len(result.txids), 'txids': result.txids, 'evicted': result.evicted})
+
+
+def _priority_arguments(params):
+    priority = params.get('priority') or None
+    max_size = params.get('max_size') or None
+    if priority is not None and priority not in MEMPOOL_PRIORITIES:
+        return None
+    if max_size is not None:
+        if not str(max_size).isdigit() or not 0 < int(max_size) <= settings.LEDGER_MAX_BLOCK_SIZE:
+            return None
+        max_size = int(max_size)
+    return priority, max_size
+
+
+@login_required
+@condition(etag_func=_mempool_etag, last_modified_func=_mempool_last_modified)
+def mempool_transactions(request):
+    arguments = _priority_arguments(request.GET)
+    if arguments is None:
+        return JsonResponse({'error': 'Invalid priority or max_size.'}, status=400)
+    priority, max_size = arguments
+    transactions = get_mempool_transactions(
+        request.user.username,
+        priority=priority,
+        limit=max_size or settings.LEDGER_MAX_BLOCK_SIZE
+    )
+    return JsonResponse({
+        'priority': priority or settings.LEDGER_MEMPOOL_PRIORITY,
+        'transactions': [serialize_transaction(tx) for tx in transactions],
+    })
+
+
+@login_required
+@require_POST
+def mine_next(request):
+    arguments = _priority_arguments(request.POST)
+    if arguments is None:
+        return JsonResponse({'error': 'Invalid priority or max_size.'}, status=400)
+    priority, max_size = arguments
+    mempool = Mempool.objects.filter(user_name=request.user.username).first()
+    if mempool is None:
+        return JsonResponse({'error': 'You are not a miner.'}, status=400)
+    
+    if settings.LEDGER_BACKGROUND_MINING:
+        job = enqueue_mining(mempool, max_size=max_size, priority=priority)
+        return JsonResponse(_serialize_job(job), status=202)
+    
+    blockchain, is_new = create_or_get_blockchain(request.user)
+    result = mine_next_block(blockchain, mempool, max_size=max_size, priority=priority)
+    if result is None:
+        return JsonResponse({'error': 'The mempool is empty.'}, status=409)
+    extend_chain_snapshot(blockchain, result.block)
+    return JsonResponse({
+        'blockid': result.block.blockid,
+        'height': result.block.height,
+        'mined_ids': result.mined_ids,
+        'skipped_ids': result.skipped_ids,
+        'rejected': {str(txid): reason for txid, reason in result.rejected.items()},
+    })
+
+
+def _serialize_job(job):
+    return {
+        'job': job.pk,
+        'status': job.status,
+        'blockid': job.block_id,
+        'error': job.error,
+    }
+
+
+@login_required
+def mining_job(request, job_id):
+    job = MiningJob.objects.filter(
+        pk=job_id, mempool__user_name=request.user.username).first()
+    if job is None:
+        return JsonResponse({'error': 'Unknown mining job.'}, status=404)
+    return JsonResponse(_serialize_job(job))
+
+
+@login_required
+def block_payload(request, blockid):
+    try:
+        payload = load_block_payload(blockid)
+    except Block.DoesNotExist:
+        block = find_archived_block(blockid)
+        if block is None:
+            return JsonResponse({'error': 'Unknown block.'}, status=404)
+        block.transaction_count = len(block.transaction_list)
+        return JsonResponse(serialize_block(block, block.transaction_list))
+    if payload is None:
+        return JsonResponse(serialize_mined_block(Block.objects.get(pk=blockid)))
+    if 'deflate' in request.headers.get('Accept-Encoding', ''):
+        # The stored payload already is a zlib (HTTP deflate) stream
+        response = HttpResponse(payload, content_type='application/json')
+        response['Content-Encoding'] = 'deflate'
+    else:
+        response = HttpResponse(zlib.decompress(payload), content_type='application/json')
+    patch_vary_headers(response, ['Accept-Encoding'])
+    return response
+
+
+@login_required
+def inclusion_proof(request, txid):
+    proof = get_inclusion_proof(txid)
+    if proof is None:
+        return JsonResponse({'error': 'Transaction is not in a block.'}, status=404)
+    return JsonResponse(proof)
+
+
+async def event_stream(request):
+    is_authenticated = await sync_to_async(lambda: request.user.is_authenticated)()
+    if not is_authenticated:
+        return JsonResponse({'error': 'Authentication required.'}, status=401)
+    last_event_id = request.headers.get('Last-Event-ID') or request.GET.get('last_event_id')
+    last_event_id = int(last_event_id) if last_event_id and last_event_id.isdigit() else None
+    
+    async def messages():
+        async for event in get_event_hub().subscribe(last_event_id):
+            yield format_sse(event)
+    
+    response = StreamingHttpResponse(messages(), content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    response['X-Accel-Buffering'] = 'no'
+    return response
+
+
+@login_required
+def address_history(request, address):
+    cursor = request.GET.get('cursor')
+    limit = request.GET.get('limit', str(HISTORY_PAGE_SIZE))
+    if (cursor is not None and not cursor.isdigit()) or not limit.isdigit():
+        return JsonResponse({'error': 'Invalid cursor or limit.'}, status=400)
+    history = get_address_history(
+        address,
+        cursor=int(cursor) if cursor is not None else None,
+        limit=int(limit)
+    )
+    return JsonResponse(history)
+
+
+def _parse_window_bound(value):
+    moment = parse_datetime(value)
+    if moment is not None and timezone.is_naive(moment):
+        moment = timezone.make_aware(moment)
+    return moment
+
+
+@login_required
+def global_ledger(request):
+    bounds = {}
+    for name in ('since', 'until'):
+        value = request.GET.get(name)
+        if value:
+            bounds[name] = _parse_window_bound(value)
+            if bounds[name] is None:
+                return HttpResponseBadRequest('Expected ISO 8601 since and until timestamps.')
+    records = iter_global_ledger(**bounds)
+    return StreamingHttpResponse(
+        (json.dumps(record) + '\n' for record in records),
+        content_type=EXPORT_CONTENT_TYPES['jsonl']
+    )
+
+
+@login_required
+def ledger_state(request, height):
+    blockchain = Blockchain.objects.filter(user=request.user).select_related('latest').first()
+    if blockchain is None:
+        return JsonResponse({'error': 'You have no blockchain.'}, status=404)
+    if height > blockchain.latest.height:
+        return JsonResponse(
+            {'error': 'The chain is only %d blocks high.' % blockchain.latest.height}, status=404)
+    return JsonResponse(reconstruct_state(blockchain, height))
+
+
+@login_required
+def checkpoints(request):
+    blockchain = Blockchain.objects.filter(user=request.user).first()
+    if blockchain is None:
+        return JsonResponse({'error': 'You have no blockchain.'}, status=404)
+    return JsonResponse({
+        'interval': settings.LEDGER_CHECKPOINT_INTERVAL,
+        'checkpoints': [
+            {'height': height, 'blockid': blockid, 'address_count': address_count}
+            for height, blockid, address_count in blockchain.checkpoints.order_by('height')
+            .values_list('height', 'block', 'address_count')
+        ],
+    })
+
+
+def metrics(request):
+    token = settings.LEDGER_METRICS_TOKEN
+    if token:
+        if request.headers.get('Authorization') != 'Bearer %s' % token:
+            return HttpResponse(status=401)
+    elif not settings.DEBUG and request.META.get('REMOTE_ADDR') not in settings.INTERNAL_IPS:
+        # Without a token only local scrapers may read the metrics.
+        return HttpResponse(status=403)
+    return HttpResponse(registry.render(), content_type='text/plain; version=0.0.4; charset=utf-8')